@@ -0,0 +1,49 @@
+"""
+circle_corner的微基准测试：对比每次重新绘制蒙版和使用缓存蒙版的耗时
+
+在仓库根目录运行：python benchmarks/bench_corner.py
+"""
+import timeit
+
+from PIL import Image, ImageDraw
+
+from bench_thumbnail import load_render
+
+CASES = (
+    ("9图九宫格缩略图", (330, 330), 9),
+    ("2图缩略图", (502, 502), 2),
+    ("单图", (1020, 1360), 1),
+)
+REPEAT = 50
+
+
+def legacy_circle_corner(img: Image.Image, radii: int) -> Image.Image:
+    """
+    旧实现：每次都重新绘制圆形并逐角粘贴生成蒙版
+    """
+    circle = Image.new('L', (radii * 2, radii * 2), 0)
+    draw = ImageDraw.Draw(circle)
+    draw.ellipse((0, 0, radii * 2, radii * 2), fill=255)
+    img = img.convert("RGBA")
+    w, h = img.size
+    alpha = Image.new("L", img.size, 255)
+    alpha.paste(circle.crop((0, 0, radii, radii)), (0, 0))
+    alpha.paste(circle.crop((radii, 0, radii * 2, radii)), (w - radii, 0))
+    alpha.paste(circle.crop((radii, radii, radii * 2, radii * 2)), (w - radii, h - radii))
+    alpha.paste(circle.crop((0, radii, radii, radii * 2)), (0, h - radii))
+    img.putalpha(alpha)
+    return img
+
+
+def main():
+    render = load_render()
+    print(f"{'case':<12} {'legacy(ms)':>11} {'cached(ms)':>11}")
+    for name, size, count in CASES:
+        imgs = [Image.new("RGB", size, (i * 20, 120, 200)) for i in range(count)]
+        legacy = timeit.timeit(lambda: [legacy_circle_corner(img, 10) for img in imgs], number=REPEAT)
+        cached = timeit.timeit(lambda: [render.circle_corner(img, 10) for img in imgs], number=REPEAT)
+        print(f"{name:<12} {legacy / REPEAT * 1000:>11.2f} {cached / REPEAT * 1000:>11.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+处理队列的内存占用基准测试：对比改动前（Mail带__dict__并常驻图片bytes、ParsedObject为pydantic模型）
+和当前（带__slots__的Mail只保存媒体缓存中的图片摘要、带__slots__的ParsedObject）排队N条4图内容后的常驻内存
+
+在仓库根目录运行（需要安装nonebot2等插件依赖）：python benchmarks/bench_mail_memory.py [--items 200]
+每种实现在新启动（spawn）的子进程中运行，报告创建前后VmRSS的差值。
+"""
+import argparse
+import asyncio
+import importlib
+import multiprocessing
+import sys
+import tempfile
+import types
+from pathlib import Path
+
+from bench_thumbnail import make_jpeg
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+PLUGIN_PATH = REPO_ROOT / "src" / "plugins" / "hxzxhelper"
+IMAGES_PER_ITEM = 4
+IMAGE_SIZE = (1280, 960)
+
+
+def current_rss() -> int:
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) * 1024
+    raise RuntimeError("无法读取VmRSS，该基准测试只支持Linux")
+
+
+def load_legacy():
+    """
+    改动前的数据结构，作为对照
+    """
+    from pydantic import BaseModel
+    from typing import List, Optional
+
+    class Mail(object):
+        def __init__(self):
+            self.no = 0
+            self.raw_text = ""
+            self.images = []
+            self.translation = ""
+            self.time = ""
+            self.stat = 0
+            self.type = ""
+            self.group_id = 0
+            self.send_at = 0.0
+            self.pictures = None
+            self.pictures_key = ""
+
+        async def set_images(self, images):
+            self.images = list(images)
+
+    class ParsedObject(BaseModel):
+        text: str
+        images_url: List[str]
+        timestamp: Optional[str]
+        source_id: Optional[str]
+
+    return Mail, ParsedObject
+
+
+def load_current(data_dir: str):
+    """
+    按包路径加载插件的model模块，不执行插件包的__init__（不注册事件响应器和定时任务）
+    """
+    import nonebot
+    nonebot.init(data_dir=data_dir, media_mode="file")
+    sys.path.insert(0, str(REPO_ROOT))  # model按src.plugins._hxzxlib导入渲染模块
+    package = types.ModuleType("hxzxhelper")
+    package.__path__ = [str(PLUGIN_PATH)]
+    sys.modules["hxzxhelper"] = package
+    model = importlib.import_module("hxzxhelper.model")
+    return model.Mail, model.ParsedObject
+
+
+def _run(impl: str, items: int, queue):
+    with tempfile.TemporaryDirectory() as data_dir:
+        Mail, ParsedObject = load_legacy() if impl == "legacy" else load_current(data_dir)
+        base = current_rss()
+        queued = []
+        for i in range(items):
+            po = ParsedObject(text=f"时间：2021年8月5日 12:{i % 60:02d}\n" + "今日はありがとうございました。" * 20,
+                              images_url=[f"https://example.com/{i}/{j}.jpg" for j in range(IMAGES_PER_ITEM)],
+                              timestamp=str(1628000000 + i), source_id=str(i))
+            mail = Mail()
+            mail.raw_text = po.text
+            mail.time = po.timestamp
+            asyncio.run(mail.set_images([make_jpeg(i * IMAGES_PER_ITEM + j, IMAGE_SIZE) for j in range(IMAGES_PER_ITEM)]))
+            queued.append((po, mail))
+        queue.put(current_rss() - base)
+
+
+def run(impl: str, items: int) -> int:
+    ctx = multiprocessing.get_context("spawn")
+    queue = ctx.Queue()
+    proc = ctx.Process(target=_run, args=(impl, items, queue))
+    proc.start()
+    ret = queue.get()
+    proc.join()
+    return ret
+
+
+def main() -> int:
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--items", type=int, default=200, help="排队的内容条数，默认200")
+    args = arg_parser.parse_args()
+
+    print(f"{args.items}条内容，每条{IMAGES_PER_ITEM}张{IMAGE_SIZE[0]}x{IMAGE_SIZE[1]}的图片")
+    for impl in ("legacy", "current"):
+        print(f"{impl:<8} RSS增量 {run(impl, args.items) / 1024 / 1024:>8.1f} MB")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
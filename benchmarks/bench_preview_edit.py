@@ -0,0 +1,63 @@
+"""
+修改翻译后重新生成预览的延迟：9图mail首次渲染与之后每次只修改翻译的对比
+
+在仓库根目录运行（需要imgsrc中的字体文件）：python benchmarks/bench_preview_edit.py
+分别测量进程内直接调用render_preview，以及经过RenderService进程池（包含进程间传输）的耗时。
+"""
+import asyncio
+import tempfile
+import time
+
+from bench_thumbnail import load_render, make_jpeg, write_images
+
+EDITS = 5
+TRANSLATION = "这是用于测试的翻译内容，包含一些标点和emoji😀。\n" * 8
+
+
+def clear_caches(render):
+    render._thumb_cache.clear()
+    render._band_cache.clear()
+    render._encode_cache.clear()
+
+
+def in_process(render, images):
+    clear_caches(render)
+    timings = []
+    for i in range(EDITS + 1):
+        job = render.RenderJob(text=f"{i}\n" + TRANSLATION, topic="#贺喜遥香#", images=images)
+        start = time.perf_counter()
+        render.render_preview(job)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+async def through_service(render, images):
+    service = render.RenderService(max_workers=2)
+    timings = []
+    try:
+        for i in range(EDITS + 1):
+            job = render.RenderJob(text=f"service {i}\n" + TRANSLATION, topic="#贺喜遥香#", images=images)
+            start = time.perf_counter()
+            await service.render(0, job)
+            timings.append(time.perf_counter() - start)
+    finally:
+        service.shutdown()
+    return timings
+
+
+def report(name, timings):
+    edits = timings[1:]
+    print(f"{name:<10} 首次渲染 {timings[0] * 1000:>8.1f} ms   "
+          f"修改翻译 平均 {sum(edits) / len(edits) * 1000:>8.1f} ms  最大 {max(edits) * 1000:>8.1f} ms")
+
+
+def main():
+    render = load_render()
+    with tempfile.TemporaryDirectory() as directory:
+        images = tuple(write_images([make_jpeg(i) for i in range(9)], directory))
+        report("进程内", in_process(render, images))
+        report("进程池", asyncio.run(through_service(render, images)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""
+预览渲染的基准测试套件，完全离线运行，输入均为固定种子生成的合成数据
+
+覆盖 Mail.imgcreate（即 render_preview(mail.render_job())，为了不初始化nonebot这里直接构造RenderJob）、
+square_n_thumb 和 circle_corner，维度包括翻译长度（100~5000字）、emoji密度和配图数量（0/1/2/3/6/9）。
+每个用例在新启动的子进程中运行，报告中位耗时、峰值内存增量和输出大小。
+
+在仓库根目录运行（需要imgsrc中的字体文件）：
+    python benchmarks/bench_render.py --save-baseline bench_baseline.json
+    python benchmarks/bench_render.py --baseline bench_baseline.json --threshold 0.2
+与基准相比耗时增加超过threshold（默认20%）的用例会被列出，并以返回码1退出。
+"""
+import argparse
+import json
+import multiprocessing
+import random
+import statistics
+import sys
+import tempfile
+import time
+from typing import Dict, List, NamedTuple
+
+from PIL import Image
+
+from bench_thumbnail import load_render, make_jpeg, peak_rss, write_images
+
+SEED = 46
+REPEAT = 3
+TEXT_LENGTHS = (100, 500, 1000, 2000, 5000)
+EMOJI_DENSITIES = (0.0, 0.05, 0.2)
+IMAGE_COUNTS = (0, 1, 2, 3, 6, 9)
+CORNER_SIZES = ((330, 330), (502, 502), (1020, 1360))
+EMOJIS = ("😀", "👍🏻", "🎉", "❤️", "🌸", "👨‍👩‍👧")
+CJK = "今日はありがとうございました。贺喜遥香的博客更新了，大家快来看看吧！"
+
+
+class Case(NamedTuple):
+    name: str
+    kind: str
+    text_length: int = 0
+    emoji_density: float = 0.0
+    image_count: int = 0
+    size: tuple = (0, 0)
+
+
+def make_text(length: int, emoji_density: float) -> str:
+    rng = random.Random(SEED + length)
+    chars = []
+    for i in range(length):
+        if rng.random() < emoji_density:
+            chars.append(rng.choice(EMOJIS))
+        elif i % 60 == 59:
+            chars.append("\n")
+        else:
+            chars.append(CJK[rng.randrange(len(CJK))])
+    return "".join(chars)
+
+
+def cases() -> List[Case]:
+    ret = []
+    for length in TEXT_LENGTHS:
+        for density in EMOJI_DENSITIES:
+            ret.append(Case(f"imgcreate/text{length}/emoji{density}", "imgcreate", length, density, 0))
+    for count in IMAGE_COUNTS:
+        ret.append(Case(f"imgcreate/images{count}", "imgcreate", 500, 0.05, count))
+    for count in (3, 6, 9):
+        ret.append(Case(f"square_n_thumb/images{count}", "square_n_thumb", image_count=count))
+    for size in CORNER_SIZES:
+        ret.append(Case(f"circle_corner/{size[0]}x{size[1]}", "circle_corner", size=size))
+    return ret
+
+
+def _run(case: Case, paths: List[str], queue):
+    render = load_render()
+    text = make_text(case.text_length, case.emoji_density)
+
+    def once():
+        render._thumb_cache.clear()
+        render._band_cache.clear()
+        render._encode_cache.clear()
+        if case.kind == "imgcreate":
+            job = render.RenderJob(text=text, topic="#贺喜遥香#", images=tuple(paths))
+            return len(render.render_preview(job).data)
+        if case.kind == "square_n_thumb":
+            imgs = [Image.open(path) for path in paths]
+            sidelength = round((1080 - 30 * 2 - 15 * 2) / 3)
+            return sum(len(img.tobytes()) for img in render.square_n_thumb(imgs, sidelength))
+        img = Image.new("RGB", case.size, (120, 160, 200))
+        return len(render.circle_corner(img, 10).tobytes())
+
+    base = peak_rss()
+    timings = []
+    output = 0
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        output = once()
+        timings.append(time.perf_counter() - start)
+    peak = peak_rss() - base
+    queue.put({"time": statistics.median(timings), "peak_rss": peak, "bytes": output})
+
+
+def run_case(case: Case) -> Dict:
+    blobs = [make_jpeg(i) for i in range(case.image_count)]  # 在父进程生成，避免编码原图的内存计入峰值
+    ctx = multiprocessing.get_context("spawn")
+    queue = ctx.Queue()
+    with tempfile.TemporaryDirectory() as directory:
+        proc = ctx.Process(target=_run, args=(case, write_images(blobs, directory), queue))
+        proc.start()
+        ret = queue.get()
+        proc.join()
+    return ret
+
+
+def main() -> int:
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--baseline", help="用于比较的基准结果（JSON）")
+    arg_parser.add_argument("--save-baseline", help="把本次结果保存为基准（JSON）")
+    arg_parser.add_argument("--threshold", type=float, default=0.2, help="允许的耗时增长比例，默认0.2")
+    arg_parser.add_argument("--filter", default="", help="只运行名称中包含该字符串的用例")
+    args = arg_parser.parse_args()
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    results = {}
+    regressions = []
+    print(f"{'case':<36} {'time(ms)':>9} {'peak(MB)':>9} {'bytes':>10} {'vs base':>8}")
+    for case in cases():
+        if args.filter not in case.name:
+            continue
+        ret = run_case(case)
+        results[case.name] = ret
+        change = ""
+        if case.name in baseline:
+            ratio = ret["time"] / baseline[case.name]["time"] - 1
+            change = f"{ratio:+.0%}"
+            if ratio > args.threshold:
+                regressions.append((case.name, ratio))
+        print(f"{case.name:<36} {ret['time'] * 1000:>9.1f} {ret['peak_rss'] / 1024 / 1024:>9.1f} "
+              f"{ret['bytes']:>10} {change:>8}")
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+
+    if regressions:
+        print(f"\n以下用例的耗时增长超过{args.threshold:.0%}：")
+        for name, ratio in regressions:
+            print(f"  {name}: {ratio:+.0%}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
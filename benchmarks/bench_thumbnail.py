@@ -0,0 +1,143 @@
+"""
+缩略图流水线的基准测试：对比全尺寸解码和降采样解码在1/2/4/9张图片时的耗时与峰值内存
+
+在仓库根目录运行：python benchmarks/bench_thumbnail.py
+每个用例在新启动（spawn）的子进程中执行，峰值内存为子进程峰值常驻内存相对于开始计时前的增量。
+"""
+import importlib
+import multiprocessing
+import resource
+import sys
+import tempfile
+import time
+from io import BytesIO
+from pathlib import Path
+from typing import List
+
+from PIL import Image
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+IMAGE_COUNTS = (1, 2, 4, 9)
+SOURCE_SIZE = (4000, 3000)
+
+
+def load_render():
+    """
+    导入独立的渲染模块，不经过插件包的__init__，因此不需要初始化nonebot
+    """
+    if str(REPO_ROOT) not in sys.path:
+        sys.path.insert(0, str(REPO_ROOT))  # 进程池的工作进程继承sys.path，按模块名导入渲染函数
+    return importlib.import_module("src.plugins._hxzxlib.render")
+
+
+def peak_rss() -> int:
+    """
+    当前进程的峰值常驻内存（字节）
+
+    Linux下读取/proc/self/status中的VmHWM，它在exec后重新计数；
+    ru_maxrss会保留fork时父进程的峰值，只作为其他平台的后备
+    """
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss if sys.platform == "darwin" else maxrss * 1024
+
+
+def make_jpeg(index: int, size=SOURCE_SIZE) -> bytes:
+    img = Image.linear_gradient("L").resize(size).convert("RGB")
+    img.paste((index * 25 % 256, 120, 200), (0, 0, size[0] // 3, size[1] // 3))
+    ret = BytesIO()
+    img.save(ret, format="jpeg", quality=90)
+    return ret.getvalue()
+
+
+def write_images(blobs: List[bytes], directory: str) -> List[str]:
+    """
+    把图片写入目录并返回路径，渲染函数和bot中一样从媒体缓存的文件读取配图
+    """
+    paths = []
+    for i, blob in enumerate(blobs):
+        path = Path(directory) / f"{i}.jpg"
+        path.write_bytes(blob)
+        paths.append(str(path))
+    return paths
+
+
+def sidelength(count: int, width: int = 1080) -> int:
+    if count == 1:
+        return width - 30 * 2
+    if count == 2:
+        return round((width - 30 * 2 - 15) / 2)
+    return round((width - 30 * 2 - 15 * 2) / 3)
+
+
+def full_decode(render, paths, side):
+    """
+    旧流程：完整解码原图后再裁剪和缩小
+    """
+    ret = []
+    for path in paths:
+        img = Image.open(path)
+        if len(paths) == 1:
+            rate = side / img.size[0]
+            img = img.resize((int(rate * img.size[0]), int(rate * img.size[1])))
+        else:
+            min_edge = min(img.size)
+            cut_w = (img.size[0] - min_edge) / 2
+            cut_h = (img.size[1] - min_edge) / 2
+            img = img.crop((cut_w, cut_h, img.size[0] - cut_w, img.size[1] - cut_h))
+            img.thumbnail((side, side))
+        ret.append(render.circle_corner(img, 10))
+    return ret
+
+
+def reduced_decode(render, paths, side):
+    render._thumb_cache.clear()
+    return [render.rounded_thumb(path, side, square=len(paths) != 1) for path in paths]
+
+
+def cached(render, paths, side):
+    return [render.rounded_thumb(path, side, square=len(paths) != 1) for path in paths]
+
+
+def _run_case(method: str, paths, queue):
+    render = load_render()
+    side = sidelength(len(paths))
+    if method == "cached":
+        reduced_decode(render, paths, side)  # 预热缓存
+    func = {"full": full_decode, "reduced": reduced_decode, "cached": cached}[method]
+    base = peak_rss()
+    start = time.perf_counter()
+    func(render, paths, side)
+    elapsed = time.perf_counter() - start
+    peak = peak_rss() - base
+    queue.put((elapsed, peak))
+
+
+def run_case(method: str, blobs):
+    ctx = multiprocessing.get_context("spawn")
+    queue = ctx.Queue()
+    with tempfile.TemporaryDirectory() as directory:
+        proc = ctx.Process(target=_run_case, args=(method, write_images(blobs, directory), queue))
+        proc.start()
+        ret = queue.get()
+        proc.join()
+    return ret
+
+
+def main():
+    print(f"{'images':>6} {'method':>8} {'time(ms)':>10} {'peak(MB)':>10}")
+    for count in IMAGE_COUNTS:
+        blobs = [make_jpeg(i) for i in range(count)]
+        for method in ("full", "reduced", "cached"):
+            elapsed, peak = run_case(method, blobs)
+            print(f"{count:>6} {method:>8} {elapsed * 1000:>10.1f} {peak / 1024 / 1024:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
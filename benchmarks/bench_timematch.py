@@ -0,0 +1,133 @@
+"""
+翻译与mail按时间匹配的基准测试：对比原来的parse_time（四次正则）+ 字典精确查找，
+和现在的parse_time（日期、时刻各一次预编译正则）+ TimeIndex最近匹配，输入为固定种子生成的各种写法的“时间…”行
+
+在仓库根目录运行：python benchmarks/bench_timematch.py [--queued 5000] [--lookups 20000]
+报告解析和匹配的平均耗时，以及精确时间、有几秒误差、相差一小时（时区）三种输入的匹配率。
+"""
+import argparse
+import datetime
+import importlib.util
+import random
+import re
+import sys
+import time
+from pathlib import Path
+
+TIMEINDEX_PATH = Path(__file__).resolve().parent.parent / "src" / "plugins" / "hxzxhelper" / "timeindex.py"
+SEED = 39
+TOLERANCE = 60
+OFFSETS = (0, 3600, -3600)
+PREFIXES = ("时间：", "时间:", "时间 ", "時間：", "【推特更新】时间：")
+WEEKDAYS = ("", "（木）", "(金)", " 土曜日 ", "星期三")
+
+
+def load_timeindex():
+    """
+    直接按文件加载timeindex.py，不经过插件包的__init__，因此不需要初始化nonebot
+    """
+    spec = importlib.util.spec_from_file_location("hxzxhelper_timeindex", TIMEINDEX_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def legacy_parse_time(timestr: str) -> str:
+    """
+    改动前__init__.parse_time的实现，作为对照
+    """
+    year = re.search(r"\d{4}年", timestr)
+    month = re.search(r"\d{1,2}月", timestr)
+    day = re.search(r"\d{1,2}日", timestr)
+    hournminute = re.search(r"\d{1,2}([:：]\d{1,2}){1,2}", timestr)
+
+    if year and month and day and hournminute:
+        hournminute_str = hournminute.group()
+        hms = hournminute_str.split("：") if len(hournminute_str.split(":")) == 1 else hournminute_str.split(":")
+        if len(hms) < 3:
+            hms += ["0"] * (3 - len(hms))
+
+        tm = datetime.datetime(year=int(year.group()[:-1]), month=int(month.group()[:-1]), day=int(day.group()[:-1]),
+                               hour=int(hms[0]), minute=int(hms[1]), second=int(hms[2]))
+        return str(int(tm.timestamp()))
+    else:
+        raise ValueError("导入时间信息出错：年月日时分信息可能存在缺失")
+
+
+def format_time(rng: random.Random, tm: datetime.datetime) -> str:
+    pad = rng.random() < 0.5
+    colon = rng.choice((":", "："))
+    date = f"{tm.year}年{tm.month:02d}月{tm.day:02d}日" if pad else f"{tm.year}年{tm.month}月{tm.day}日"
+    clock = f"{tm.hour:02d}{colon}{tm.minute:02d}" if pad else f"{tm.hour}{colon}{tm.minute:02d}"
+    if tm.second or rng.random() < 0.3:
+        clock += f"{colon}{tm.second:02d}"
+    return f"{rng.choice(PREFIXES)}{date}{rng.choice(WEEKDAYS)} {clock}"
+
+
+def make_queue(rng: random.Random, count: int):
+    start = datetime.datetime(2021, 1, 1, 7)
+    return sorted({start + datetime.timedelta(minutes=rng.randrange(365 * 24 * 60)) for _ in range(count)})
+
+
+def make_lookups(rng: random.Random, queue, count: int, kind: str):
+    ret = []
+    for _ in range(count):
+        tm = rng.choice(queue)
+        if kind == "jitter":
+            tm += datetime.timedelta(seconds=rng.choice((-30, -5, -1, 1, 5, 30)))
+        elif kind == "timezone":
+            tm += datetime.timedelta(hours=rng.choice((-1, 1)))
+        ret.append(format_time(rng, tm))
+    return ret
+
+
+def bench(func, lines):
+    matched = 0
+    start = time.perf_counter()
+    for line in lines:
+        if func(line):
+            matched += 1
+    return (time.perf_counter() - start) / len(lines), matched / len(lines)
+
+
+def main() -> int:
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--queued", type=int, default=5000, help="队列中的mail数量，默认5000")
+    arg_parser.add_argument("--lookups", type=int, default=20000, help="每种输入的查找次数，默认20000")
+    args = arg_parser.parse_args()
+
+    timeindex = load_timeindex()
+    rng = random.Random(SEED)
+    queue = make_queue(rng, args.queued)
+    keys = {str(int(tm.timestamp())) for tm in queue}
+    index = timeindex.TimeIndex(int(key) for key in keys)
+
+    def legacy(line):
+        try:
+            return legacy_parse_time(line) in keys
+        except ValueError:
+            return False
+
+    def indexed(line):
+        try:
+            return index.match(int(timeindex.parse_time(line)), TOLERANCE, OFFSETS) is not None
+        except ValueError:
+            return False
+
+    print(f"队列中的mail：{len(keys)}条，每种输入查找{args.lookups}次")
+    print(f"{'input':<10} {'impl':<8} {'us/lookup':>10} {'matched':>8}")
+    for kind in ("exact", "jitter", "timezone"):
+        lines = make_lookups(rng, queue, args.lookups, kind)
+        for name, func in (("legacy", legacy), ("indexed", indexed)):
+            cost, rate = bench(func, lines)
+            print(f"{kind:<10} {name:<8} {cost * 1e6:>10.2f} {rate:>8.1%}")
+
+    lines = make_lookups(rng, queue, args.lookups, "exact")
+    for name, func in (("legacy", legacy_parse_time), ("combined", timeindex.parse_time)):
+        cost, _ = bench(func, lines)
+        print(f"{'parse':<10} {name:<8} {cost * 1e6:>10.2f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
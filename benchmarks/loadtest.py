@@ -0,0 +1,231 @@
+"""
+hxzxhelper的离线压测：用本地替身服务（见standins.py）代替Twitter、POP3邮箱、博客atom和go-cqhttp，
+在子进程中启动加载了插件的nonebot，以生产环境10~100倍的更新量驱动真实的插件代码
+
+    检查更新（pushtweet/pushmail/pushblog）-> 推送流水线 -> 限流发送 -> go-cqhttp替身
+
+生产环境的检查间隔（TIME_CHECK*UPDATE）按--speedup压缩，各类内容按PRODUCTION_PER_HOUR * --scale的速率随机发布。
+发布结束后继续运行--drain秒让队列排空，然后报告各类内容的送达数、吞吐量、延迟（发布到go-cqhttp收到）的
+p50/p95/p99，bot进程的常驻内存，以及插件自身按阶段统计的耗时（与“性能统计”命令相同）。
+
+在仓库根目录运行（需要安装bot的全部依赖）：
+    python benchmarks/loadtest.py --scale 10 --duration 120
+    python benchmarks/loadtest.py --scale 100 --render --env SEND_RATE=5 --env FORWARD_BATCH=5
+--env用于覆盖插件配置（同.env中的写法），--render会为每条进入处理队列的内容渲染并发送预览图。
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import socket
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List
+
+from bench_mail_memory import current_rss
+from bench_thumbnail import make_jpeg, peak_rss
+from standins import KINDS, MAIL_SENDER, FakeGoCQHTTP, Fixtures, POP3Server, StandinHTTP
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+PRODUCTION_PER_HOUR = {"tweet": 3.0, "mail": 1.0, "blog": 0.25}  # 生产环境中每小时的更新数（估计值）
+POLL_JOBS = {"tweet": ("update_twi", "pushtweet", "time_checktweetupdate"),
+             "mail": ("update_mail", "pushmail", "time_checkmailupdate"),
+             "blog": ("update_blog", "pushblog", "time_checkblogupdate")}
+GROUP_ID = 100000
+MEMBER_ABBR = "loadtest"
+IMAGE_POOL = 16
+IMAGE_SIZE = (1280, 960)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    return sorted_values[round((len(sorted_values) - 1) * q)] if sorted_values else float("nan")
+
+
+def parse_env(pairs: List[str]) -> Dict[str, object]:
+    ret = {}
+    for pair in pairs:
+        key, _, value = pair.partition("=")
+        try:
+            ret[key.strip().lower()] = json.loads(value)
+        except ValueError:
+            ret[key.strip().lower()] = value
+    return ret
+
+
+def run_bot(workdir: str, port: int, config: dict, speedup: float, render: bool, stop, results):
+    """
+    子进程：启动加载了插件的nonebot，按压缩后的间隔调用插件的检查更新任务，直到stop被设置
+    """
+    os.chdir(workdir)  # 工作目录中没有.env，配置完全由config决定
+    os.symlink(REPO_ROOT / "imgsrc", "imgsrc")  # 渲染按相对路径读取字体和素材
+    sys.path.insert(0, str(REPO_ROOT))
+    import nonebot
+    import uvicorn
+    from nonebot.adapters.cqhttp import Bot
+
+    nonebot.init(host="127.0.0.1", port=port, **config)
+    nonebot.get_driver().register_adapter("cqhttp", Bot)
+    plugin = nonebot.load_plugin("src.plugins.hxzxhelper").module
+    from src.plugins.hxzxhelper.tracing import tracer
+
+    scheduler = nonebot.require("nonebot_plugin_apscheduler").scheduler
+    polls = {}
+    for kind, (job_id, func, interval) in POLL_JOBS.items():
+        scheduler.remove_job(job_id)  # 由下面的循环按压缩后的间隔调用
+        polls[kind] = (getattr(plugin, func), plugin.plugin_config.dict()[interval] * 60 / speedup)
+    stats = {"polls": {kind: 0 for kind in KINDS}, "poll_errors": {kind: 0 for kind in KINDS}, "renders": 0}
+
+    async def poll(kind: str):
+        job, period = polls[kind]
+        while True:
+            start = time.monotonic()
+            try:
+                await job()
+            except Exception:
+                nonebot.logger.exception(f"检查{kind}更新失败")
+                stats["poll_errors"][kind] += 1
+            stats["polls"][kind] += 1
+            await asyncio.sleep(max(0.0, period - (time.monotonic() - start)))
+
+    async def render_previews():
+        rendered = set()
+        while True:
+            for mail in [mail for mail in plugin.mails_dict.values() if mail.no not in rendered]:
+                rendered.add(mail.no)
+                try:
+                    preview = await mail.preview()
+                    if preview:
+                        await nonebot.get_bot().send_group_msg(group_id=GROUP_ID, message=preview)
+                        stats["renders"] += 1
+                except Exception:
+                    nonebot.logger.exception(f"mail[{mail.no}]：渲染预览失败")
+            await asyncio.sleep(0.5)
+
+    async def main():
+        server = uvicorn.Server(uvicorn.Config(nonebot.get_asgi(), host="127.0.0.1", port=port,
+                                               log_level="warning", access_log=False))
+        serving = asyncio.ensure_future(server.serve())
+        while not nonebot.get_bots():
+            if serving.done():
+                raise RuntimeError("bot启动失败")
+            await asyncio.sleep(0.1)
+        rss_start = rss_peak = current_rss()
+        tasks = [asyncio.ensure_future(poll(kind)) for kind in KINDS]
+        if render:
+            tasks.append(asyncio.ensure_future(render_previews()))
+        while not stop.is_set():
+            await asyncio.sleep(0.5)
+            rss_peak = max(rss_peak, current_rss())
+        for task in tasks:
+            task.cancel()
+        report = {"rss_start": rss_start, "rss_peak": rss_peak, "rss_end": current_rss(), "hwm": peak_rss(),
+                  "queue": plugin.mails_dict.stats(), "trace": tracer.summary(), **stats}
+        server.should_exit = True
+        await serving
+        results.put(report)
+
+    asyncio.run(main())
+
+
+async def publish(fixtures: Fixtures, kind: str, rate: float, deadline: float, rng: random.Random):
+    while True:
+        at = time.monotonic() + rng.expovariate(rate)
+        if at >= deadline:
+            await asyncio.sleep(max(0.0, deadline - time.monotonic()))
+            return
+        await asyncio.sleep(at - time.monotonic())
+        fixtures.publish(kind)
+
+
+async def run(args) -> int:
+    image_pool = [make_jpeg(i, IMAGE_SIZE) for i in range(IMAGE_POOL)]
+    fixtures = Fixtures(image_pool, seed=args.seed)
+    http = StandinHTTP(fixtures, MEMBER_ABBR)
+    await http.start()
+    pop3 = POP3Server(fixtures, http._media_url)
+    await pop3.start()
+    cqhttp = FakeGoCQHTTP(fixtures)
+    for kind in KINDS:  # 插件启动时以已有的最新内容作为起点，这些内容不计入结果
+        fixtures.publish(kind)
+    seeded = {kind: len(fixtures.items[kind]) for kind in KINDS}
+
+    port = free_port()
+    workdir = tempfile.TemporaryDirectory(prefix="hxzx-loadtest-")
+    config = {
+        "data_dir": str(Path(workdir.name) / "data"), "debug": True, "fansub_groups": [GROUP_ID],
+        "log_level": "WARNING",
+        "tweet": True, "tweet_api_base": f"{http.base_url}/2", "tweet_moni_keywords": ["負荷試験"],
+        "tweet_bearer_token": "loadtest",
+        "blog": True, "blog_base_url": http.base_url, "member_abbr": MEMBER_ABBR,
+        "mail": True, "pop3_server": "127.0.0.1", "pop3_port": pop3.port, "pop3_ssl": False,
+        "mail_recv_addr": "bot@example.com", "mail_recv_pwd": "loadtest", "moni_addrs": [MAIL_SENDER],
+    }
+    config.update(parse_env(args.env))
+    ctx = multiprocessing.get_context("spawn")
+    stop, results = ctx.Event(), ctx.Queue()
+    bot = ctx.Process(target=run_bot, args=(workdir.name, port, config, args.speedup, args.render, stop, results))
+    bot.start()
+    try:
+        await cqhttp.connect(f"ws://127.0.0.1:{port}/cqhttp/ws")
+        rates = {kind: PRODUCTION_PER_HOUR[kind] * args.scale * args.speedup / 3600 for kind in KINDS}
+        print(f"bot已连接，以生产环境{args.scale}倍的更新量发布{args.duration}秒（时间压缩{args.speedup}倍）：" +
+              "，".join(f"{kind} {rate:.2f}条/秒" for kind, rate in rates.items()))
+        rng = random.Random(args.seed)
+        start = time.monotonic()
+        await asyncio.gather(*[publish(fixtures, kind, rate, start + args.duration, rng) for kind, rate in rates.items()])
+        await asyncio.sleep(args.drain)
+        elapsed = time.monotonic() - start
+        stop.set()
+        report = await asyncio.get_event_loop().run_in_executor(None, results.get, True, 120)
+    finally:
+        stop.set()
+        await asyncio.get_event_loop().run_in_executor(None, bot.join)
+        await cqhttp.close()
+        await pop3.stop()
+        await http.stop()
+        workdir.cleanup()
+
+    print(f"\n{'类型':<6}{'发布':>6}{'送达':>6}{'检查':>6}{'p50(s)':>9}{'p95(s)':>9}{'p99(s)':>9}{'最大(s)':>9}")
+    delivered = 0
+    for kind in KINDS:
+        latencies = sorted(d.latency for d in cqhttp.deliveries[kind] if d.no >= seeded[kind])
+        delivered += len(latencies)
+        print(f"{kind:<8}{len(fixtures.items[kind]) - seeded[kind]:>6}{len(latencies):>6}{report['polls'][kind]:>6}"
+              f"{percentile(latencies, 0.5):>9.2f}{percentile(latencies, 0.95):>9.2f}"
+              f"{percentile(latencies, 0.99):>9.2f}{max(latencies, default=float('nan')):>9.2f}")
+    print(f"\n吞吐量：{delivered / elapsed:.2f}条/秒（{delivered}条/{elapsed:.0f}秒），重复送达{cqhttp.duplicates}条，"
+          f"检查更新失败{sum(report['poll_errors'].values())}次")
+    print(f"go-cqhttp调用：{cqhttp.calls}，图片{cqhttp.images}张，预览{cqhttp.previews}条")
+    print(f"替身服务请求：{http.requests}，POP3会话{pop3.sessions}次")
+    print(f"bot进程内存：启动后{report['rss_start'] / 2 ** 20:.1f} MB，峰值{report['rss_peak'] / 2 ** 20:.1f} MB，"
+          f"结束时{report['rss_end'] / 2 ** 20:.1f} MB（VmHWM {report['hwm'] / 2 ** 20:.1f} MB）")
+    print(f"处理队列：{report['queue']}")
+    print("\n" + report["trace"])
+    return 0
+
+
+def main() -> int:
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--scale", type=float, default=10, help="相对生产环境的更新量倍数，默认10")
+    arg_parser.add_argument("--duration", type=float, default=120, help="发布内容的秒数，默认120")
+    arg_parser.add_argument("--speedup", type=float, default=60, help="时间压缩倍数（检查间隔和发布速率），默认60")
+    arg_parser.add_argument("--drain", type=float, default=30, help="发布结束后等待队列排空的秒数，默认30")
+    arg_parser.add_argument("--render", action="store_true", help="为进入处理队列的每条内容渲染发送预览")
+    arg_parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE", help="覆盖插件配置，可重复")
+    arg_parser.add_argument("--seed", type=int, default=47)
+    args = arg_parser.parse_args()
+    return asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,311 @@
+"""
+离线压测用的本地替身服务，供benchmarks/loadtest.py使用
+
+- StandinHTTP：Twitter API v2（recent search和按id获取推文）、博客atom和图片下载
+- POP3Server：由生成的mail组成的明文POP3邮箱
+- FakeGoCQHTTP：以反向WebSocket连接bot的go-cqhttp，应答所有API调用并记录收到的推送
+
+每项生成的内容的文字中都带有“LT-类型-序号”的标记，FakeGoCQHTTP据此把收到的消息对应回发布时间。
+"""
+import asyncio
+import datetime
+import email.utils
+import json
+import random
+import re
+import time
+import zlib
+from email.header import Header
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from html import escape
+from typing import Dict, List, NamedTuple, Optional
+
+from aiohttp import ClientError, ClientSession, WSMsgType, web
+
+KINDS = ("tweet", "mail", "blog")
+MARKER_REGEXP = re.compile(r"LT-(tweet|mail|blog)-(\d+)")
+TWEET_ID_BASE = 1500000000000000000  # 保持19位，插件按字符串比较推文id
+TWEET_USER = {"id": "1000", "name": "負荷試験", "username": "loadtest",
+              "public_metrics": {"followers_count": 1, "following_count": 1, "tweet_count": 1, "listed_count": 0}}
+MAIL_SENDER = "sender@example.com"
+BLOG_ENTRIES = 10  # atom中保留的最近条目数
+SEARCH_MAX_RESULTS = 30  # 与Twitter API相同，超出部分需要翻页（插件不翻页）
+QUOTE_RATIO = 0.2  # 引用之前推文的比例，用于触发引用推文的获取
+BODY = "今日はありがとうございました。明日も頑張ります！"
+
+
+class Item(NamedTuple):
+    kind: str
+    no: int
+    timestamp: int  # 内容上的时间（秒），同一类型内严格递增
+    published: float  # 发布到替身服务的时刻（time.time()）
+    images: List[str]  # 图片相对路径
+    quote: Optional[int] = None  # 引用的推文序号
+
+    @property
+    def marker(self) -> str:
+        return f"LT-{self.kind}-{self.no}"
+
+
+class Fixtures(object):
+    """
+    按需生成推文、mail和博客，图片内容取自image_pool，末尾追加序号使每张图片的摘要各不相同
+    """
+
+    def __init__(self, image_pool: List[bytes], seed: int = 47):
+        self.image_pool = image_pool
+        self.random = random.Random(seed)
+        self.items: Dict[str, List[Item]] = {kind: [] for kind in KINDS}
+        self._clock: Dict[str, int] = {kind: 0 for kind in KINDS}
+
+    def publish(self, kind: str) -> Item:
+        items = self.items[kind]
+        no = len(items)
+        self._clock[kind] = max(int(time.time()), self._clock[kind] + 1)  # 插件按秒比较mail和博客的新旧
+        count = {"tweet": self.random.randint(0, 4), "mail": self.random.randint(1, 3),
+                 "blog": self.random.randint(2, 6)}[kind]
+        quote = None
+        if kind == "tweet" and items and self.random.random() < QUOTE_RATIO:
+            quote = self.random.randrange(len(items))
+        item = Item(kind, no, self._clock[kind], time.time(), [f"{kind}-{no}-{i}.jpg" for i in range(count)], quote)
+        items.append(item)
+        return item
+
+    def image(self, name: str) -> bytes:
+        # JPEG解码器会忽略EOI之后的数据
+        return self.image_pool[zlib.crc32(name.encode()) % len(self.image_pool)] + name.encode()
+
+
+class StandinHTTP(object):
+    """
+    Twitter API v2、博客atom和图片的HTTP替身服务
+    """
+
+    def __init__(self, fixtures: Fixtures, member_abbr: str):
+        self.fixtures = fixtures
+        self.base_url = ""
+        self.requests: Dict[str, int] = {"search": 0, "tweets": 0, "atom": 0, "media": 0}
+        self._runner: Optional[web.AppRunner] = None
+        self._app = web.Application()
+        self._app.add_routes([web.get("/2/tweets/search/recent", self.search),
+                              web.get("/2/tweets", self.tweets),
+                              web.get(f"/{member_abbr}/atom.xml", self.atom),
+                              web.get("/media/{name}", self.media)])
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0):
+        self._runner = web.AppRunner(self._app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        host, port = self._runner.addresses[0][:2]
+        self.base_url = f"http://{host}:{port}"
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+
+    def _media_url(self, name: str) -> str:
+        return f"{self.base_url}/media/{name}"
+
+    def _tweet(self, item: Item) -> dict:
+        created = datetime.datetime.fromtimestamp(item.timestamp, datetime.timezone.utc)
+        ret = {"id": str(TWEET_ID_BASE + item.no), "author_id": TWEET_USER["id"], "entities": {},
+               "created_at": created.strftime("%Y-%m-%dT%H:%M:%S.000Z"),
+               "text": f"#負荷試験 {item.marker} {BODY}"}
+        if item.images:
+            ret["attachments"] = {"media_keys": [f"3_{name}" for name in item.images]}
+        if item.quote is not None:
+            ret["referenced_tweets"] = [{"type": "quoted", "id": str(TWEET_ID_BASE + item.quote)}]
+        return ret
+
+    def _tweet_response(self, items: List[Item]) -> web.Response:
+        if not items:
+            return web.json_response({"meta": {"result_count": 0}})
+        media = [{"media_key": f"3_{name}", "type": "photo", "url": self._media_url(name)}
+                 for item in items for name in item.images]
+        ids = [str(TWEET_ID_BASE + item.no) for item in items]
+        return web.json_response({"data": [self._tweet(item) for item in items],
+                                  "includes": {"media": media or None, "users": [TWEET_USER]},
+                                  "meta": {"newest_id": max(ids), "oldest_id": min(ids), "result_count": len(items)}})
+
+    async def search(self, request: web.Request) -> web.Response:
+        self.requests["search"] += 1
+        since = int(request.query.get("since_id", TWEET_ID_BASE - 1)) - TWEET_ID_BASE
+        limit = int(request.query.get("max_results", SEARCH_MAX_RESULTS))
+        newer = [item for item in self.fixtures.items["tweet"] if item.no > since]
+        return self._tweet_response(newer[::-1][:limit])
+
+    async def tweets(self, request: web.Request) -> web.Response:
+        self.requests["tweets"] += 1
+        items = self.fixtures.items["tweet"]
+        nos = [int(i) - TWEET_ID_BASE for i in request.query.get("ids", "").split(",") if i]
+        return self._tweet_response([items[no] for no in nos if 0 <= no < len(items)])
+
+    async def atom(self, request: web.Request) -> web.Response:
+        self.requests["atom"] += 1
+        entries = []
+        for item in self.fixtures.items["blog"][::-1][:BLOG_ENTRIES]:
+            published = datetime.datetime.fromtimestamp(item.timestamp, datetime.timezone(datetime.timedelta(hours=9)))
+            content = "<div>" + "".join(f"<p>{BODY}</p><img src=\"{self._media_url(name)}\">"
+                                        for name in item.images) + "</div>"
+            entries.append(f"<entry><id>tag:loadtest,{item.no}</id><title>{item.marker}</title>"
+                           f"<published>{published.isoformat()}</published>"
+                           f"<content type=\"html\">{escape(content)}</content></entry>")
+        feed = "<?xml version=\"1.0\" encoding=\"utf-8\"?>" \
+               "<feed xmlns=\"http://www.w3.org/2005/Atom\"><title>loadtest</title>" + "".join(entries) + "</feed>"
+        return web.Response(text=feed, content_type="application/atom+xml")
+
+    async def media(self, request: web.Request) -> web.Response:
+        self.requests["media"] += 1
+        return web.Response(body=self.fixtures.image(request.match_info["name"]), content_type="image/jpeg")
+
+
+class POP3Server(object):
+    """
+    明文POP3邮箱替身，支持USER/PASS/STAT/LIST/RETR/NOOP/QUIT，邮件编号越大越新
+    """
+
+    def __init__(self, fixtures: Fixtures, media_url):
+        self.fixtures = fixtures
+        self.media_url = media_url  # 图片相对路径 -> 链接
+        self.port = 0
+        self.sessions = 0
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._messages: Dict[int, bytes] = {}  # {mail序号: 邮件原文}
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0):
+        self._server = await asyncio.start_server(self._handle, host, port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+
+    def _message(self, item: Item) -> bytes:
+        if item.no not in self._messages:
+            images = "".join(f"<img src=\"{self.media_url(name)}\"><br>" for name in item.images)
+            html = f"<html><head><meta charset=\"utf-8\"></head><body><div>{item.marker}<br>{BODY}<br>" \
+                   f"{images}</div></body></html>"
+            part = MIMEText(html, "html", "utf-8")
+            part.replace_header("Content-Type", "text/html; charset=UTF-8")  # 插件按不带引号的charset解码
+            msg = MIMEMultipart("alternative")
+            msg.attach(part)
+            msg["From"] = MAIL_SENDER
+            msg["To"] = "bot@example.com"
+            msg["Subject"] = Header(f"負荷試験 {item.no}", "utf-8").encode()
+            msg["Date"] = email.utils.formatdate(item.timestamp)
+            msg["Message-ID"] = f"<{item.marker}@loadtest>"
+            self._messages[item.no] = msg.as_bytes().replace(b"\n", b"\r\n")
+        return self._messages[item.no]
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.sessions += 1
+        mailbox = list(self.fixtures.items["mail"])  # 会话期间邮箱内容不变
+        writer.write(b"+OK loadtest POP3 ready\r\n")
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                command, *args = line.decode().split()
+                command = command.upper()
+                if command == "LIST":
+                    sizes = "".join(f"{i} {len(self._message(item))}\r\n" for i, item in enumerate(mailbox, start=1))
+                    writer.write(f"+OK {len(mailbox)} messages\r\n{sizes}.\r\n".encode())
+                elif command == "STAT":
+                    writer.write(f"+OK {len(mailbox)} {sum(len(self._message(item)) for item in mailbox)}\r\n".encode())
+                elif command == "RETR":
+                    data = self._message(mailbox[int(args[0]) - 1])
+                    lines = [b"." + x if x.startswith(b".") else x for x in data.split(b"\r\n")]
+                    writer.write(f"+OK {len(data)} octets\r\n".encode() + b"\r\n".join(lines) + b"\r\n.\r\n")
+                elif command == "QUIT":
+                    writer.write(b"+OK bye\r\n")
+                    break
+                else:
+                    writer.write(b"+OK\r\n")
+                await writer.drain()
+        finally:
+            await writer.drain()
+            writer.close()
+
+
+class Delivery(NamedTuple):
+    no: int  # 内容序号
+    latency: float  # 秒，从发布到go-cqhttp收到
+
+
+class FakeGoCQHTTP(object):
+    """
+    go-cqhttp替身：以反向WebSocket（Universal）连接bot，所有API调用都返回成功
+
+    按消息中的标记记录每项内容第一次送达的延迟，重复送达计入duplicates
+    """
+
+    def __init__(self, fixtures: Fixtures, self_id: int = 10000):
+        self.fixtures = fixtures
+        self.self_id = self_id
+        self.deliveries: Dict[str, List[Delivery]] = {kind: [] for kind in KINDS}
+        self.duplicates = 0
+        self.calls: Dict[str, int] = {}
+        self.images = 0
+        self.previews = 0
+        self._seen = set()
+        self._message_id = 0
+        self._task: Optional[asyncio.Task] = None
+
+    async def connect(self, url: str, timeout: float = 60):
+        """
+        等待bot启动并建立连接，连接后在后台处理API调用
+        """
+        session = ClientSession()
+        deadline = time.monotonic() + timeout
+        headers = {"X-Self-ID": str(self.self_id), "X-Client-Role": "Universal"}
+        while True:
+            try:
+                ws = await session.ws_connect(url, headers=headers, max_msg_size=0)
+                break
+            except (ClientError, OSError):
+                if time.monotonic() > deadline:
+                    await session.close()
+                    raise
+                await asyncio.sleep(0.2)
+        self._task = asyncio.ensure_future(self._serve(session, ws))
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+
+    async def _serve(self, session: ClientSession, ws):
+        try:
+            async for msg in ws:
+                if msg.type != WSMsgType.TEXT:
+                    continue
+                data = json.loads(msg.data)
+                if "action" not in data:
+                    continue
+                self._record(data["action"], data.get("params", {}))
+                self._message_id += 1
+                await ws.send_json({"status": "ok", "retcode": 0, "data": {"message_id": self._message_id},
+                                    "echo": data.get("echo")})
+        finally:
+            await ws.close()
+            await session.close()
+
+    def _record(self, action: str, params: dict):
+        now = time.time()
+        self.calls[action] = self.calls.get(action, 0) + 1
+        text = json.dumps(params, ensure_ascii=False)
+        self.images += text.count('"type": "image"')
+        if "发送预览" in text:
+            self.previews += 1
+            return
+        for kind, no in set(MARKER_REGEXP.findall(text)):
+            marker = f"LT-{kind}-{no}"
+            if marker in self._seen:
+                self.duplicates += 1
+                continue
+            self._seen.add(marker)
+            item = self.fixtures.items[kind][int(no)]
+            self.deliveries[kind].append(Delivery(item.no, now - item.published))
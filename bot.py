@@ -14,16 +14,19 @@ from nonebot.adapters.cqhttp import Bot as CQHTTPBot
 #            level="ERROR",
 #            format=default_format)
 
-# You can pass some keyword args config to init function
-nonebot.init()
-app = nonebot.get_asgi()
+# 直接运行时本文件以__main__导入，使用nb run时以bot导入；
+# 预览渲染进程等forkserver/spawn子进程会以__mp_main__重新导入本文件，子进程中不初始化bot，也不加载插件
+if __name__ != "__mp_main__":
+    # You can pass some keyword args config to init function
+    nonebot.init()
+    app = nonebot.get_asgi()
 
-driver = nonebot.get_driver()
-driver.register_adapter("cqhttp", CQHTTPBot)
+    driver = nonebot.get_driver()
+    driver.register_adapter("cqhttp", CQHTTPBot)
 
-# Please DO NOT modify this file unless you know what you are doing!
-# As an alternative, you should use command `nb` or modify `pyproject.toml` to load plugins
-nonebot.load_from_toml("pyproject.toml")
+    # Please DO NOT modify this file unless you know what you are doing!
+    # As an alternative, you should use command `nb` or modify `pyproject.toml` to load plugins
+    nonebot.load_from_toml("pyproject.toml")
 
 # Modify some config / config depends on loaded configs
 # 
@@ -33,4 +36,4 @@ nonebot.load_from_toml("pyproject.toml")
 
 if __name__ == "__main__":
     nonebot.logger.warning("Always use `nb run` to start the bot instead of manually running!")
-    nonebot.run(app="__mp_main__:app")
+    nonebot.run()  # 子进程中没有app，不能按"__mp_main__:app"启动（调试时的自动重载请使用nb run）
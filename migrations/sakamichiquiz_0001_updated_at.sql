@@ -0,0 +1,5 @@
+-- 坂道问答：为题库表添加updated_at列，题库缓存按该列增量同步其他bot实例的修改
+-- 升级前手动执行一次；没有该列时bot仍可运行，但题库缓存每次同步都会重新加载整个题库
+ALTER TABLE questions
+    ADD COLUMN updated_at TIMESTAMP(6) NOT NULL
+        DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6);
@@ -0,0 +1,6 @@
+"""
+hxzxhelper使用的独立模块
+
+本包以下划线开头，不会被nonebot当作插件加载；其中的模块只依赖第三方库，不依赖nonebot和插件包，
+预览渲染进程可以直接按模块名导入，不会执行插件包的__init__.py。
+"""
@@ -0,0 +1,42 @@
+"""
+进程内的LRU缓存
+
+预览渲染（render）和插件包（如lib.utils）都会用到，放在这里以免插件包为了它导入渲染模块。
+"""
+import threading
+from collections import OrderedDict
+from typing import Any, Hashable
+
+
+class LRUCache(object):
+    """
+    按条目数淘汰的简单LRU缓存，键通常包含图片摘要而不是图片本身，避免缓存长期持有原图
+
+    可以在多个线程中同时使用（例如run_sync的工作线程）
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._data: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Any:
+        with self._lock:
+            if key not in self._data:
+                return None
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def put(self, key: Hashable, value: Any):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
@@ -0,0 +1,455 @@
+"""
+发送预览图的渲染
+
+本模块只依赖PIL，不读取nonebot的配置，渲染函数的参数和返回值都可以被pickle，
+因此可以放到进程池中执行，避免PIL的解码、缩放和编码阻塞事件循环。
+工作进程按模块名src.plugins._hxzxlib.render导入本模块，不会导入插件包的__init__.py（它需要已经初始化的nonebot）。
+"""
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
+from io import BytesIO
+from math import ceil
+from typing import Dict, Hashable, List, NamedTuple, Optional, Tuple
+
+import emoji
+from PIL import Image, ImageFont, ImageDraw
+
+from .cache import LRUCache
+
+EMOJI_SIZE = 60  # 预览图中emoji的边长
+EMOJI_ADVANCE = 55  # 每个emoji占用的横向宽度
+_EMOJI_REGEXP = emoji.get_emoji_regexp()  # 带捕获组，split后奇数下标均为emoji
+THUMB_CACHE_SIZE = 36  # 缓存的圆角缩略图数量，约为4条9图mail
+ENCODE_CACHE_SIZE = 32  # 缓存的预览图编码结果数量（每张不超过预设的target_bytes）
+BAND_CACHE_SIZE = 8  # 缓存的配图段数量
+
+
+class EncodePreset(NamedTuple):
+    """
+    编码参数：先用quality编码，超过target_bytes时在[min_quality, quality)之间二分查找最高可用质量
+    """
+    format: str
+    quality: int
+    min_quality: int
+    target_bytes: Optional[int] = None
+
+
+PRESETS: Dict[str, EncodePreset] = {
+    "preview": EncodePreset("JPEG", 85, 40, 1024 * 1024),
+    "preview_webp": EncodePreset("WEBP", 80, 40, 600 * 1024),
+    "upload": EncodePreset("JPEG", 95, 70, 10 * 1024 * 1024),
+}
+
+
+class EncodedImage(NamedTuple):
+    """
+    编码结果，original_bytes为压缩前的大小（原图大小，或预设初始质量下的大小），用于日志对比
+    """
+    data: bytes
+    original_bytes: int
+    quality: Optional[int]
+
+
+class RenderJob(NamedTuple):
+    """
+    一次预览渲染所需的全部数据，可以直接在进程之间传递
+
+    配图只传递媒体缓存中的文件路径（文件名即内容摘要），由工作进程自己读取，
+    只修改翻译时不需要在bot进程中读取图片，也不需要把图片传给工作进程
+    """
+    text: str
+    topic: str
+    images: Tuple[str, ...] = ()
+    preset: str = "preview"
+
+
+_thumb_cache = LRUCache(THUMB_CACHE_SIZE)
+_encode_cache = LRUCache(ENCODE_CACHE_SIZE)
+_band_cache = LRUCache(BAND_CACHE_SIZE)
+
+
+def _save(img: Image.Image, fmt: str, quality: int) -> bytes:
+    ret = BytesIO()
+    if fmt == "JPEG":
+        img.save(ret, format="jpeg", quality=quality, optimize=True, progressive=True)
+    else:
+        img.save(ret, format=fmt, quality=quality, method=4)
+    return ret.getvalue()
+
+
+def encode_image(img: Image.Image, preset: EncodePreset) -> EncodedImage:
+    """
+    按预设编码图片，设置了target_bytes时二分查找不超过目标大小的最高质量
+
+    最低质量仍超过目标大小时返回最低质量的结果
+    """
+    if preset.format == "JPEG" and img.mode not in ("RGB", "L"):
+        img = img.convert("RGB")
+    data = _save(img, preset.format, preset.quality)
+    original_bytes = len(data)
+    if preset.target_bytes is None or len(data) <= preset.target_bytes:
+        return EncodedImage(data, original_bytes, preset.quality)
+    lo, hi = preset.min_quality, preset.quality - 1
+    best, best_quality = None, None
+    while lo <= hi:
+        mid = (lo + hi) // 2
+        candidate = _save(img, preset.format, mid)
+        if len(candidate) <= preset.target_bytes:
+            best, best_quality = candidate, mid
+            lo = mid + 1
+        else:
+            hi = mid - 1
+    if best is None:
+        best_quality = preset.min_quality
+        best = _save(img, preset.format, best_quality)
+    return EncodedImage(best, original_bytes, best_quality)
+
+
+def reencode_image(data: bytes, preset_name: str = "upload") -> EncodedImage:
+    """
+    按预设重新编码已有的图片数据，原图不超过目标大小且格式一致时直接返回原图
+
+    结果不缓存：重新编码的原图可能接近20MB，上传后不再需要，缓存会让bot进程长期持有它们
+    """
+    preset = PRESETS[preset_name]
+    img = Image.open(BytesIO(data))
+    if img.format == preset.format and (preset.target_bytes is None or len(data) <= preset.target_bytes):
+        return EncodedImage(data, len(data), None)
+    encoded = encode_image(img, preset)
+    return EncodedImage(encoded.data, len(data), encoded.quality)
+
+
+@lru_cache(maxsize=8)
+def _load_font(path: str, size: int, raqm: bool = False) -> ImageFont.FreeTypeFont:
+    if raqm:
+        return ImageFont.truetype(path, size, layout_engine=ImageFont.LAYOUT_RAQM)
+    return ImageFont.truetype(path, size)
+
+
+@lru_cache(maxsize=512)
+def emoji_tile(symbol: str, size: int = EMOJI_SIZE) -> Image.Image:
+    """
+    渲染单个emoji并缩放到指定边长，结果按(emoji, 边长)缓存
+
+    返回的RGBA图片会被多次复用，调用方只能读取或粘贴，不要原地修改
+
+    :param symbol: emoji字符（可以是多个码位组成的序列）
+    :param size: 目标边长
+    """
+    fnt_emoji = _load_font("./imgsrc/font_emoji.ttf", 109, raqm=True)
+    t = Image.new("RGBA", size=(150, 150), color=(255, 255, 255, 0))  # FreeType 不可以直接设定尺寸，只能手动缩放
+    td = ImageDraw.Draw(t)
+    td.text((0, 20), symbol, font=fnt_emoji, fill=(0, 0, 0), embedded_color=True)
+    return t.resize((size, size), Image.LANCZOS)
+
+
+def split_emoji(line: str) -> List[Tuple[bool, str]]:
+    """
+    将一行文字拆分为(是否为emoji, 内容)的片段列表
+    """
+    return [(i % 2 == 1, part) for i, part in enumerate(_EMOJI_REGEXP.split(line)) if part]
+
+
+def layout_text(text: str, fnt: ImageFont.FreeTypeFont, max_width: int) -> List[List[Tuple[bool, str]]]:
+    """
+    按最大宽度对文字自动换行，emoji按固定宽度EMOJI_ADVANCE计算
+
+    :return: 每行由(是否为emoji, 内容)片段组成
+    """
+    lines = []
+    for paragraph in text.split("\n"):
+        line = []
+        line_width = 0
+        for is_emoji, part in split_emoji(paragraph):
+            units = [part] if is_emoji else list(part)
+            for unit in units:
+                if line and line[-1][0] == is_emoji and not is_emoji:
+                    line[-1] = (False, line[-1][1] + unit)
+                else:
+                    line.append((is_emoji, unit))
+                line_width += EMOJI_ADVANCE if is_emoji else fnt.getlength(unit)
+                if line_width > max_width:  # 超出宽度的字符保留在本行，从下一个字符开始换行
+                    lines.append(line)
+                    line = []
+                    line_width = 0
+        lines.append(line)
+    return lines
+
+
+@lru_cache(maxsize=32)
+def corner_mask(width: int, height: int, radii: int) -> Image.Image:
+    """
+    生成圆角的alpha蒙版，按(宽, 高, 半径)缓存，九宫格中尺寸相同的缩略图共用同一个蒙版
+
+    返回的蒙版会被多次复用，调用方不要原地修改
+    """
+    circle = Image.new('L', (radii * 2, radii * 2), 0)
+    draw = ImageDraw.Draw(circle)
+    draw.ellipse((0, 0, radii * 2, radii * 2), fill=255)
+    alpha = Image.new("L", (width, height), 255)
+    alpha.paste(circle.crop((0, 0, radii, radii)), (0, 0))  # 本质上是修改圆角外部的区域透明度为0，内部255
+    alpha.paste(circle.crop((radii, 0, radii * 2, radii)), (width - radii, 0))
+    alpha.paste(circle.crop((radii, radii, radii * 2, radii * 2)), (width - radii, height - radii))
+    alpha.paste(circle.crop((0, radii, radii, radii * 2)), (0, height - radii))
+    return alpha
+
+
+def circle_corner(img: Image.Image, radii: int) -> Image.Image:
+    # RGB图片的像素本身按4字节存储，复制后putalpha可以直接切换为RGBA，比convert少一次逐像素转换
+    img = img.copy() if img.mode in ("RGB", "RGBA") else img.convert("RGBA")
+    img.putalpha(corner_mask(img.size[0], img.size[1], radii))
+    return img
+
+
+def _square_thumb(img: Image.Image, sidelength: int) -> Image.Image:
+    """
+    居中裁剪为正方形并缩小到不超过sidelength的边长
+
+    尚未解码的JPEG会先通过draft按1/2、1/4、1/8的比例降采样解码，裁剪区域直接交给resize，
+    不会生成全尺寸的中间图片
+    """
+    w, h = img.size
+    scale = sidelength / min(w, h)
+    if img.format == "JPEG" and scale < 1:  # draft只对尚未解码的图片生效
+        img.draft("RGB", (ceil(w * scale), ceil(h * scale)))
+        w, h = img.size
+    min_edge = min(w, h)
+    side = min(sidelength, min_edge)
+    box = ((w - min_edge) / 2, (h - min_edge) / 2, (w + min_edge) / 2, (h + min_edge) / 2)
+    return img.resize((side, side), Image.BICUBIC, box=box, reducing_gap=2.0)
+
+
+def _fit_width(img: Image.Image, width: int) -> Image.Image:
+    """
+    等比缩放到指定宽度，缩小时同样先降采样解码JPEG
+    """
+    w, h = img.size
+    height = int(width / w * h)
+    if img.format == "JPEG" and width < w:
+        img.draft("RGB", (width, height))
+    return img.resize((width, height), Image.BICUBIC, reducing_gap=2.0)
+
+
+def rounded_thumb(path: str, sidelength: int, square: bool = True) -> Image.Image:
+    """
+    由原图文件生成圆角缩略图，结果按(文件路径, 边长, 是否裁剪为正方形)缓存
+
+    :param path: 原图在媒体缓存中的路径，文件名即内容摘要，因此可以直接作为缓存键
+    :param sidelength: 正方形的边长，或square为False时的目标宽度
+    :param square: True时居中裁剪为正方形，False时保持比例缩放到指定宽度
+    """
+    key = (path, sidelength, square)
+    thumb = _thumb_cache.get(key)
+    if thumb is None:
+        img = Image.open(path)
+        img = _square_thumb(img, sidelength) if square else _fit_width(img, sidelength)
+        thumb = circle_corner(img, 10)
+        _thumb_cache.put(key, thumb)
+    return thumb
+
+
+def square_n_thumb(imglist: list, sidelength: int) -> list:
+    """
+    将图片裁减为圆角方形（转换为RGBA模式），并生成缩略图
+
+    :param imglist: 存放图片的List
+    :param sidelength: 缩略图需要的边长
+    :text_crurn: 修改后的图片存放的List
+    """
+    for i in range(len(imglist)):
+        imglist[i] = circle_corner(_square_thumb(imglist[i], sidelength), 10)
+    return imglist
+
+
+def render_preview(job: RenderJob) -> EncodedImage:
+    """
+    渲染发送预览图（顶栏/文字/配图/底栏四段拼接），按job.preset编码，结果按任务内容缓存
+    """
+    key = (job.text, job.topic, job.images, job.preset)
+    ret = _encode_cache.get(key)
+    if ret is None:
+        ret = encode_image(_compose_preview(job), PRESETS[job.preset])
+        _encode_cache.put(key, ret)
+    return ret
+
+
+@lru_cache(maxsize=4)
+def _load_asset(path: str) -> Image.Image:
+    """
+    顶栏、底栏和空白背景每个进程只解码一次，返回的图片只能读取或粘贴
+    """
+    img = Image.open(path)
+    img.load()
+    return img
+
+
+def render_text_band(text: str, topic: str, width: int) -> Image.Image:
+    """
+    渲染话题和正文所在的文字段，修改翻译时只有这一段需要重新排版
+    """
+    fnt = _load_font("./imgsrc/font.otf", 45)
+    s = text.replace("\r\n", "\n").replace("　", "")
+    lines = layout_text(s, fnt, width - 30 * 4)
+
+    font_height = fnt.getsize(topic)[1]  # 设置首行话题的高度
+    height_text = (font_height + 30) * (1 + len(lines))
+    text_ground = Image.new("RGB", size=(width, height_text), color=(255, 255, 255))
+    d = ImageDraw.Draw(text_ground)
+    d.text((30, 0), topic, font=fnt, fill=(17, 136, 178))  # 行距30，左边距30
+
+    width_offset, height_offset = (30, font_height + 25)
+    for line in lines:
+        for is_emoji, part in line:
+            if not is_emoji:
+                d.text((width_offset, height_offset), part, font=fnt, fill=(0, 0, 0))
+                width_offset += int(fnt.getlength(part))
+            else:
+                tile = emoji_tile(part)
+                text_ground.paste(tile, (width_offset, height_offset), mask=tile)
+                width_offset += EMOJI_ADVANCE
+        height_offset += font_height + 30
+        width_offset = 30
+    return text_ground
+
+
+def render_picture_band(images: Tuple[str, ...], width: int) -> Image.Image:
+    """
+    渲染配图段（RGBA），结果按(图片路径组合, 宽度)缓存，只修改翻译时直接复用，不需要读取图片
+    """
+    key = (images, width)
+    band = _band_cache.get(key)
+    if band is None:
+        band = _render_picture_band(list(images), width)
+        _band_cache.put(key, band)
+    return band
+
+
+def _render_picture_band(imgs: List[str], width: int) -> Image.Image:
+    background = _load_asset("./imgsrc/background.jpg")
+    pic_ground = background.copy().convert("RGBA")  # 没有图片的时候只粘贴一段默认空白背景
+    if imgs:
+        if len(imgs) == 1:
+            sidelen = width - 30 * 2
+            imgs[0] = rounded_thumb(imgs[0], sidelen, square=False)
+            height_pic = imgs[0].size[1]
+            pic_ground = Image.new("RGBA", size=(width, height_pic), color=(255, 255, 255))
+            pic_ground.paste(imgs[0], box=(30, 0))
+        else:
+            if len(imgs) == 2:
+                sidelen = round((width - 30 * 2 - 15) / 2)
+                height_pic = sidelen
+                imgs = [rounded_thumb(img, sidelen) for img in imgs]
+                pic_ground = Image.new("RGBA", size=(width, height_pic), color=(255, 255, 255))
+                pic_ground.paste(imgs[0], box=(30, 0))
+                pic_ground.paste(imgs[1], box=(30 + sidelen + 15, 0))
+            else:
+                sidelen = round((width - 30 * 2 - 15 * 2) / 3)
+                height_pic = (sidelen + 15) * ceil(len(imgs) / 3) - 15
+                imgs = [rounded_thumb(img, sidelen) for img in imgs[:9]]
+                pic_ground = Image.new("RGBA", size=(width, height_pic), color=(255, 255, 255))
+
+                column_cursor = 0
+                row_cursor = - (sidelen + 15)
+                text_cnt = 1
+                for img in imgs:
+                    if text_cnt % 3 == 1:
+                        column_cursor = 30
+                        row_cursor += sidelen + 15
+                    else:
+                        column_cursor += sidelen + 15
+                    pic_ground.paste(img, box=(column_cursor, row_cursor))
+                    text_cnt = text_cnt + 1
+                    if text_cnt > 9:
+                        break
+    return pic_ground
+
+
+def _compose_preview(job: RenderJob) -> Image.Image:
+    top = _load_asset("./imgsrc/top.jpg")
+    bottom = _load_asset("./imgsrc/bottom.jpg")
+    width = _load_asset("./imgsrc/background.jpg").size[0]
+    text_ground = render_text_band(job.text, job.topic, width)
+    pic_ground = render_picture_band(job.images, width)
+    height_top = top.size[1]
+    height_text = text_ground.size[1]
+    height_pic = pic_ground.size[1]
+    height_bottom = bottom.size[1]
+    height_total = height_top + height_text + height_pic + height_bottom
+
+    final = Image.new("RGB", (width, height_total), (255, 255, 255))  # 前面计算需要多少高度，并准备好图片的四个部分（top/text/pic/bottom）
+    final.paste(top, box=(0, 0))
+    final.paste(text_ground, box=(0, height_top))
+    final.paste(pic_ground, box=(0, height_top + height_text), mask=pic_ground)
+    final.paste(bottom, box=(0, height_top + height_text + height_pic))
+    return final
+
+
+class RenderService(object):
+    """
+    在进程池中异步渲染预览图
+
+    同一个key（例如mail编号）上的请求会被合并：正在渲染时新到达的请求只保留最新的一个，
+    被覆盖的请求返回None，由调用方决定是否跳过发送。
+
+    每个工作进程各自持有一个单进程的进程池，同一个key总是交给同一个进程，
+    因此修改翻译后重新渲染时可以命中该进程里缓存的配图段、顶栏和底栏。
+
+    工作进程通过forkserver（不支持时用spawn）启动，不继承bot进程中的线程、锁和数据库连接。
+    """
+
+    def __init__(self, max_workers: int = 2):
+        self.max_workers = max(1, max_workers)
+        self._executors: List[Optional[ProcessPoolExecutor]] = [None] * self.max_workers
+        self._pending: Dict[Hashable, Tuple[RenderJob, asyncio.Future]] = {}
+        self._running: Dict[Hashable, asyncio.Task] = {}
+
+    def _shard(self, key: Hashable) -> int:
+        return hash(key) % self.max_workers
+
+    def _get_executor(self, key: Hashable) -> ProcessPoolExecutor:
+        shard = self._shard(key)
+        if self._executors[shard] is None:
+            method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            self._executors[shard] = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context(method))
+        return self._executors[shard]
+
+    async def render(self, key: Hashable, job: RenderJob) -> Optional[EncodedImage]:
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        if key in self._pending:
+            _, superseded = self._pending[key]
+            if not superseded.done():
+                superseded.set_result(None)
+        self._pending[key] = (job, fut)
+        if key not in self._running:
+            self._running[key] = loop.create_task(self._drain(key))
+        return await asyncio.shield(fut)
+
+    async def _drain(self, key: Hashable):
+        loop = asyncio.get_running_loop()
+        try:
+            while key in self._pending:
+                job, fut = self._pending.pop(key)
+                try:
+                    ret = await loop.run_in_executor(self._get_executor(key), render_preview, job)
+                except BrokenProcessPool as errmsg:
+                    self._executors[self._shard(key)] = None  # 工作进程异常退出时丢弃进程池，下次请求时重建
+                    if not fut.done():
+                        fut.set_exception(errmsg)
+                except Exception as errmsg:
+                    if not fut.done():
+                        fut.set_exception(errmsg)
+                else:
+                    if not fut.done():
+                        fut.set_result(ret)
+        finally:
+            self._running.pop(key, None)
+
+    def shutdown(self):
+        for i, executor in enumerate(self._executors):
+            if executor is not None:
+                executor.shutdown(wait=False)
+                self._executors[i] = None
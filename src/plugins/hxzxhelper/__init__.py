@@ -2,30 +2,39 @@ import asyncio
 import datetime
 import re
 import time
-from io import BytesIO
-from typing import List, Optional, Dict
+from typing import Optional
 
 import apscheduler.jobstores.base
 import nonebot
-from PIL import Image
-from aiohttp.client_exceptions import ServerDisconnectedError
+from aiohttp.client_exceptions import ClientError
 from bilibili_api import dynamic
 from bilibili_api.dynamic import BuildDynmaic
-from bilibili_api.utils.picture import Picture
-from bilibili_api.exceptions import ResponseCodeException
-from httpx import AsyncClient
+from bilibili_api.exceptions import NetworkException, ResponseCodeException
 from nonebot import on_command, on_startswith, on_message, get_driver
 from nonebot.adapters import Bot, Event
 from nonebot.adapters.cqhttp.event import GroupMessageEvent
 from nonebot.adapters.cqhttp.message import MessageSegment
 from nonebot.log import logger
 from nonebot.typing import T_State
+from PIL.Image import DecompressionBombError
 
+from .collector import CollectSession, ImageCollector
 from .config import Config
-from .data_source import blog_initial, get_blog_update, get_blog_manually
-from .data_source import mail_initial, get_mail_update, get_mail_list, restore_mail_time_manually
-from .data_source import tweet_initial, get_tweet_update, get_tweet_manually
-from .model import Mail, ParsedObject
+from .data_source import FeedItem, fetch_feed_media, make_mail
+from .dedupe import DedupeStore
+from .data_source import blog_initial, check_blog_update, get_blog_manually
+from .data_source import mail_initial, check_mail_update, get_mail_list, restore_mail_time_manually
+from .data_source import tweet_initial, check_tweet_update, get_tweet_manually
+from .lib.utils import get_image_if
+from .media import media
+from .model import Mail, renderer
+from .pipeline import Pipeline, Stage
+from .sender import GroupSender
+from .store import MailStore
+from .timeindex import parse_time
+from .tracing import EXPORT_INTERVAL, Span, tracer
+from .tracker import DynamicTracker
+from .uploader import PictureUploader
 
 global_config = nonebot.get_driver().config
 plugin_config = Config(**global_config.dict())
@@ -34,14 +43,21 @@ MASTERS = plugin_config.fansub_masters
 ADMINGROUPS = plugin_config.fansub_groups
 TIME_WAITBEFORESEND = plugin_config.time_waitbeforesend
 TIME_WAITFORIMAGES = plugin_config.time_waitforimages
+TIME_TRANSMATCHTOLERANCE = plugin_config.time_transmatchtolerance
+TIME_TRANSMATCHOFFSETS = plugin_config.time_transmatchoffsets
+TIME_MAILEXPIRE = plugin_config.time_mailexpire
 TIME_CHECKBLOGUPDATE = plugin_config.time_checkblogupdate
 TIME_CHECKTWIUPDATE = plugin_config.time_checktweetupdate
 TIME_CHECKMAILUPDATE = plugin_config.time_checkmailupdate
 
-mails_dict: Dict[str, Mail] = {}    # 缓存等待处理的mail，格式：{时间戳字符串：Mail}
-imagelist: List[BytesIO] = []
-mail_loadingimg: Optional[str] = ""  # 用于存储正在收集图片的mail的时间戳
+mails_dict = MailStore(plugin_config.data_dir, media.blobs)    # 持久化的待处理mail，用法同{时间戳字符串：Mail}
+dedupe = DedupeStore(plugin_config.data_dir, plugin_config.time_dedupeexpire * 60)  # 已推送过的博客、推特和Mail
 cred = plugin_config.bili_cred
+uploader = PictureUploader(cred, plugin_config.upload_concurrency, plugin_config.upload_retries)
+tracker = DynamicTracker(deadline=plugin_config.time_trackdynamic * 60)
+sender = GroupSender(rate=plugin_config.send_rate, burst=plugin_config.send_burst,
+                     concurrency=plugin_config.send_concurrency, retries=plugin_config.send_retries,
+                     forward_batch=plugin_config.forward_batch, linger=plugin_config.send_linger)
 push_group = 0
 scheduler = nonebot.require("nonebot_plugin_apscheduler").scheduler
 driver = get_driver()
@@ -56,6 +72,7 @@ async def initial():  # 初始化必须成功，否则第一次获取博客和
     else:
         logger.info("当前处于生产环境")
         push_group = 1
+    feeds.start()  # 先于各组件的初始化启动，初始化未完成或失败时检查到的更新也能进入流水线
     init_list = []
     init_str = ""
     if plugin_config.blog:
@@ -69,25 +86,23 @@ async def initial():  # 初始化必须成功，否则第一次获取博客和
         init_str += "Mail "
     await asyncio.gather(*init_list)
     logger.info(init_str + "自动更新组件初始化完毕")
+    now = time.time()
+    for mail in mails_dict.values():  # 恢复重启前已经安排的发送任务，过期的立即发送（发送失败的不会恢复）
+        if mail.stat == 3:
+            schedule_send(mail, mail.group_id, datetime.datetime.fromtimestamp(max(mail.send_at, now)))
+            logger.info(f"mail[{mail.no}]：已恢复发送任务")
 
 
-def parse_time(timestr: str) -> str:
-    year = re.search(r"\d{4}年", timestr)
-    month = re.search(r"\d{1,2}月", timestr)
-    day = re.search(r"\d{1,2}日", timestr)
-    hournminute = re.search(r"\d{1,2}([:：]\d{1,2}){1,2}", timestr)
-
-    if year and month and day and hournminute:
-        hournminute_str = hournminute.group()
-        hms = hournminute_str.split("：") if len(hournminute_str.split(":")) == 1 else hournminute_str.split(":")
-        if len(hms) < 3:
-            hms += ["0"] * (3 - len(hms))
-
-        tm = datetime.datetime(year=int(year.group()[:-1]), month=int(month.group()[:-1]), day=int(day.group()[:-1]),
-                               hour=int(hms[0]), minute=int(hms[1]), second=int(hms[2]))
-        return str(int(tm.timestamp()))
-    else:
-        raise ValueError("导入时间信息出错：年月日时分信息可能存在缺失")
+@driver.on_shutdown
+async def shutdown():
+    renderer.shutdown()
+    feeds.stop()
+    sender.shutdown()
+    collector.shutdown()
+    tracker.shutdown()
+    mails_dict.close()
+    dedupe.close()
+    await tracer.flush()
 
 
 async def checkifmastergroup(bot: Bot, event: Event, state: T_State) -> bool:
@@ -126,19 +141,26 @@ async def checkifnotsender(bot: Bot, event: Event, state: T_State):
         return False
 
 
+def _is_mail_image_size(size) -> bool:
+    width, height = size
+    return width == 960 or height == 1280 or height == 720
+
+
 async def checkifmailimage(bot: Bot, event: Event, state: T_State):
-    if mail_loadingimg is None:
+    if not collector:  # 没有正在收集配图的mail时不做任何处理
         return False
     if not isinstance(event, GroupMessageEvent) or not event.get_user_id() in SENDERS:
         return False
     msg = event.get_message()
     if len(msg) != 1 or msg[0].type != "image":
         return False
-    async with AsyncClient() as client:
-        img = await client.get(msg[0].data["url"])
-    img_check = Image.open(BytesIO(img.content))
-    if img_check.width == 960 or img_check.height == 1280 or img_check.height == 720:
-        state["img"] = img.content
+    session = collector.route(event.group_id, event.get_user_id(), event.reply.message_id if event.reply else None)
+    if session is None:
+        return False
+    img = await get_image_if(msg[0].data["url"], _is_mail_image_size, cache_key=msg[0].data["file"])
+    if img:
+        state["img"] = img
+        state["session"] = session
         return True
     else:
         return False
@@ -151,46 +173,72 @@ load_trans = on_startswith("时间", rule=checkifnotsender, priority=6)
 load_img = on_message(rule=checkifmailimage, priority=5)
 show_tasks = on_command("发送队列", rule=checkifmaster, priority=4)
 cancel_task = on_command("取消发送", rule=checkifmastergroup, priority=4)
+perf_stats = on_command("性能统计", rule=checkifmaster, priority=4)
+
 
+def schedule_send(mail: Mail, group_id: int, run_date: Optional[datetime.datetime] = None):
+    """
+    安排（或重新安排）b站动态的发送任务，发送时间和通知群会写入持久化队列，重启后据此恢复
+    """
+    if run_date is None:
+        run_date = datetime.datetime.now() + datetime.timedelta(minutes=TIME_WAITBEFORESEND)
+    mail.group_id = group_id
+    mail.send_at = run_date.timestamp()
+    mails_dict.save(mail)
+    scheduler.add_job(send2bili, trigger="date", run_date=run_date, args=(mail, group_id), id=str(mail.no),
+                      replace_existing=True)
+    uploader.preupload(mail)  # 图片此时已经确定，在等待期间提前上传
 
-async def send2bili(mail: Mail, event: GroupMessageEvent):
-    retry = 6
-    bot = nonebot.get_bot(str(event.self_id))
-    rsps = {}
+
+async def send2bili(mail: Mail, group_id: int):
     logger.info(f"正在发送b站动态，序号：{mail.no}，文字内容：{repr(mail.translation)}")
 
     # 适配新的bilibili-api-python接口
-    pictures = []
-    for image in mail.images:
-        pictures.append(await Picture.from_content(image, 'jpg').upload_file(cred))
-    logger.info(f"图片上传b站完成，共{len(pictures)}张图片")
     try:
+        pictures = await uploader.pictures(mail)
+        logger.info(f"图片上传b站完成，共{len(pictures)}张图片")
         dynTemp = BuildDynmaic()
         dynTemp.add_image(pictures)
         dynTemp.add_plain_text(f"{plugin_config.dynamic_topic}\n" + mail.translation)
-        sendrsps = await dynamic.send_dynamic(info=dynTemp,
-                                              credential=cred)
-        while retry:
-            try:
-                await asyncio.sleep(5)  # 等待几秒后再检查审核状态
-                print(sendrsps)
-                dy = dynamic.Dynamic(sendrsps["dyn_id"])
-                rsps = await dy.get_info()
-                logger.info(f"发送动态结果查询：{rsps}")
-                await bot.send(event, f"编号{mail.no}：b站已发")
-                logger.info(f"{mail.no}：发送成功（b站已发）")
-                mails_dict[mail.time].stat = 4
-                return
-            except ServerDisconnectedError as errmsg:
-                retry = retry - 1
-                if retry:
-                    logger.error(f"检查动态发送状态出错：{errmsg}, 第{6 - retry}次重试...")
-                continue
-        else:
-            logger.error("五次重试均失败，放弃状态检查")
-            await bot.send(event, f"编号{mail.no}：发送完毕（状态未知）")
+        with tracer.span("send_dynamic", mail.trace_id, mail.type or "mail", mail_no=mail.no):
+            sendrsps = await dynamic.send_dynamic(info=dynTemp,
+                                                  credential=cred)
     except ResponseCodeException as errmsg:
-        await bot.send(event, f"编号{mail.no}：发送失败，{errmsg}")
+        await send_failed(mail, group_id, f"发送失败，{errmsg}")
+        return
+    except (ClientError, NetworkException) as errmsg:
+        logger.error(f"mail[{mail.no}]：网络错误，发送失败：{errmsg!r}")
+        await send_failed(mail, group_id, f"发送失败（网络错误），{errmsg}")
+        return
+    except asyncio.TimeoutError:  # 图片上传重试次数用完
+        logger.error(f"mail[{mail.no}]：图片上传超时，发送失败")
+        await send_failed(mail, group_id, "发送失败（图片上传超时）")
+        return
+    except (OSError, DecompressionBombError) as errmsg:  # 读取图片或按b站限制重新编码失败
+        logger.exception(f"mail[{mail.no}]：图片处理失败，发送失败")
+        await send_failed(mail, group_id, f"发送失败（图片处理失败），{errmsg}")
+        return
+    logger.info(f"mail[{mail.no}]：动态已发出，{sendrsps}")
+    mail.stat = 4  # 动态已经发出，审核状态交给tracker在后台确认，避免重启后重复发送
+    uploader.discard(mail)
+    mails_dict.release_images(mail)  # 已发送的mail不再需要图片
+    tracker.watch(mail, sendrsps["dyn_id"], group_id)
+
+
+async def send_failed(mail: Mail, group_id: int, reason: str):
+    """
+    标记发送失败并通知群，失败的mail不再有计划发送时间，重启后不会被当作中断的发送任务恢复
+    """
+    mail.stat = 6
+    mail.send_at = 0.0
+    mails_dict.save(mail)
+    await nonebot.get_bot().send_group_msg(group_id=group_id, message=f"编号{mail.no}：{reason}")
+
+
+def queue_summary() -> str:
+    stats = mails_dict.stats()
+    return f"处理队列：{stats['mails']}条，文字占用内存{stats['bytes'] / 1024:.1f}KB，" \
+           f"图片{stats['images']}张（磁盘{stats['image_bytes'] / 1024 / 1024:.1f}MB）"
 
 
 @show_tasks.handle()
@@ -199,23 +247,26 @@ async def showmails(bot: Bot, event: GroupMessageEvent):
         for mail in mails_dict.values():
             await show_tasks.send(mail.info())
     else:
-        await show_tasks.finish("处理队列为空")
-    await show_tasks.finish()
+        await show_tasks.finish("处理队列为空\n" + tracker.summary())
+    await show_tasks.finish(queue_summary() + "\n" + tracker.summary())
+
+
+@perf_stats.handle()
+async def showperfstats(bot: Bot, event: GroupMessageEvent):
+    await perf_stats.finish(tracer.summary())
 
 
 @cancel_task.handle()
 async def canceltask(bot: Bot, event: GroupMessageEvent):
-    found = False
     arg = str(event.get_message()).strip(" ")
     if arg and arg.isdecimal():
         try:
-            for mail in mails_dict.copy().values():
-                if mail.no == int(arg):
-                    found = True
-                    mails_dict[mail.time].stat = 5
-                    break
-            if not found:
+            mail = mails_dict.get_by_no(int(arg))
+            if mail is None:
                 raise IndexError
+            mail.stat = 5
+            uploader.discard(mail)
+            mails_dict.release_images(mail)
             scheduler.remove_job(arg)
             await cancel_task.finish(f"编号{arg}：已取消")
         except IndexError:
@@ -228,41 +279,34 @@ async def canceltask(bot: Bot, event: GroupMessageEvent):
 
 @load_img.handle()
 async def loadimg(bot: Bot, event: GroupMessageEvent, state: T_State):
-    # msg = event.get_message()[0]
     if state["img"]:
-        imagelist.append(state["img"])
-        logger.info("成功缓存一张mail图片")
-        # await load_img.send("成功缓存一张mail图片")
-
-
-async def loadimg_finish(event: GroupMessageEvent):
-    global mail_loadingimg, imagelist
-    bot = nonebot.get_bot(str(event.self_id))
-    if mail_loadingimg:
-        index = mail_loadingimg
-        for img in imagelist:
-            mails_dict[index].images.append(img)
-        imagelist = []
-        logger.info(f"mail[{mails_dict[index].no}]：配图收集结束，共收集到{len(mails_dict[index].images)}张图片")
-        # await bot.send(event, f"mail[{maillist[index].no}]：图片收集完成")
-        if mails_dict[index].stat == 2:
-            mails_dict[index].stat = 3
-            scheduler.add_job(send2bili, trigger="date",
-                              run_date=datetime.datetime.now() + datetime.timedelta(minutes=TIME_WAITBEFORESEND),
-                              args=(mails_dict[index], event), id=str(mails_dict[index].no))
-            await bot.send(event, mails_dict[index].preview())
-        else:
-            mails_dict[index].stat = 1
-    mail_loadingimg = ""
-    return
+        state["session"].images.append(state["img"])
+        logger.info(f"成功缓存一张mail图片，mail时间戳：{state['session'].mail_time}")
+
+
+async def loadimg_finish(session: CollectSession):
+    bot = nonebot.get_bot()
+    mail = mails_dict.get(session.mail_time)
+    if mail is None:  # 收集期间mail已被移出队列
+        return
+    await mail.add_images(session.images)
+    logger.info(f"mail[{mail.no}]：配图收集结束，共收集到{len(mail.image_refs)}张图片")
+    if mail.stat == 2:
+        mail.stat = 3
+        schedule_send(mail, session.group_id)
+        preview = await mail.preview()
+        if preview:
+            await bot.send_group_msg(group_id=session.group_id, message=preview)
+    else:
+        mail.stat = 1
+        mails_dict.save(mail)
+
+
+collector = ImageCollector(TIME_WAITFORIMAGES * 60, loadimg_finish)
 
 
 @load_mail.handle()
 async def loadmail(bot: Bot, event: GroupMessageEvent, state: T_State):
-    global mail_loadingimg
-    if mail_loadingimg is not None:
-        scheduler.reschedule_job("loadimages", trigger=None)
-        await asyncio.sleep(2)
     mail = Mail()
     raw_msg = str(event.get_message())
     if raw_msg.find("\r\n") == -1:
@@ -276,11 +320,8 @@ async def loadmail(bot: Bot, event: GroupMessageEvent, state: T_State):
         await load_mail.finish()
     mail.raw_text = str(event.get_message()).strip(" ")
     mails_dict[mail.time] = mail
-    mail_loadingimg = mail.time
-    scheduler.add_job(loadimg_finish, trigger="date",
-                      run_date=datetime.datetime.now() + datetime.timedelta(minutes=TIME_WAITFORIMAGES),
-                      args=(event,), id="loadimages")
-    logger.info(f"mail[{mail.no}]：正在收集配图，时间{TIME_WAITFORIMAGES}分钟")
+    collector.open(mail.time, event.group_id, event.get_user_id(), event.message_id)
+    logger.info(f"mail[{mail.no}]：正在收集配图，时间{TIME_WAITFORIMAGES}分钟，同时收集中的mail共{len(collector)}条")
     # await load_mail.finish(f"mail[{mail.no}]：正在收集配图，时间{TIME_WAITFORIMAGES}分钟")
 
 
@@ -296,10 +337,16 @@ async def loadtrans(bot: Bot, event: GroupMessageEvent, state: T_State):
         firstlineend = raw_msg.find("\r\n")
     try:
         transtime = parse_time(raw_msg[:firstlineend])
-        if transtime in mails_dict:
-            targetmail = transtime
-        else:
+        mail = mails_dict.match(transtime, TIME_TRANSMATCHTOLERANCE * 60,
+                                [0] + [offset * 60 for offset in TIME_TRANSMATCHOFFSETS])
+        if mail is None:
             raise IndexError
+        targetmail = mail.time
+        if targetmail != transtime:  # 模糊匹配可能匹配到另一条mail，告知翻译者以便发现错误
+            logger.info(f"翻译时间与mail[{mail.no}]的时间不完全一致，按最接近的时间匹配")
+            mailtime = datetime.datetime.fromtimestamp(int(targetmail)).strftime("%Y年%m月%d日 %H:%M:%S")
+            await load_trans.send(f"翻译时间与队列中的内容不完全一致，已匹配到编号{mail.no}（时间{mailtime}），"
+                                  f"如果匹配错误请发送“取消发送 {mail.no}”")
     except ValueError as errmsg:
         logger.error(errmsg)
         await load_trans.finish(str(errmsg))
@@ -315,25 +362,84 @@ async def loadtrans(bot: Bot, event: GroupMessageEvent, state: T_State):
             logger.info(f"mail[{mails_dict[targetmail].no}]：翻译已覆盖")
             await load_trans.send(f"编号{mails_dict[targetmail].no}：已替换为新的翻译")
     mails_dict[targetmail].translation = raw_msg
+    mails_dict.save(mails_dict[targetmail])
     logger.info(f"mail[{mails_dict[targetmail].no}]：翻译已收集")
     # await load_trans.send(f"mail[{targetmail}]：翻译已收集")
-    if mails_dict[targetmail].stat == 1:
+    if mails_dict[targetmail].stat == 1 or mails_dict[targetmail].stat == 6:  # 发送失败后重新发送翻译即重新安排发送
         mails_dict[targetmail].stat = 3
-        scheduler.add_job(send2bili, trigger="date",
-                          run_date=datetime.datetime.now() + datetime.timedelta(minutes=TIME_WAITBEFORESEND),
-                          args=(mails_dict[targetmail], event), id=str(mails_dict[targetmail].no))
-        await load_trans.finish(mails_dict[targetmail].preview())
+        schedule_send(mails_dict[targetmail], event.group_id)
+        await load_trans.finish(await mails_dict[targetmail].preview())
     elif mails_dict[targetmail].stat == 3:
-        scheduler.reschedule_job(str(mails_dict[targetmail].no), trigger="date",
-                                 run_date=datetime.datetime.now() + datetime.timedelta(minutes=TIME_WAITBEFORESEND),
-                                 )
-        await load_trans.finish(mails_dict[targetmail].preview())
+        schedule_send(mails_dict[targetmail], event.group_id)
+        await load_trans.finish(await mails_dict[targetmail].preview())
     elif mails_dict[targetmail].stat == 4:
         await load_trans.finish("这条之前发过，我就不重发了")
     elif mails_dict[targetmail].stat == 5:
         await load_trans.finish("这条被取消过，交给人工来发吧")
     else:
         mails_dict[targetmail].stat = 2
+        mails_dict.save(mails_dict[targetmail])
+
+
+def _dedupe_key(item: FeedItem):
+    return item.kind, item.po.source_id, item.po.text + "\n" + "\n".join(item.po.images_url)
+
+
+async def parse_feed(item: FeedItem) -> Optional[FeedItem]:
+    with tracer.span("dedupe", item.id, item.kind):
+        if not item.redeliver and dedupe.seen(*_dedupe_key(item)):
+            logger.info(f"新{item.kind}之前已经推送过，跳过：{item.po.source_id}")
+            return None
+    return item
+
+
+async def build_feed(item: FeedItem) -> FeedItem:
+    with tracer.span("build", item.id, item.kind):
+        await _build_feed(item)
+    return item
+
+
+async def _build_feed(item: FeedItem):
+    images = await media.images(item.images)  # 图片内容已经下载到内存中，不再从媒体缓存读回
+    if item.kind == "blog":
+        item.messages.append(MessageSegment.text(item.po.text))
+        for cnt, image in enumerate(images, start=1):
+            item.messages.append(f"第{cnt}张图片" + image)
+        item.messages.append("我的博客更新啦ヾ(≧▽≦*)o，快来翻译")
+    else:
+        item.mail = await make_mail(item.po, item.images, item.kind)
+        while item.mail.time in mails_dict:  # 不同内容恰好在同一秒时顺延，避免覆盖队列中的另一条（翻译按最接近的时间匹配）
+            item.mail.time = str(int(item.mail.time) + 1)
+        mails_dict[item.mail.time] = item.mail
+        msg = MessageSegment.text(item.mail.raw_text)
+        for image in images:
+            msg += image
+        item.messages.append(msg)
+
+
+async def deliver_feed(item: FeedItem):
+    future = sender.post(ADMINGROUPS[push_group], item.messages)
+    start_ns, start = time.time_ns(), time.perf_counter()
+    future.add_done_callback(lambda f: _on_feed_sent(item, f, start_ns, start))
+
+
+def _on_feed_sent(item: FeedItem, future: asyncio.Future, start_ns: int, start: float):
+    if future.cancelled():
+        error = "cancelled"
+    else:
+        error = None if future.exception() is None else repr(future.exception())
+    tracer.record(Span("send", item.id, item.kind, start_ns, time.perf_counter() - start, error))  # 含限流和合并等待
+    if error is None:
+        dedupe.add(*_dedupe_key(item))  # 发送成功后才记录，下载或发送失败的内容下次检查时还会推送
+
+
+# 博客、推特和Mail更新的推送流水线：检查更新 -> 解析 -> 下载图片 -> 生成消息 -> 发送
+feeds = Pipeline("推送", [
+    Stage("解析", parse_feed),
+    Stage("下载图片", fetch_feed_media, workers=plugin_config.feed_fetch_workers, maxsize=plugin_config.feed_queue_size),
+    Stage("生成消息", build_feed, maxsize=plugin_config.feed_queue_size),
+    Stage("发送", deliver_feed, maxsize=plugin_config.feed_queue_size),
+])
 
 
 if plugin_config.blog:
@@ -360,19 +466,11 @@ if plugin_config.blog:
 
     @scheduler.scheduled_job('cron', id='update_blog', hour="7-23", minute=f"*/{TIME_CHECKBLOGUPDATE}")
     async def pushblog():
-        blog = await get_blog_update()
-
-        if blog:
-            bot = nonebot.get_bot()
+        with tracer.span("poll", "latest", "blog"):
+            po = await check_blog_update()
 
-            await bot.send_group_msg(group_id=ADMINGROUPS[push_group], message=blog[0])
-            if len(blog) > 1:
-                cnt = 0
-                for img in blog[1:]:
-                    if img:
-                        cnt += 1
-                        await bot.send_group_msg(group_id=ADMINGROUPS[push_group], message=f"第{cnt}张图片" + img)
-            await bot.send_group_msg(group_id=ADMINGROUPS[push_group], message="我的博客更新啦ヾ(≧▽≦*)o，快来翻译")
+        if po:
+            await feeds.put(FeedItem("blog", po))
         else:
             logger.debug(f"没有检查到博客更新")
 
@@ -390,9 +488,8 @@ if plugin_config.tweet:
                         mails_dict[mail.time] = mail
 
                     t = MessageSegment.text(mail.raw_text)
-                    if mail.images:
-                        for image in mail.images:
-                            t += MessageSegment.image(image)
+                    for digest in mail.image_refs:
+                        t += media.image_ref(digest)
                     await get_twi.send(t)
             await get_twi.finish()
         except ValueError as errmsg:
@@ -401,51 +498,27 @@ if plugin_config.tweet:
 
     @scheduler.scheduled_job('cron', id='update_twi', hour="7-23", minute=f"*/{TIME_CHECKTWIUPDATE}")
     async def pushtweet():
-        tweet_mails = await get_tweet_update()
-
-        if tweet_mails:
-            bot = nonebot.get_bot()
+        with tracer.span("poll", "latest", "tweet"):
+            pos = await check_tweet_update()
 
-            for mail in tweet_mails:
-                if mail.time not in mails_dict:
-                    mails_dict[mail.time] = mail
-
-                    t = MessageSegment.text(mail.raw_text)
-                    if mail.images:
-                        for image in mail.images:
-                            t += MessageSegment.image(image)
-                    await bot.send_group_msg(group_id=ADMINGROUPS[push_group], message=t)
-                else:
-                    logger.info("新Tweet已在列表中，跳过")
+        if pos:
+            for po in pos:
+                await feeds.put(FeedItem("tweet", po))
         else:
             logger.debug(f"没有检查到推特更新")
 
 if plugin_config.mail:
     @scheduler.scheduled_job('cron', id='update_mail', hour="7-23", minute=f"*/{TIME_CHECKMAILUPDATE}")
     async def pushmail():
-        _new_mails = await get_mail_update()
-
-        if _new_mails:
-            for new_mail in _new_mails:
-                if new_mail.time in mails_dict:
-                    logger.info("新Mail已在列表中，跳过")
-                    continue
-                mails_dict[new_mail.time] = new_mail
-                bot = nonebot.get_bot()
-
-                # await bot.send_group_msg(group_id=ADMINGROUPS[push_group], message=new_mail.raw_text)
-                # if new_mail.images:
-                #     for image in new_mail.images:
-                #         await bot.send_group_msg(group_id=ADMINGROUPS[push_group],
-                #                                  message=MessageSegment.image(image))
-                msg = MessageSegment.text(new_mail.raw_text)
-                if new_mail.images:
-                    for image in new_mail.images:
-                        msg += MessageSegment.image(image)
-                await bot.send_group_msg(group_id=ADMINGROUPS[push_group], message=msg)
+        with tracer.span("poll", "latest", "mail"):
+            pos = await check_mail_update()
+
+        if pos:
+            for po in pos:
+                await feeds.put(FeedItem("mail", po))
         else:
             logger.debug(f"没有检查到Mail更新")
-    
+
 
     restore_mail = on_command("恢复邮件", rule=checkifmaster, priority=4)
 
@@ -476,21 +549,33 @@ if plugin_config.mail:
         ans = str(event.get_message()).strip(" ")
         if ans in [str(i) for i in range(1, min(5, state["list_len"]))]:
             await restore_mail_time_manually(state["timestamps"][int(ans)])
-            global mails_dict
-            for timestp in state["timestamps"]:
+            for timestp in state["timestamps"][:int(ans)]:
                 if timestp in mails_dict:
                     mails_dict.pop(timestp)
-            
-            await restore_mail.finish("已恢复，下次推送时生效")
+            pos = await check_mail_update()  # 立即重新获取，这些mail之前推送过，需要跳过去重
+            for po in pos or []:
+                await feeds.put(FeedItem("mail", po, redeliver=True))
+            if pos:
+                await restore_mail.finish(f"已恢复{len(pos)}篇Mail，正在重新推送")
+            else:
+                await restore_mail.finish("没有获取到需要恢复的Mail")
         else:
             await restore_mail.finish("回复的序号超出可指定范围")
 
 
 @scheduler.scheduled_job('cron', id='clean_mail', hour="3")
 async def cleanmaildict():
-    global mails_dict
-    now = int(time.time())
-    for timestamp in mails_dict.copy().keys():
-        if now - int(timestamp) > 3 * 24 * 60 * 60:
-            mails_dict.pop(timestamp)
-    logger.warning("列表中超过三天的mail和tweet已经清除")
+    media.clean(TIME_MAILEXPIRE * 60, keep=mails_dict.image_refs())
+    dedupe.expire()
+
+
+@scheduler.scheduled_job('interval', id='flush_trace', seconds=EXPORT_INTERVAL)
+async def flushtrace():
+    await tracer.flush()
+
+
+@scheduler.scheduled_job('interval', id='expire_mail', minutes=1)
+async def expiremails():
+    for mail in mails_dict.expire(TIME_MAILEXPIRE * 60):  # 只检查有序索引开头已经过期的部分
+        uploader.discard(mail)
+        logger.info(f"mail[{mail.no}]：超过保留时间，已移出队列")
@@ -0,0 +1,42 @@
+import hashlib
+from pathlib import Path
+from typing import Iterable, List
+
+
+class BlobStore(object):
+    """
+    按内容摘要存放图片等二进制数据的目录，同样的数据只写入一次
+    """
+
+    def __init__(self, root: Path):
+        self.root = root
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def digest(data: bytes) -> str:
+        return hashlib.sha256(data).hexdigest()
+
+    def path(self, digest: str) -> Path:
+        return self.root / digest[:2] / digest
+
+    def put(self, data: bytes) -> str:
+        digest = self.digest(data)
+        path = self.path(digest)
+        if not path.exists():
+            path.parent.mkdir(exist_ok=True)
+            tmp = path.with_suffix(".tmp")
+            tmp.write_bytes(data)
+            tmp.replace(path)  # 先写临时文件再改名，避免中途退出时留下不完整的文件
+        return digest
+
+    def put_all(self, items: Iterable[bytes]) -> List[str]:
+        return [self.put(data) for data in items]
+
+    def get(self, digest: str) -> bytes:
+        return self.path(digest).read_bytes()
+
+    def remove(self, digest: str):
+        try:
+            self.path(digest).unlink()
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,98 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from nonebot.log import logger
+
+
+class CollectSession(object):
+    """
+    一条mail的配图收集会话
+    """
+
+    def __init__(self, mail_time: str, group_id: int, user_id: str, message_id: int):
+        self.mail_time = mail_time
+        self.group_id = group_id
+        self.user_id = user_id
+        self.message_id = message_id  # “时间…”消息的id，回复这条消息的图片会归入本会话
+        self.images: List[bytes] = []
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+
+class ImageCollector(object):
+    """
+    同时为多条mail收集配图，每条mail一个会话，各自计时，互不影响
+
+    图片按以下顺序归入会话：
+    1. 图片消息回复了某条“时间…”消息时，归入该消息对应的会话；
+    2. 否则归入同一群中同一发送者最新开启的会话。
+    会话开启timeout秒后结束，结束时调用on_finish(session)。
+    """
+
+    def __init__(self, timeout: float, on_finish: Callable[[CollectSession], Awaitable]):
+        self.timeout = timeout
+        self.on_finish = on_finish
+        self._sessions: Dict[str, CollectSession] = {}  # {mail时间戳: 会话}
+        self._by_message: Dict[int, str] = {}  # {“时间…”消息id: mail时间戳}
+        self._latest: Dict[Tuple[int, str], str] = {}  # {(群号, 发送者): 最新会话的mail时间戳}
+
+    def __bool__(self):
+        return bool(self._sessions)
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def open(self, mail_time: str, group_id: int, user_id: str, message_id: int) -> CollectSession:
+        """
+        为mail开启收集会话；同一条mail已有会话时沿用已收集的图片并重新计时，会话改归本次的群和发送者
+        """
+        session = self._sessions.get(mail_time)
+        if session is None:
+            session = CollectSession(mail_time, group_id, user_id, message_id)
+            self._sessions[mail_time] = session
+        else:
+            session.timer.cancel()
+            self._by_message.pop(session.message_id, None)  # 只有最新的“时间…”消息可以被回复归入
+            old_key = (session.group_id, session.user_id)
+            if self._latest.get(old_key) == mail_time:
+                del self._latest[old_key]  # 原发送者之后发的图片不再归入本会话
+            session.group_id = group_id
+            session.user_id = user_id
+            session.message_id = message_id
+        self._by_message[message_id] = mail_time
+        self._latest[(group_id, user_id)] = mail_time
+        session.timer = asyncio.get_event_loop().call_later(
+            self.timeout, lambda: asyncio.ensure_future(self.finish(mail_time)))
+        return session
+
+    def route(self, group_id: int, user_id: str, reply_id: Optional[int] = None) -> Optional[CollectSession]:
+        """
+        找到一张图片应当归入的会话，没有合适的会话时返回None
+        """
+        if reply_id is not None and reply_id in self._by_message:
+            return self._sessions.get(self._by_message[reply_id])
+        mail_time = self._latest.get((group_id, user_id))
+        return self._sessions.get(mail_time) if mail_time is not None else None
+
+    async def finish(self, mail_time: str):
+        """
+        结束会话（计时到期时自动调用）
+        """
+        session = self._sessions.pop(mail_time, None)
+        if session is None:
+            return
+        session.timer.cancel()
+        self._by_message.pop(session.message_id, None)
+        key = (session.group_id, session.user_id)
+        if self._latest.get(key) == mail_time:
+            del self._latest[key]
+        try:
+            await self.on_finish(session)
+        except Exception:
+            logger.exception(f"处理配图收集结果时出错，mail时间戳：{mail_time}")
+
+    def shutdown(self):
+        for session in self._sessions.values():
+            session.timer.cancel()
+        self._sessions.clear()
+        self._by_message.clear()
+        self._latest.clear()
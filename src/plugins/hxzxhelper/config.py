@@ -11,6 +11,24 @@ class Config(BaseSettings):
     fansub_groups: Tuple[int, ...] = (0,)  # 0号位群组用于debug时的推送，默认设置为0
     proxies: Optional[Union[AnyUrl, Dict[str, AnyUrl]]]
     debug: bool = False
+    data_dir: str = "data/hxzxhelper"  # 持久化队列和图片的存放目录
+    feed_fetch_workers: int = 4  # 推送流水线中同时下载图片的内容数
+    feed_queue_size: int = 16  # 推送流水线各阶段之间队列的容量
+    time_dedupeexpire: int = 30 * 24 * 60  # 已推送内容的去重记录保留时间
+    # 消息中图片的发送方式："base64"（默认，总是可用）、"file"（file://路径，go-cqhttp必须能以相同路径访问DATA_DIR，
+    # 例如两个容器挂载同一个volume）或"http"（由bot提供的链接，需要把MEDIA_BASE_URL设为go-cqhttp能访问的地址）
+    media_mode: str = "base64"
+    media_base_url: str = ""  # "http"方式下go-cqhttp访问图片的地址前缀，留空时使用HOST和PORT（只适用于同一台机器）
+    trace_buffer: int = 2000  # 保留最近多少个性能追踪span
+    trace_export: str = ""  # 以OTLP-JSON格式导出span的文件路径，留空时不导出
+
+    # 推送消息发送（限流单位为条/秒）
+    send_rate: float = 1  # 每个群平均每秒发送的消息数
+    send_burst: int = 5  # 每个群允许的突发消息数
+    send_concurrency: int = 2  # 同时进行的发送请求数
+    send_retries: int = 3  # 消息被限流拒绝后的重试次数（其他失败不重试）
+    send_linger: float = 2  # 推送在发送前等待合并的秒数
+    forward_batch: int = 0  # 一批推送达到该条数时每该条数合并为一条合并转发消息，0表示不合并
 
     # 时间设置中的单位均为分钟
 
@@ -20,18 +38,31 @@ class Config(BaseSettings):
     mail_recv_addr: EmailStr = ""
     mail_recv_pwd: SecretStr = ""
     pop3_server: str = "pop.qq.com"
+    pop3_port: int = 0  # 为0时使用默认端口（SSL为995，否则为110）
+    pop3_ssl: bool = True
     moni_addrs: Tuple[EmailStr, ...] = ("",)
 
     # 官方博客推送功能
     blog: bool = False
     time_checkblogupdate: int = 10
     member_abbr: str = "haruka.kaki"
+    blog_base_url: str = "https://blog.nogizaka46.com"
 
     # B站发送动态功能（部分字段请参考bilibili_api）
     time_waitbeforesend: int = 10
     time_waitforimages: int = 2
+    time_transmatchtolerance: int = 1  # 翻译与mail的时间允许相差的分钟数
+    time_transmatchoffsets: Tuple[int, ...] = ()  # 按原时间匹配不到时依次尝试的额外偏移（如时区差60, -60），默认不尝试
+    time_mailexpire: int = 3 * 24 * 60  # mail和推文在处理队列中的保留时间
     dynamic_topic: str = "#贺喜遥香#"
     bili_cred: Union[Credential, Dict[str, str]] = {"sessdata": "", "bili_jct": "", "buvid3": "", "dedeuserid": ""}
+    upload_concurrency: int = 3  # 同时上传的图片数
+    upload_retries: int = 3  # 单张图片上传失败后的重试次数
+    time_trackdynamic: int = 10  # 动态发出后确认其状态的最长时间
+
+    # 发送预览渲染
+    render_workers: int = 2  # 渲染进程池的进程数
+    preview_preset: str = "preview"  # 预览图编码预设，"preview"（JPEG）或"preview_webp"
 
     # 官方推特推送功能（部分字段请参考Twitter API）
     tweet: bool = False
@@ -39,6 +70,7 @@ class Config(BaseSettings):
     tweet_moni_keywords: Tuple[str, ...] = ("賀喜遥香",)
     tweet_bearer_token: str = ""
     tweet_headers: Dict[str, str] = {}
+    tweet_api_base: str = "https://api.twitter.com/2"
 
     @validator("bili_cred")
     def cred_parser(cls, v):
@@ -48,6 +80,18 @@ class Config(BaseSettings):
             else:
                 raise ValueError('must contain "sessdata", "bili_jct" and "buvid3"')
 
+    @validator("send_rate")
+    def send_rate_positive(cls, v):
+        if v <= 0:
+            raise ValueError("must be greater than 0")
+        return v
+
+    @validator("send_burst")
+    def send_burst_positive(cls, v):
+        if v < 1:
+            raise ValueError("must be at least 1")
+        return v
+
     def __init__(self, **data):
         super().__init__(**data)
         if isinstance(self.proxies, AnyUrl):
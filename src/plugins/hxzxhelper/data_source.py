@@ -1,5 +1,5 @@
 import asyncio
-from typing import Tuple, List, Union
+from typing import Tuple, List, Union, Optional
 
 import nonebot
 from nonebot.adapters.cqhttp.message import Message, MessageSegment
@@ -10,7 +10,9 @@ from .lib.blog import check_blog_update, get_blog_f, blog_initial
 from .lib.mail import check_mail_update, mail_initial, restore_mail_time, get_mail_list, restore_mail_time_manually
 from .lib.twitter import check_tweet_update, get_tweets_f, tweet_initial, restore_tweet_id
 from .lib.utils import get_advanced
+from .media import media
 from .model import ParsedObject, Mail
+from .tracing import tracer
 
 global_config = nonebot.get_driver().config
 plugin_config = Config(**global_config.dict())
@@ -37,11 +39,22 @@ async def parse_po2msg(po: ParsedObject) -> MessageSegment:
         imgs = await asyncio.gather(*img_tasks)
         if None in imgs:
             raise ValueError("没有完整地下载到图片")
-        img_msgs = [MessageSegment.image(img) for img in imgs]
+        img_msgs = [media.image(img) for img in imgs]
         msg += img_msgs
     return msg
 
 
+async def make_mail(po: ParsedObject, imgs: List[bytes], mail_type: str) -> Mail:
+    m = Mail()
+    m.raw_text = po.text
+    await m.set_images(imgs)
+    m.time = po.timestamp
+    m.stat = 1
+    m.type = mail_type
+    m.trace_id = po.trace_id
+    return m
+
+
 async def parse_po2mail(po: ParsedObject, mail_type: str) -> Mail:
     imgs = []
     if po.images_url:
@@ -54,21 +67,50 @@ async def parse_po2mail(po: ParsedObject, mail_type: str) -> Mail:
             if mail_type == "mail":
                 await restore_mail_time()
             raise ValueError("没有完整地下载到图片")
+    return await make_mail(po, imgs, mail_type)
 
-    m = Mail()
-    m.raw_text = po.text
-    m.images = imgs
-    m.time = po.timestamp
-    m.stat = 1
-    m.type = mail_type
-    return m
 
+class FeedItem(object):
+    """
+    推送流水线中的一项内容（一篇博客、一条推文或一封mail）
+    """
 
-async def get_blog_update() -> Union[Message, MessageSegment]:
-    po = await check_blog_update()
-    if po:
-        msg = await parse_po2msg(po)
-        return msg
+    def __init__(self, kind: str, po: ParsedObject, redeliver: bool = False):
+        self.kind = kind  # "blog" "tweet" "mail"
+        self.po = po
+        self.redeliver = redeliver  # 手动恢复的内容，不检查是否已经推送过
+        self.images: List[bytes] = []
+        self.mail: Optional[Mail] = None
+        self.messages: List[Union[Message, MessageSegment, str]] = []  # 按顺序发送的消息
+
+    @property
+    def id(self) -> str:
+        return self.po.trace_id
+
+    def __repr__(self):
+        return f"<FeedItem {self.kind} {self.id}>"
+
+
+async def _download_feed_image(item: FeedItem, index: int, url: str) -> bytes:
+    with tracer.span("download", item.id, item.kind, index=index, url=url):
+        return await _download_image(url)
+
+
+async def fetch_feed_media(item: FeedItem) -> FeedItem:
+    """
+    推送流水线的下载阶段：下载一项内容的全部图片，失败时恢复更新检查的进度，下次检查时重新获取
+    """
+    try:
+        item.images = list(await asyncio.gather(*[_download_feed_image(item, i, url)
+                                                  for i, url in enumerate(item.po.images_url)]))
+    except ValueError:
+        logger.error(f"没有完整地下载到图片：{item!r}")
+        if item.kind == "tweet":
+            await restore_tweet_id()
+        if item.kind == "mail":
+            await restore_mail_time()
+        raise
+    return item
 
 
 async def get_blog_manually() -> Union[Message, MessageSegment]:
@@ -78,27 +120,6 @@ async def get_blog_manually() -> Union[Message, MessageSegment]:
         return msg
 
 
-async def get_mail_update() -> List[Mail]:
-    pos = await check_mail_update()
-    if pos:
-        mails = []
-        for po in pos:
-            m = await parse_po2mail(po, "mail")
-            mails.append(m)
-        return mails
-
-
-async def get_tweet_update() -> List[Mail]:
-    pos = await check_tweet_update()
-    if pos:
-        tweet_mails = []
-        for po in pos:
-            tweet_mails.append(await parse_po2mail(po, "tweet"))
-        return tweet_mails
-    else:
-        return []
-
-
 async def get_tweet_manually() -> List[Mail]:
     pos = await get_tweets_f()
     if pos:
@@ -0,0 +1,96 @@
+import hashlib
+import math
+import sqlite3
+import time
+from pathlib import Path
+from typing import Iterable, Optional
+
+from nonebot.log import logger
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS seen (
+    key BLOB PRIMARY KEY,
+    seen_at REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS seen_at ON seen (seen_at);
+"""
+
+
+class BloomFilter(object):
+    """
+    内存中的Bloom过滤器，判断“不存在”时结果确定，判断“可能存在”时需要再查询磁盘上的集合
+    """
+
+    def __init__(self, capacity: int, error_rate: float = 0.01):
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key: bytes) -> Iterable[int]:
+        digest = hashlib.blake2b(key, digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, key: bytes):
+        for pos in self._positions(key):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, key: bytes) -> bool:
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+
+class DedupeStore(object):
+    """
+    跨来源的持久化去重集合
+
+    每项内容的键由 来源 + 来源中的稳定id（推文id、邮件Message-ID、博客条目id）+ 内容摘要 计算得到，
+    只保存16字节的摘要；查询时先经过内存中的Bloom过滤器，绝大多数新内容不需要访问磁盘。
+    超过expire秒的记录由expire()清除，重启后从磁盘恢复。
+    """
+
+    def __init__(self, data_dir: str, expire: float, capacity: int = 100000):
+        root = Path(data_dir)
+        root.mkdir(parents=True, exist_ok=True)
+        self.expire_after = expire
+        self.capacity = capacity
+        self.conn = sqlite3.connect(str(root / "seen.db"), check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(_SCHEMA)
+        self.expire()
+
+    @staticmethod
+    def make_key(source: str, stable_id: Optional[str], content: str) -> bytes:
+        h = hashlib.blake2b(digest_size=16)
+        for part in (source, stable_id or "", hashlib.blake2b(content.encode()).hexdigest()):
+            h.update(part.encode())
+            h.update(b"\0")
+        return h.digest()
+
+    def __contains__(self, key: bytes) -> bool:
+        if key not in self._bloom:
+            return False
+        return self.conn.execute("SELECT 1 FROM seen WHERE key = ?", (key,)).fetchone() is not None
+
+    def seen(self, source: str, stable_id: Optional[str], content: str) -> bool:
+        return self.make_key(source, stable_id, content) in self
+
+    def add(self, source: str, stable_id: Optional[str], content: str):
+        key = self.make_key(source, stable_id, content)
+        self.conn.execute("INSERT OR REPLACE INTO seen (key, seen_at) VALUES (?, ?)", (key, time.time()))
+        self._bloom.add(key)
+
+    def expire(self):
+        """
+        清除过期的记录并重建Bloom过滤器（Bloom过滤器不支持删除）
+        """
+        deleted = self.conn.execute("DELETE FROM seen WHERE seen_at < ?", (time.time() - self.expire_after,)).rowcount
+        count = self.conn.execute("SELECT COUNT(*) FROM seen").fetchone()[0]
+        self._bloom = BloomFilter(max(self.capacity, count * 2))
+        for key, in self.conn.execute("SELECT key FROM seen"):
+            self._bloom.add(key)
+        logger.info(f"去重记录：清除过期{deleted}条，保留{count}条")
+
+    def close(self):
+        self.conn.close()
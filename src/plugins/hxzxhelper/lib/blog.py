@@ -26,6 +26,7 @@ def parse_blog(blog: Union[bytes, str]) -> ParsedObject:
     date = tree.xpath('//ns:entry[1]/ns:published/text()', namespaces=ns)[0]
     title = tree.xpath('//ns:entry[1]/ns:title/text()', namespaces=ns)[0]
     entry1 = tree.xpath('//ns:entry[1]/ns:content/text()', namespaces=ns)[0]  # XPath中列表下标从1开始
+    entry_id = tree.xpath('//ns:entry[1]/ns:id/text()', namespaces=ns)
 
     text = f"日期：{date[:10]}\n" \
            f"标题：{title}\n"
@@ -46,7 +47,7 @@ def parse_blog(blog: Union[bytes, str]) -> ParsedObject:
         if element.tag == "br":
             text += "\n" if text[-1] == "\n" else "\n\n"
     text = re.sub(r"^\s*", "", text).strip("\n")
-    return ParsedObject(text=text, images_url=images)
+    return ParsedObject(text=text, images_url=images, source_id=entry_id[0] if entry_id else date)
 
 
 def parse_blog_time(blog: Union[bytes, str]) -> datetime.datetime:
@@ -57,7 +58,7 @@ def parse_blog_time(blog: Union[bytes, str]) -> datetime.datetime:
 
 
 async def download_latest_blog() -> bytes:
-    ret = await get_advanced(f"https://blog.nogizaka46.com/{plugin_config.member_abbr}/atom.xml")
+    ret = await get_advanced(f"{plugin_config.blog_base_url.rstrip('/')}/{plugin_config.member_abbr}/atom.xml")
     if ret:
         return ret.content
     else:
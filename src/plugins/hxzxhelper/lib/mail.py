@@ -27,6 +27,8 @@ _last_mail_time = ""
 EMAIL_ADDR = plugin_config.mail_recv_addr
 PASSWORD = plugin_config.mail_recv_pwd.get_secret_value()
 POP3_SERVER = plugin_config.pop3_server
+POP3_PORT = plugin_config.pop3_port
+POP3_SSL = plugin_config.pop3_ssl
 MONI_ADDRS = plugin_config.moni_addrs
 
 
@@ -105,13 +107,21 @@ async def download_mail_images(imgs_url: List[str]) -> Tuple[bytes, ...]:
         return imgs
 
 
+def _pop3_login() -> poplib.POP3:
+    if POP3_SSL:
+        server = poplib.POP3_SSL(POP3_SERVER, POP3_PORT or poplib.POP3_SSL_PORT)
+    else:
+        server = poplib.POP3(POP3_SERVER, POP3_PORT or poplib.POP3_PORT)
+    server.user(EMAIL_ADDR)
+    server.pass_(PASSWORD)
+    return server
+
+
 @run_sync
 def get_latest_mail() -> Tuple[str, List[ParsedObject]]:
     global newest_mail_time
     # 连接到POP3服务器:
-    server = poplib.POP3_SSL(POP3_SERVER)
-    server.user(EMAIL_ADDR)
-    server.pass_(PASSWORD)
+    server = _pop3_login()
 
     resp, mails, octets = server.list()
     index = len(mails)
@@ -143,6 +153,7 @@ def get_latest_mail() -> Tuple[str, List[ParsedObject]]:
             po = parse_mail_content(rawcontent)
             po.text = f"{tim}\n{subj}\n" + po.text
             po.timestamp = timstp
+            po.source_id = msg.get("Message-ID", "").strip() or timstp
             new_mails.append(po)
         else:
             if timstp <= newest_mail_time:
@@ -183,9 +194,7 @@ def get_mail_list() -> List[ParsedObject]:
     """
     global newest_mail_time
     # 连接到POP3服务器:
-    server = poplib.POP3_SSL(POP3_SERVER)
-    server.user(EMAIL_ADDR)
-    server.pass_(PASSWORD)
+    server = _pop3_login()
 
     _, mails, _ = server.list()
     index = len(mails)
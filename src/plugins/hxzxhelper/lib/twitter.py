@@ -8,13 +8,14 @@ from pydantic import BaseModel
 from .utils import get_advanced
 from ..config import Config
 from ..model import ParsedObject
+from ..tracing import tracer
 
 global_config = nonebot.get_driver().config
 plugin_config = Config(**global_config.dict())
 time_parser = parser()
 
-RECENT_TWEET_URL = "https://api.twitter.com/2/tweets/search/recent"
-GET_TWEET_URL = "https://api.twitter.com/2/tweets"
+RECENT_TWEET_URL = plugin_config.tweet_api_base.rstrip("/") + "/tweets/search/recent"
+GET_TWEET_URL = plugin_config.tweet_api_base.rstrip("/") + "/tweets"
 
 newest_twi_id = ""
 _last_newest_twi_id = ""
@@ -100,7 +101,7 @@ async def _download_latest_tweet(topic_keyword: str, update=False) -> TweetAPI:
               }
     if newest_twi_id and update:
         params.update({"since_id": newest_twi_id})
-    ret = await get_advanced("https://api.twitter.com/2/tweets/search/recent",
+    ret = await get_advanced(RECENT_TWEET_URL,
                              params=params, proxies=plugin_config.proxies, headers=plugin_config.tweet_headers)
     if ret:
         return TweetAPI.parse_raw(ret.text)
@@ -169,7 +170,8 @@ async def parse_tweet(t: TweetAPI) -> Tuple[str, List[ParsedObject]]:
             twi_users.append(tweet.author_id)
 
     if twi_refer:
-        tt = await get_refer_tweet(",".join(twi_refer))
+        with tracer.span("refer_fetch", ",".join(twi_refer), "tweet"):
+            tt = await get_refer_tweet(",".join(twi_refer))
         if tt.includes.media:
             for media in tt.includes.media:
                 if media.media_key not in twi_images:
@@ -205,7 +207,8 @@ async def parse_tweet(t: TweetAPI) -> Tuple[str, List[ParsedObject]]:
                     else:
                         url = twi_images[media_key].preview_image_url
                     urls.append(url)
-            po = ParsedObject(text=text, images_url=urls, timestamp=str(int(tweet_time.timestamp())))
+            po = ParsedObject(text=text, images_url=urls, timestamp=str(int(tweet_time.timestamp())),
+                              source_id=tweet.id)
             msgs.append(po)
             logger.debug(f"处理过的的推文：{po}")
 
@@ -1,10 +1,18 @@
 import asyncio
-from typing import Union
+from io import BytesIO
+from typing import Callable, Optional, Tuple, Union
 
 import httpx
+from PIL import Image
 from httpx import AsyncClient
 from nonebot.log import logger
 
+from src.plugins._hxzxlib.cache import LRUCache
+
+IMAGE_SIZE_CACHE_SIZE = 512
+_image_size_cache = LRUCache(IMAGE_SIZE_CACHE_SIZE)  # {缓存键（如go-cqhttp的file）: (宽, 高)}
+IMAGE_SIZE_PROBE_LIMIT = 256 * 1024  # 只在开头这么多字节内尝试解析宽高，超过后等下载完再解析一次
+
 
 async def get_advanced(url: str, params=None, headers=None, proxies=None) -> Union[None, httpx.Response]:
     """
@@ -42,3 +50,68 @@ async def get_advanced(url: str, params=None, headers=None, proxies=None) -> Uni
         else:
             logger.error(f"所有Get尝试均失败，返回None, url='{url}'")
             return None
+
+
+async def get_image_if(url: str, predicate: Callable[[Tuple[int, int]], bool],
+                       cache_key: Optional[str] = None, proxies=None) -> Optional[bytes]:
+    """
+        流式下载图片，只读取足以解析出宽高的开头部分：尺寸不满足predicate时立即断开连接，
+        满足时继续下载并返回完整的图片数据，调用方不需要再次下载。
+
+        解析出的尺寸按cache_key缓存，已知不满足条件的图片不会再发起请求。
+
+    :param url:
+    :param predicate: 接收(宽, 高)，返回是否需要这张图片
+    :param cache_key: 用于缓存尺寸的键，例如go-cqhttp消息段中的file
+    :param proxies:
+    :return: None or 完整的图片数据
+    """
+    size = _image_size_cache.get(cache_key) if cache_key else None
+    if size is not None and not predicate(size):
+        return None
+    probing = size is None
+    chunks = []
+    received = 0
+    try:
+        async with AsyncClient(proxies=proxies) as client:
+            async with client.stream("GET", url) as ret:
+                ret.raise_for_status()
+                async for chunk in ret.aiter_bytes():
+                    chunks.append(chunk)
+                    received += len(chunk)
+                    if not probing:
+                        continue
+                    probing = received < IMAGE_SIZE_PROBE_LIMIT
+                    size = _probe_size(b"".join(chunks))
+                    if size is None:
+                        continue
+                    probing = False
+                    if cache_key:
+                        _image_size_cache.put(cache_key, size)
+                    if not predicate(size):
+                        return None
+    except httpx.HTTPError as errmsg:
+        logger.warning(f"图片下载失败：{errmsg}, url='{url}'")
+        return None
+    data = b"".join(chunks)
+    if size is None:
+        size = _probe_size(data)
+        if size is None:
+            logger.warning(f"无法识别图片尺寸, url='{url}'")
+            return None
+        if cache_key:
+            _image_size_cache.put(cache_key, size)
+        if not predicate(size):
+            return None
+    return data
+
+
+def _probe_size(data: bytes) -> Optional[Tuple[int, int]]:
+    """
+    只读取文件头解析宽高，不解码像素；数据还不足以解析出宽高时返回None
+    """
+    try:
+        with Image.open(BytesIO(data)) as image:
+            return image.size
+    except (OSError, EOFError, SyntaxError, ValueError):
+        return None
@@ -0,0 +1,90 @@
+import os
+import re
+import time
+from pathlib import Path
+from typing import Container, List, Union
+
+import nonebot
+from nonebot.adapters.cqhttp.message import MessageSegment
+from nonebot.log import logger
+from nonebot.utils import run_sync
+
+from .blobs import BlobStore
+from .config import Config
+
+global_config = nonebot.get_driver().config
+plugin_config = Config(**global_config.dict())
+
+MEDIA_ROUTE = "/hxzxhelper/media"
+_DIGEST_REGEXP = re.compile(r"[0-9a-f]{64}")
+
+
+class MediaServer(object):
+    """
+    把图片写入按内容摘要命名的目录，可以选择在消息中只发送图片的引用，不把整张图片base64编码进每一帧
+
+    mode为"base64"时保持原来的做法，不要求go-cqhttp能访问bot；
+    为"file"时发送file://路径，要求go-cqhttp能以相同的路径访问媒体目录（同一台机器或共享的volume）；
+    为"http"时发送base_url下的链接（由MEDIA_ROUTE路由提供），要求go-cqhttp能访问base_url。
+    """
+
+    def __init__(self, root: Path, mode: str = "base64", base_url: str = ""):
+        self.blobs = BlobStore(root)
+        self.mode = mode
+        self.base_url = base_url.rstrip("/")
+
+    def image(self, data: Union[bytes, str, Path]) -> MessageSegment:
+        if self.mode == "base64" or not isinstance(data, bytes):
+            return MessageSegment.image(data)
+        return self.image_ref(self.blobs.put(data))
+
+    async def images(self, images: List[bytes]) -> List[MessageSegment]:
+        """
+        批量生成图片消息段，需要写入媒体缓存时在线程池中写入
+        """
+        if self.mode == "base64":
+            return [MessageSegment.image(data) for data in images]
+        return [self.image_ref(digest) for digest in await run_sync(self.blobs.put_all)(images)]
+
+    def image_ref(self, digest: str) -> MessageSegment:
+        """
+        引用已经写入媒体缓存的图片，除base64方式外不需要读取图片数据
+        """
+        path = self.blobs.path(digest)
+        if self.mode == "base64":
+            return MessageSegment.image(path.read_bytes())
+        os.utime(path)  # 刷新修改时间，仍在使用的图片不会被clean()清除
+        if self.mode == "http":
+            return MessageSegment.image(f"{self.base_url}/{digest}")
+        return MessageSegment.image(path.resolve())
+
+    def clean(self, max_age: float, keep: Container[str] = ()):
+        """
+        删除超过max_age秒没有再使用、且不在keep中的图片
+
+        :param max_age: 秒
+        :param keep: 仍被引用的图片摘要（如处理队列中mail的图片）
+        """
+        deadline = time.time() - max_age
+        removed = 0
+        for path in self.blobs.root.glob("*/*"):
+            if path.name not in keep and path.stat().st_mtime < deadline:
+                self.blobs.remove(path.name)
+                removed += 1
+        logger.info(f"已清除{removed}张过期的媒体文件")
+
+
+media = MediaServer(Path(plugin_config.data_dir) / "media", plugin_config.media_mode,
+                    plugin_config.media_base_url or f"http://{global_config.host}:{global_config.port}{MEDIA_ROUTE}")
+
+if plugin_config.media_mode == "http":
+    if not plugin_config.media_base_url:
+        logger.warning("MEDIA_MODE为http但没有设置MEDIA_BASE_URL，go-cqhttp与bot不在同一台机器上时将无法获取图片")
+    from fastapi import HTTPException
+    from fastapi.responses import FileResponse
+
+    @nonebot.get_app().get(MEDIA_ROUTE + "/{digest}")
+    async def serve_media(digest: str):
+        if not _DIGEST_REGEXP.fullmatch(digest) or not media.blobs.path(digest).exists():
+            raise HTTPException(status_code=404)
+        return FileResponse(media.blobs.path(digest))
@@ -1,75 +1,61 @@
-from io import BytesIO, BufferedIOBase
-from math import ceil
-from typing import List, Optional, Union
+from pathlib import Path
+from typing import Iterable, List, Optional
 
-import emoji
 import nonebot
-from PIL import Image, ImageFont, ImageDraw
 from nonebot.adapters.cqhttp.message import MessageSegment
 from nonebot.log import logger
-from pydantic import BaseModel
+from nonebot.utils import run_sync
+
+from src.plugins._hxzxlib.render import RenderJob, RenderService, render_preview
 
 from .config import Config
+from .media import media
+from .tracing import tracer
 
 mailcnt = 0
 global_config = nonebot.get_driver().config
 plugin_config = Config(**global_config.dict())
 
-
-def circle_corner(img: Image.Image, radii: int) -> Image.Image:
-    circle = Image.new('L', (radii * 2, radii * 2), 0)
-    draw = ImageDraw.Draw(circle)
-    draw.ellipse((0, 0, radii * 2, radii * 2), fill=255)
-    img = img.convert("RGBA")
-    w, h = img.size
-    alpha = Image.new("L", img.size, 255)
-    alpha.paste(circle.crop((0, 0, radii, radii)), (0, 0))  # 本质上是修改圆角外部的区域透明度为0，内部255
-    alpha.paste(circle.crop((radii, 0, radii * 2, radii)), (w - radii, 0))
-    alpha.paste(circle.crop((radii, radii, radii * 2, radii * 2)), (w - radii, h - radii))
-    alpha.paste(circle.crop((0, radii, radii, radii * 2)), (0, h - radii))
-    img.putalpha(alpha)
-    return img
+renderer = RenderService(max_workers=plugin_config.render_workers)
 
 
-def square_n_thumb(imglist: list, sidelength: int) -> list:
+class Mail(object):
     """
-    将图片裁减为圆角方形（转换为RGBA模式），并生成缩略图
+    处理队列中的一条内容
 
-    :param imglist: 存放图片的List
-    :param sidelength: 缩略图需要的边长
-    :text_crurn: 修改后的图片存放的List
+    图片只以摘要（image_refs）的形式引用媒体缓存中的文件；写入图片在线程池中进行，读取时传递文件路径，
+    由需要图片内容的线程或渲染进程自己读取，不在事件循环中读写图片文件
     """
-    for i in range(len(imglist)):
-        min_edge = min(imglist[i].size[0], imglist[i].size[1])
-        cut_width = (imglist[i].size[0] - min_edge) / 2
-        cut_height = (imglist[i].size[1] - min_edge) / 2
-        imglist[i] = imglist[i].crop((cut_width, cut_height,
-                                      imglist[i].size[0] - cut_width, imglist[i].size[1] - cut_height))
-        imglist[i].thumbnail((sidelength, sidelength))
-        imglist[i] = circle_corner(imglist[i], 10)
-    return imglist
-
-
-class Mail(object):
-    no: int
-    raw_text: str
-    images: Union[List[bytes], List[BufferedIOBase]]
-    translation: str
-    time: str
+    __slots__ = ("no", "raw_text", "image_refs", "translation", "time", "stat", "type", "group_id", "send_at",
+                 "pictures", "pictures_key", "trace_id")
 
     def __init__(self):
         global mailcnt
 
         self.no = mailcnt
         self.raw_text = ""
-        self.images = []
+        self.image_refs: List[str] = []
         self.translation = ""
         self.time = ""
-        self.stat = 0  # 0: 初始状态/非mail内容 1：图片载入完成，等待翻译 2：翻译载入完成，等待图片 3：等待发送 4：已发送 5：已取消
+        self.stat = 0  # 0: 初始状态/非mail内容 1：图片载入完成，等待翻译 2：翻译载入完成，等待图片 3：等待发送 4：已发送 5：已取消 6：发送失败
         self.type = ""  # "tweet" "mail"
+        self.group_id = 0  # 发送结果通知的群
+        self.send_at = 0.0  # 计划发送的时间戳，用于重启后恢复发送任务
+        self.pictures = None  # 预上传b站图片的任务（asyncio.Task），见 uploader.PictureUploader.preupload
+        self.pictures_key = ""  # 预上传时图片列表的摘要，图片变化后缓存失效
+        self.trace_id = str(self.no)  # 跟踪用的id，由推送流水线生成的mail沿用来源内容的id，见ParsedObject.trace_id
 
         mailcnt += 1
 
+    async def set_images(self, images: Iterable[bytes]):
+        self.image_refs = await run_sync(media.blobs.put_all)(list(images))
+
+    async def add_images(self, images: Iterable[bytes]):
+        self.image_refs += await run_sync(media.blobs.put_all)(list(images))
+
+    def image_paths(self) -> List[Path]:
+        return [media.blobs.path(digest) for digest in self.image_refs]
+
     def status(self) -> str:
         if self.stat == 0:
             return "非mail内容，等待发送"
@@ -83,12 +69,13 @@ class Mail(object):
             return "已发送"
         if self.stat == 5:
             return "已取消"
+        if self.stat == 6:
+            return "发送失败，重新发送翻译即可重新安排发送"
 
     def message(self):
         msg = MessageSegment.text(self.translation)
-        if self.images:
-            for image in self.images:
-                msg += MessageSegment.image(image)
+        for digest in self.image_refs:
+            msg += media.image_ref(digest)
         return msg
 
     def info(self):
@@ -100,9 +87,8 @@ class Mail(object):
             msg += MessageSegment.text(self.raw_text)
             msg += MessageSegment.text("\n*************\n")
         msg += MessageSegment.text("图片：")
-        if self.images:
-            for image in self.images:
-                msg += MessageSegment.image(image)
+        for digest in self.image_refs:
+            msg += media.image_ref(digest)
         msg += MessageSegment.text("\n")
         msg += MessageSegment.text("翻译：\n")
         if self.translation:
@@ -112,124 +98,28 @@ class Mail(object):
         msg += MessageSegment.text("状态：" + self.status())
         return msg
 
+    def render_job(self) -> RenderJob:
+        """
+        生成渲染任务，配图只传递媒体缓存中的路径，不在事件循环中读取图片
+        """
+        return RenderJob(text=self.translation, topic=plugin_config.dynamic_topic,
+                         images=tuple(str(path) for path in self.image_paths()),
+                         preset=plugin_config.preview_preset)
+
     def imgcreate(self):
-        top = Image.open("./imgsrc/top.jpg")
-        bottom = Image.open("./imgsrc/bottom.jpg")
-        background = Image.open("./imgsrc/background.jpg")
-        fnt = ImageFont.truetype("./imgsrc/font.otf", 45)
-        fnt_emoji = ImageFont.truetype("./imgsrc/font_emoji.ttf", 109, layout_engine=ImageFont.LAYOUT_RAQM)
-        width = background.size[0]
-        height_top = top.size[1]
-        height_bottom = bottom.size[1]
-        d = ImageDraw.Draw(background)
-        imgs = []
-        if self.images:
-            imgs = [Image.open(BytesIO(img)) for img in self.images]
-        s = self.translation
-
-        def emoji_repl(symbol, meta):
-            return symbol
-
-        s = emoji.replace_emoji(s, emoji_repl)
-
-        text_edited = ""
-        text_tmp = ""
-        for char in list(s.replace("\r\n", "\n").replace("　", "")):
-            text_tmp += char
-            if char == "\n":
-                text_edited += text_tmp
-                text_size = 0
-                text_tmp = ""
-            else:
-                text_size = d.textsize(text_tmp, font=fnt)[0]
-            if text_size > width - 30 * 4:
-                text_edited += text_tmp + "\n"
-                text_size = 0
-                text_tmp = ""
-        if text_tmp != "":
-            text_edited += text_tmp
-
-        font_height = d.textsize(plugin_config.dynamic_topic, font=fnt)[1]  # 设置首行话题的高度
-        height_text = (font_height + 30) * (1 + len(text_edited.split("\n")))
-        logger.debug(f"预设文字高度：{height_text}")
-        text_ground = Image.new("RGB", size=(width, height_text), color=(255, 255, 255))
-        d = ImageDraw.Draw(text_ground)
-        d.text((30, 0), plugin_config.dynamic_topic, font=fnt, fill=(17, 136, 178))  # 行距30，左边距30
-
-        width_offset, height_offset = (30, font_height + 25)
-        r = emoji.get_emoji_regexp()
-        for line in text_edited.split("\n"):
-            if not line:
-                height_offset += font_height + 30
-                width_offset = 30
-                continue
-            line_split_emj = r.split(line)
-            for text in line_split_emj:
-                if not emoji.is_emoji(text):
-                    d.text((width_offset, height_offset), text, font=fnt, fill=(0, 0, 0))
-                    width_offset += int(fnt.getlength(text))
-                else:
-                    t = Image.new("RGB", size=(150, 150), color=(255, 255, 255))  # FreeType 不可以直接设定尺寸，只能手动缩放
-                    td = ImageDraw.Draw(t)
-                    td.text((0, 20), text, font=fnt_emoji, fill=(0, 0, 0), embedded_color=True)
-                    t = t.resize((60, 60))
-                    text_ground.paste(t, (width_offset, height_offset))
-                    width_offset += 55
-            height_offset += font_height + 30
-            width_offset = 30
-        logger.debug(f"最终文字高度：{height_offset}")
-
-        height_pic = background.size[1]
-        pic_ground = background.copy().convert("RGBA")  # 没有图片的时候只粘贴一段默认空白背景
-        if imgs:
-            if len(imgs) == 1:
-                sidelen = width - 30 * 2
-                rate = sidelen / imgs[0].size[0]
-                imgs[0] = imgs[0].resize((int(rate * imgs[0].size[0]), int(rate * imgs[0].size[1])))
-                height_pic = imgs[0].size[1]
-                imgs[0] = circle_corner(imgs[0], 10)
-                pic_ground = Image.new("RGBA", size=(width, height_pic), color=(255, 255, 255))
-                pic_ground.paste(imgs[0], box=(30, 0))
-            else:
-                if len(imgs) == 2:
-                    sidelen = round((width - 30 * 2 - 15) / 2)
-                    height_pic = sidelen
-                    imgs = square_n_thumb(imgs, sidelen)
-                    pic_ground = Image.new("RGBA", size=(width, height_pic), color=(255, 255, 255))
-                    pic_ground.paste(imgs[0], box=(30, 0))
-                    pic_ground.paste(imgs[1], box=(30 + sidelen + 15, 0))
-                else:
-                    sidelen = round((width - 30 * 2 - 15 * 2) / 3)
-                    height_pic = (sidelen + 15) * ceil(len(imgs) / 3) - 15
-                    imgs = square_n_thumb(imgs, sidelen)
-                    pic_ground = Image.new("RGBA", size=(width, height_pic), color=(255, 255, 255))
-
-                    column_cursor = 0
-                    row_cursor = - (sidelen + 15)
-                    text_cnt = 1
-                    for img in imgs:
-                        if text_cnt % 3 == 1:
-                            column_cursor = 30
-                            row_cursor += sidelen + 15
-                        else:
-                            column_cursor += sidelen + 15
-                        pic_ground.paste(img, box=(column_cursor, row_cursor))
-                        text_cnt = text_cnt + 1
-                        if text_cnt > 9:
-                            break
-
-        height_total = height_top + height_text + height_pic + height_bottom
-
-        final = Image.new("RGB", (width, height_total), (255, 255, 255))  # 前面计算需要多少高度，并准备好图片的四个部分（top/text/pic/bottom）
-        final.paste(top, box=(0, 0))
-        final.paste(text_ground, box=(0, height_top))
-        final.paste(pic_ground, box=(0, height_top + height_text), mask=pic_ground.split()[3])
-        final.paste(bottom, box=(0, height_top + height_text + height_pic))
-        ret = BytesIO()
-        final.save(ret, format="jpeg")
-        return ret.getvalue()
-
-    def preview(self):
+        return render_preview(self.render_job()).data
+
+    async def preview(self):
+        """
+        在渲染进程池中生成发送预览，被同一mail更新的翻译覆盖时返回None
+        """
+        with tracer.span("render", self.trace_id, self.type or "mail", mail_no=self.no):
+            encoded = await renderer.render(self.no, self.render_job())
+        if encoded is None:
+            return None
+        logger.info(f"mail[{self.no}]：预览图编码完成，{encoded.original_bytes} -> {len(encoded.data)} bytes"
+                    f"（质量{encoded.quality}）")
+        img = encoded.data
         notes1 = "\n—————————\n" \
                  f"*如需修改请重新发送翻译，无需取消，旧翻译会被覆盖\n" \
                  f"**发送“取消发送 {self.no}”取消"
@@ -238,14 +128,33 @@ class Mail(object):
                  f"**发送“取消发送 {self.no}”取消"
         if self.stat != 0:
             # msg = "【发送预览】\n#贺喜遥香#\n" + self.message() + notes1
-            msg = "【发送预览】\n-检查翻译错误/图片缺失情况-\n" + MessageSegment.image(self.imgcreate()) + notes1
+            msg = "【发送预览】\n-检查翻译错误/图片缺失情况-\n" + media.image(img) + notes1
         else:
             # msg = "【发送预览】\n#贺喜遥香#\n" + self.message() + notes2
-            msg = "【发送预览】\n-检查翻译错误/图片缺失情况-\n" + MessageSegment.image(self.imgcreate()) + notes2
+            msg = "【发送预览】\n-检查翻译错误/图片缺失情况-\n" + media.image(img) + notes2
         return msg
 
 
-class ParsedObject(BaseModel):
-    text: str
-    images_url: List[str]
-    timestamp: Optional[str]
+class ParsedObject(object):
+    """
+    从博客、推特或Mail中解析出的一项内容
+    """
+    __slots__ = ("text", "images_url", "timestamp", "source_id")
+
+    def __init__(self, text: str, images_url: List[str], timestamp: Optional[str] = None,
+                 source_id: Optional[str] = None):
+        self.text = text
+        self.images_url = images_url
+        self.timestamp = timestamp
+        self.source_id = source_id  # 来源中的稳定id（推文id、邮件Message-ID、博客条目id），用于去重
+
+    @property
+    def trace_id(self) -> str:
+        """
+        这项内容在推送流水线和之后的渲染、发送中使用的跟踪id
+        """
+        return self.source_id or self.timestamp or ""
+
+    def __repr__(self):
+        return f"ParsedObject(text={self.text!r}, images_url={self.images_url!r}, timestamp={self.timestamp!r}, " \
+               f"source_id={self.source_id!r})"
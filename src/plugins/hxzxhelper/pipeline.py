@@ -0,0 +1,79 @@
+import asyncio
+from typing import Any, Awaitable, Callable, List, NamedTuple, Optional, Sequence
+
+from nonebot.log import logger
+
+
+class Stage(NamedTuple):
+    """
+    流水线中的一个阶段
+
+    handler处理一项数据并返回交给下一阶段的数据，返回None时该项不再继续传递
+    """
+    name: str
+    handler: Callable[[Any], Awaitable[Any]]
+    workers: int = 1
+    maxsize: int = 16  # 本阶段输入队列的容量，队列满时上一阶段等待（背压）
+
+
+class Pipeline(object):
+    """
+    由有界asyncio.Queue串联起来的多阶段流水线
+
+    每个阶段有各自的worker，各项数据独立地经过各阶段：某一项在某阶段出错只会丢弃这一项，
+    某一项处理得慢也不会阻塞已经进入后续阶段的其他数据。
+    """
+
+    def __init__(self, name: str, stages: Sequence[Stage]):
+        self.name = name
+        self.stages = list(stages)
+        self._queues: List[asyncio.Queue] = []
+        self._workers: List[asyncio.Task] = []
+
+    def start(self):
+        """
+        创建队列和worker，需要在事件循环中调用
+        """
+        if self._workers:
+            return
+        self._queues = [asyncio.Queue(maxsize=stage.maxsize) for stage in self.stages]
+        for i, stage in enumerate(self.stages):
+            for _ in range(stage.workers):
+                self._workers.append(asyncio.ensure_future(self._work(i)))
+
+    async def put(self, item: Any):
+        """
+        把一项数据送入第一个阶段，队列满时等待；流水线还没有启动时先启动
+        """
+        if not self._workers:
+            self.start()
+        await self._queues[0].put(item)
+
+    async def join(self):
+        """
+        等待已送入的数据全部处理完毕
+        """
+        for queue in self._queues:
+            await queue.join()
+
+    async def _work(self, index: int):
+        stage = self.stages[index]
+        queue = self._queues[index]
+        next_queue: Optional[asyncio.Queue] = self._queues[index + 1] if index + 1 < len(self._queues) else None
+        while True:
+            item = await queue.get()
+            try:
+                ret = await stage.handler(item)
+                if ret is not None and next_queue is not None:
+                    await next_queue.put(ret)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception(f"{self.name}流水线的{stage.name}阶段处理出错，已丢弃该项：{item!r}")
+            finally:
+                queue.task_done()
+
+    def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        self._workers = []
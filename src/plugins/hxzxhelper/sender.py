@@ -0,0 +1,148 @@
+import asyncio
+import time
+from typing import Any, Dict, List, Tuple
+
+import nonebot
+from nonebot.adapters.cqhttp.exception import ActionFailed
+from nonebot.log import logger
+
+# go-cqhttp在消息被QQ风控/频率限制拒绝（消息没有发出）时返回的(retcode, msg)，只有这类失败可以安全地重试。
+# 其他失败，尤其是NetworkError（等待响应超时，消息可能已经送达），重试可能造成重复发送，直接放弃
+RETRY_ERRORS = {(100, "SEND_MSG_API_ERROR")}
+
+
+class TokenBucket(object):
+    """
+    令牌桶：平均每秒rate个令牌，最多积攒burst个
+    """
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class GroupSender(object):
+    """
+    向go-cqhttp发送群消息的限流发送队列
+
+    每个群一个令牌桶，所有群共享并发上限；消息被限流拒绝（见RETRY_ERRORS）时按指数退避重试，其他失败不重试。
+    post()投递的内容会在群内攒linger秒，条数达到forward_batch时每forward_batch条合并为一条合并转发消息，
+    否则逐条发送。同一个群的内容按投递顺序发送。
+    """
+
+    def __init__(self, rate: float = 1, burst: int = 5, concurrency: int = 2, retries: int = 3,
+                 forward_batch: int = 0, linger: float = 2):
+        self.rate = rate
+        self.burst = burst
+        self.concurrency = concurrency
+        self.retries = retries
+        self.forward_batch = forward_batch
+        self.linger = linger
+        self._buckets: Dict[int, TokenBucket] = {}
+        self._locks: Dict[int, asyncio.Lock] = {}
+        self._semaphore = None  # 在事件循环中首次使用时创建
+        self._buffers: Dict[int, List[Tuple[List[Any], asyncio.Future]]] = {}
+        self._flushers: Dict[int, asyncio.Task] = {}
+
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        return self._semaphore
+
+    def _bucket(self, group_id: int) -> TokenBucket:
+        if group_id not in self._buckets:
+            self._buckets[group_id] = TokenBucket(self.rate, self.burst)
+        return self._buckets[group_id]
+
+    def _lock(self, group_id: int) -> asyncio.Lock:
+        if group_id not in self._locks:
+            self._locks[group_id] = asyncio.Lock()
+        return self._locks[group_id]
+
+    async def _call(self, group_id: int, api: str, **data) -> Any:
+        attempt = 0
+        while True:
+            await self._bucket(group_id).acquire()
+            try:
+                async with self.semaphore:
+                    return await nonebot.get_bot().call_api(api, group_id=group_id, **data)
+            except ActionFailed as errmsg:
+                attempt += 1
+                if (errmsg.info.get("retcode"), errmsg.info.get("msg")) not in RETRY_ERRORS or attempt > self.retries:
+                    raise
+                delay = 2 ** attempt
+                logger.warning(f"向群{group_id}发送消息失败：{errmsg!r}，{delay}秒后进行第{attempt}次重试")
+                await asyncio.sleep(delay)
+
+    async def send(self, group_id: int, message: Any) -> Any:
+        """
+        立即（经过限流后）发送一条群消息
+        """
+        return await self._call(group_id, "send_group_msg", message=message)
+
+    async def send_forward(self, group_id: int, messages: List[Any]) -> Any:
+        """
+        把多条消息合并为一条合并转发消息发送
+        """
+        bot = nonebot.get_bot()
+        nodes = [{"type": "node", "data": {"name": "推送", "uin": bot.self_id, "content": msg}} for msg in messages]
+        return await self._call(group_id, "send_group_forward_msg", messages=nodes)
+
+    def post(self, group_id: int, messages: List[Any]) -> asyncio.Future:
+        """
+        投递一条推送（可以由多条消息组成），返回的Future在这条推送发送完毕（或失败）后完成
+        """
+        future = asyncio.get_event_loop().create_future()
+        self._buffers.setdefault(group_id, []).append((messages, future))
+        if group_id not in self._flushers:
+            self._flushers[group_id] = asyncio.ensure_future(self._flush(group_id))
+        return future
+
+    async def _flush(self, group_id: int):
+        await asyncio.sleep(self.linger)
+        async with self._lock(group_id):  # 上一批还没发完时等待，保证同一个群的发送顺序
+            posts = self._buffers.pop(group_id, [])
+            del self._flushers[group_id]
+            if self.forward_batch and len(posts) >= self.forward_batch:
+                logger.info(f"群{group_id}：{len(posts)}条推送合并为转发消息发送")
+                for i in range(0, len(posts), self.forward_batch):
+                    chunk = posts[i:i + self.forward_batch]
+                    await self._deliver(chunk, self.send_forward(group_id, [msg for msgs, _ in chunk for msg in msgs]))
+            else:
+                for post in posts:
+                    await self._deliver([post], self._send_all(group_id, post[0]))
+
+    async def _send_all(self, group_id: int, messages: List[Any]):
+        for msg in messages:
+            await self.send(group_id, msg)
+
+    @staticmethod
+    async def _deliver(posts: List[Tuple[List[Any], asyncio.Future]], sending):
+        try:
+            await sending
+        except Exception as errmsg:
+            logger.exception("推送发送失败，已放弃")
+            for _, future in posts:
+                if not future.done():
+                    future.set_exception(errmsg)
+        else:
+            for _, future in posts:
+                if not future.done():
+                    future.set_result(None)
+
+    def shutdown(self):
+        for flusher in self._flushers.values():
+            flusher.cancel()
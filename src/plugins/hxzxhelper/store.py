@@ -0,0 +1,190 @@
+import sqlite3
+import time as _time
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, MutableMapping, Optional, Set
+
+from nonebot.log import logger
+
+from . import model
+from .blobs import BlobStore
+from .model import Mail
+from .timeindex import TimeIndex
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS mails (
+    time INTEGER PRIMARY KEY,
+    no INTEGER NOT NULL,
+    type TEXT NOT NULL DEFAULT '',
+    stat INTEGER NOT NULL DEFAULT 0,
+    raw_text TEXT NOT NULL DEFAULT '',
+    translation TEXT NOT NULL DEFAULT '',
+    group_id INTEGER NOT NULL DEFAULT 0,
+    send_at REAL NOT NULL DEFAULT 0,
+    trace_id TEXT NOT NULL DEFAULT ''
+);
+CREATE UNIQUE INDEX IF NOT EXISTS mails_no ON mails (no);
+CREATE TABLE IF NOT EXISTS mail_images (
+    time INTEGER NOT NULL,
+    idx INTEGER NOT NULL,
+    digest TEXT NOT NULL,
+    PRIMARY KEY (time, idx)
+);
+CREATE INDEX IF NOT EXISTS mail_images_digest ON mail_images (digest);
+"""
+
+
+class MailStore(MutableMapping[str, Mail]):
+    """
+    持久化的待处理队列，用法与原来的 {时间戳字符串: Mail} 字典相同
+
+    数据保存在SQLite（WAL模式）中，时间戳为主键，mail编号有唯一索引；图片只保存在媒体缓存（BlobStore）中的摘要，
+    不再被引用的图片文件由 MediaServer.clean(keep=image_refs()) 清除。
+    内存中保留一份按时间戳和编号索引的副本用于读取，修改Mail的属性后需要调用save()写回。
+    """
+
+    def __init__(self, data_dir: str, blobs: BlobStore):
+        root = Path(data_dir)
+        root.mkdir(parents=True, exist_ok=True)
+        self.blobs = blobs
+        self.conn = sqlite3.connect(str(root / "mails.db"), check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(_SCHEMA)
+        self._mails: Dict[str, Mail] = {}
+        self._by_no: Dict[int, str] = {}
+        self._index = TimeIndex()  # 有序的时间戳，用于按时间模糊匹配
+        self._load()
+
+    def _load(self):
+        images: Dict[int, List[str]] = {}
+        for time, digest in self.conn.execute("SELECT time, digest FROM mail_images ORDER BY time, idx"):
+            images.setdefault(time, []).append(digest)
+        for row in self.conn.execute("SELECT time, no, type, stat, raw_text, translation, group_id, send_at, trace_id "
+                                     "FROM mails ORDER BY time"):
+            mail = Mail()
+            (time, mail.no, mail.type, mail.stat, mail.raw_text, mail.translation, mail.group_id, mail.send_at,
+             trace_id) = row
+            mail.time = str(time)
+            mail.trace_id = trace_id or str(mail.no)
+            mail.image_refs = images.get(time, [])
+            if not all(self.blobs.path(digest).exists() for digest in mail.image_refs):
+                logger.error(f"mail[{mail.no}]：图片文件缺失，已忽略该mail的图片")
+                mail.image_refs = []
+            self._mails[mail.time] = mail
+            self._by_no[mail.no] = mail.time
+            self._index.add(time)
+        if self._by_no:
+            model.mailcnt = max(model.mailcnt, max(self._by_no) + 1)  # 重启后编号接着之前的继续
+        logger.info(f"已从持久化队列恢复{len(self._mails)}条内容")
+
+    def save(self, mail: Mail):
+        """
+        写入（或覆盖）一条mail及其图片
+        """
+        old = self._mails.get(mail.time)
+        if old is not None and old is not mail:
+            self._by_no.pop(old.no, None)
+        self._mails[mail.time] = mail
+        self._by_no[mail.no] = mail.time
+        self._index.add(int(mail.time))
+        with self.conn:
+            self.conn.execute("BEGIN")
+            self.conn.execute("DELETE FROM mails WHERE no = ? AND time != ?", (mail.no, int(mail.time)))
+            self.conn.execute("INSERT OR REPLACE INTO mails "
+                              "(time, no, type, stat, raw_text, translation, group_id, send_at, trace_id) "
+                              "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                              (int(mail.time), mail.no, mail.type, mail.stat, mail.raw_text, mail.translation,
+                               mail.group_id, mail.send_at, mail.trace_id))
+            self._replace_images(int(mail.time), mail.image_refs)
+
+    def _replace_images(self, time: int, digests: List[str]):
+        self.conn.execute("DELETE FROM mail_images WHERE time = ?", (time,))
+        self.conn.executemany("INSERT INTO mail_images (time, idx, digest) VALUES (?, ?, ?)",
+                              [(time, idx, digest) for idx, digest in enumerate(digests)])
+
+    def image_refs(self) -> Set[str]:
+        """
+        队列中的mail仍在引用的全部图片摘要
+        """
+        return {row[0] for row in self.conn.execute("SELECT DISTINCT digest FROM mail_images")}
+
+    def release_images(self, mail: Mail):
+        """
+        清空mail的图片并写回，同时删除不再被队列中其他mail引用的图片文件（mail已发送或已取消时调用）
+
+        其余没有被及时删除的图片由 MediaServer.clean 按修改时间清除
+        """
+        digests = set(mail.image_refs)
+        mail.image_refs = []
+        self.save(mail)
+        for digest in digests - self.image_refs():
+            self.blobs.remove(digest)
+
+    def get_by_no(self, no: int) -> Optional[Mail]:
+        time = self._by_no.get(no)
+        return self._mails.get(time) if time is not None else None
+
+    def match(self, time: str, tolerance: int = 0, offsets: Iterable[int] = (0,)) -> Optional[Mail]:
+        """
+        按时间匹配mail：先加上各个偏移量（秒），再取相差不超过tolerance秒的最接近的一条
+
+        :param time: 时间戳字符串
+        :param tolerance: 允许的误差（秒）
+        :param offsets: 依次尝试的偏移量（秒），用于兼容时区不同的时间
+        """
+        ret = self._index.match(int(time), tolerance, offsets)
+        return self._mails.get(str(ret)) if ret is not None else None
+
+    def expire(self, max_age: float) -> List[Mail]:
+        """
+        移除时间戳早于max_age秒之前的mail，只访问有序索引开头的过期部分；
+        等待发送的mail（stat 3）仍有计划中的发送任务，发送或取消后才会被移除
+
+        :return: 被移除的mail
+        """
+        expired = self._index.before(int(_time.time() - max_age))
+        return [self.pop(str(timestamp)) for timestamp in expired if self._mails[str(timestamp)].stat != 3]
+
+    def stats(self) -> Dict[str, int]:
+        """
+        队列长度、队列中的mail在内存中保存的文字字节数，以及所引用图片在磁盘上的字节数（图片不常驻内存）
+        """
+        refs = [digest for mail in self._mails.values() for digest in mail.image_refs]
+        return {
+            "mails": len(self._mails),
+            "images": len(refs),
+            "bytes": sum(len(mail.raw_text.encode()) + len(mail.translation.encode()) for mail in self._mails.values()),
+            "image_bytes": sum(self.blobs.path(digest).stat().st_size for digest in set(refs)
+                               if self.blobs.path(digest).exists()),
+        }
+
+    def copy(self) -> Dict[str, Mail]:
+        return dict(self._mails)
+
+    def __getitem__(self, time: str) -> Mail:
+        return self._mails[time]
+
+    def __setitem__(self, time: str, mail: Mail):
+        mail.time = time
+        self.save(mail)
+
+    def __delitem__(self, time: str):
+        mail = self._mails.pop(time)
+        self._by_no.pop(mail.no, None)
+        self._index.remove(int(time))
+        with self.conn:
+            self.conn.execute("BEGIN")
+            self.conn.execute("DELETE FROM mails WHERE time = ?", (int(time),))
+            self._replace_images(int(time), [])
+
+    def __contains__(self, time) -> bool:
+        return time in self._mails
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._mails)
+
+    def __len__(self) -> int:
+        return len(self._mails)
+
+    def close(self):
+        self.conn.close()
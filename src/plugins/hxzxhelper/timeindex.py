@@ -0,0 +1,78 @@
+import datetime
+import re
+from bisect import bisect_left, insort
+from typing import Iterable, List, Optional
+
+# 日期和时刻分别查找，与先后顺序、中间隔着的文字无关
+# 例：“时间：2021年8月5日（木） 12:30”、“时间 2021年08月05日 12：30：05”、“12:30 2021年8月5日”
+DATE_REGEXP = re.compile(r"(\d{4})年\s*(\d{1,2})月\s*(\d{1,2})日")
+CLOCK_REGEXP = re.compile(r"(\d{1,2})[:：](\d{1,2})(?:[:：](\d{1,2}))?")
+
+
+def parse_time(timestr: str) -> str:
+    """
+    从“时间…”行中解析出时间戳字符串
+
+    :param timestr: 包含年月日时分（秒可选）的文字
+    :return: 时间戳字符串，与mails_dict的键格式相同
+    """
+    date = DATE_REGEXP.search(timestr)
+    clock = CLOCK_REGEXP.search(timestr)
+    if not date or not clock:
+        raise ValueError("导入时间信息出错：年月日时分信息可能存在缺失")
+    year, month, day = (int(x) for x in date.groups())
+    hour, minute, second = (int(x) if x else 0 for x in clock.groups())
+    tm = datetime.datetime(year=year, month=month, day=day, hour=hour, minute=minute, second=second)
+    return str(int(tm.timestamp()))
+
+
+class TimeIndex(object):
+    """
+    有序的时间戳索引，用于按“最接近且在容差内”的规则匹配时间
+    """
+
+    def __init__(self, timestamps: Iterable[int] = ()):
+        self._keys: List[int] = sorted(set(timestamps))
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, timestamp: int) -> bool:
+        i = bisect_left(self._keys, timestamp)
+        return i < len(self._keys) and self._keys[i] == timestamp
+
+    def add(self, timestamp: int):
+        if timestamp not in self:
+            insort(self._keys, timestamp)
+
+    def remove(self, timestamp: int):
+        i = bisect_left(self._keys, timestamp)
+        if i < len(self._keys) and self._keys[i] == timestamp:
+            del self._keys[i]
+
+    def before(self, timestamp: int) -> List[int]:
+        """
+        返回所有早于timestamp的时间戳（从早到晚）
+        """
+        return self._keys[:bisect_left(self._keys, timestamp)]
+
+    def nearest(self, timestamp: int, tolerance: int) -> Optional[int]:
+        """
+        返回与timestamp相差不超过tolerance秒的最接近的时间戳，距离相同时取较早的一个
+        """
+        i = bisect_left(self._keys, timestamp)
+        candidates = self._keys[max(i - 1, 0):i + 1]
+        if not candidates:
+            return None
+        ret = min(candidates, key=lambda key: abs(key - timestamp))
+        return ret if abs(ret - timestamp) <= tolerance else None
+
+    def match(self, timestamp: int, tolerance: int, offsets: Iterable[int] = (0,)) -> Optional[int]:
+        """
+        依次尝试timestamp加上各个偏移量（如时区差）后的最近匹配，返回第一个匹配到的时间戳
+        """
+        for offset in offsets:
+            ret = self.nearest(timestamp + offset, tolerance)
+            if ret is not None:
+                return ret
+        return None
@@ -0,0 +1,129 @@
+import hashlib
+import json
+import os
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Deque, Dict, Iterator, List, NamedTuple, Optional
+
+import nonebot
+from nonebot.log import logger
+from nonebot.utils import run_sync
+
+from .config import Config
+
+global_config = nonebot.get_driver().config
+plugin_config = Config(**global_config.dict())
+
+
+EXPORT_INTERVAL = 5  # 秒，导出文件的写入间隔
+
+
+class Span(NamedTuple):
+    name: str  # 阶段名，如"poll" "download" "render"
+    item_id: str  # 同一项内容的各个阶段使用同一个id（来源中的稳定id，见Mail.trace_id）
+    source: str  # "blog" "tweet" "mail"
+    start_ns: int  # 开始时间（Unix纳秒）
+    duration: float  # 秒
+    error: Optional[str] = None
+    attrs: Optional[Dict[str, str]] = None
+
+
+class Tracer(object):
+    """
+    记录每项内容从检查更新到发送各阶段的耗时
+
+    最近的maxlen个span保存在环形缓冲区中，用于按阶段统计p50/p95；
+    设置了export_path时，span还会先暂存起来，由flush()定期在线程池中批量追加写入该文件
+    （OTLP-JSON，每行一个包含这一批span的ExportTraceServiceRequest），不在事件循环中写文件。
+    """
+
+    def __init__(self, maxlen: int = 2000, export_path: str = ""):
+        self.spans: Deque[Span] = deque(maxlen=maxlen)
+        self.export_path = export_path
+        self._unexported: Deque[Span] = deque(maxlen=maxlen)  # 导出跟不上时丢弃最旧的span
+
+    @contextmanager
+    def span(self, name: str, item_id, source: str, **attrs) -> Iterator[None]:
+        start_ns = time.time_ns()
+        start = time.perf_counter()
+        error = None
+        try:
+            yield
+        except BaseException as errmsg:
+            error = repr(errmsg)
+            raise
+        finally:
+            self.record(Span(name, str(item_id), source, start_ns, time.perf_counter() - start, error,
+                             {key: str(value) for key, value in attrs.items()} or None))
+
+    def record(self, span: Span):
+        self.spans.append(span)
+        if self.export_path:
+            self._unexported.append(span)
+
+    async def flush(self):
+        """
+        把暂存的span写入导出文件
+        """
+        if not self._unexported:
+            return
+        batch = list(self._unexported)
+        self._unexported.clear()
+        await run_sync(self._export)(batch)
+
+    def _export(self, batch: List[Span]):
+        try:
+            with open(self.export_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(_to_otlp(batch), ensure_ascii=False) + "\n")
+        except OSError:
+            logger.exception(f"导出span失败，已丢弃{len(batch)}个span")
+
+    def summary(self) -> str:
+        stages: Dict[str, List[float]] = {}
+        errors: Dict[str, int] = {}
+        for span in self.spans:
+            stages.setdefault(span.name, []).append(span.duration)
+            if span.error:
+                errors[span.name] = errors.get(span.name, 0) + 1
+        if not stages:
+            return "暂无性能数据"
+        lines = [f"最近{len(self.spans)}个span（单位：毫秒）"]
+        for name, durations in sorted(stages.items()):
+            durations.sort()
+            lines.append(f"{name}：{len(durations)}次，p50 {_percentile(durations, 0.5) * 1000:.0f}，"
+                         f"p95 {_percentile(durations, 0.95) * 1000:.0f}，失败{errors.get(name, 0)}次")
+        return "\n".join(lines)
+
+
+def _percentile(sorted_values: List[float], q: float) -> float:
+    return sorted_values[round((len(sorted_values) - 1) * q)]
+
+
+def _otlp_span(span: Span) -> dict:
+    # 同一项内容的span属于同一个trace
+    trace_id = hashlib.blake2b(f"{span.source}:{span.item_id}".encode(), digest_size=16).hexdigest()
+    attrs = {"item.id": span.item_id, "item.source": span.source, **(span.attrs or {})}
+    return {
+        "traceId": trace_id,
+        "spanId": os.urandom(8).hex(),
+        "name": span.name,
+        "kind": 1,
+        "startTimeUnixNano": str(span.start_ns),
+        "endTimeUnixNano": str(span.start_ns + int(span.duration * 1e9)),
+        "attributes": [{"key": key, "value": {"stringValue": value}} for key, value in attrs.items()],
+        "status": {"code": 2, "message": span.error} if span.error else {"code": 1},
+    }
+
+
+def _to_otlp(spans: List[Span]) -> dict:
+    return {"resourceSpans": [{
+        "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": "hxzxhelper"}}]},
+        "scopeSpans": [{
+            "scope": {"name": "hxzxhelper.tracing"},
+            "spans": [_otlp_span(span) for span in spans],
+        }],
+    }]}
+
+
+tracer = Tracer(plugin_config.trace_buffer, plugin_config.trace_export)
@@ -0,0 +1,80 @@
+import asyncio
+import time
+from typing import Dict
+
+import nonebot
+from aiohttp import ClientError
+from bilibili_api import dynamic
+from bilibili_api.exceptions import NetworkException, ResponseCodeException
+from nonebot.log import logger
+
+from .model import Mail
+
+_RETRY_EXCEPTIONS = (ClientError, asyncio.TimeoutError, NetworkException, ResponseCodeException)
+
+
+class DynamicTracker(object):
+    """
+    在后台跟踪已发出的b站动态的状态，可以同时跟踪多条动态
+
+    每条动态按指数退避（first_delay, first_delay * 2, ... 最多max_delay秒）查询，查询成功即视为已发布；
+    超过deadline秒仍未查询成功时按“状态未知”处理。结果发送到通知群，并计入stats。
+    """
+
+    def __init__(self, deadline: float = 600, first_delay: float = 5, max_delay: float = 60):
+        self.deadline = deadline
+        self.first_delay = first_delay
+        self.max_delay = max_delay
+        self.stats = {"published": 0, "unknown": 0}
+        self._tasks: Dict[int, asyncio.Task] = {}  # {动态id: 跟踪任务}
+
+    @property
+    def watching(self) -> int:
+        return len(self._tasks)
+
+    def watch(self, mail: Mail, dyn_id: int, group_id: int):
+        """
+        开始跟踪一条动态，立即返回
+        """
+        task = asyncio.ensure_future(self._track(mail, dyn_id, group_id))
+        self._tasks[dyn_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(dyn_id, None))
+
+    async def _track(self, mail: Mail, dyn_id: int, group_id: int):
+        start = time.monotonic()
+        delay = self.first_delay
+        attempt = 0
+        while True:
+            await asyncio.sleep(delay)
+            attempt += 1
+            try:
+                rsps = await dynamic.Dynamic(dyn_id).get_info()
+                logger.info(f"发送动态结果查询：{rsps}")
+                self.stats["published"] += 1
+                logger.info(f"{mail.no}：发送成功（b站已发），共查询{attempt}次，"
+                            f"用时{time.monotonic() - start:.1f}秒")
+                await self._report(group_id, f"编号{mail.no}：b站已发")
+                return
+            except _RETRY_EXCEPTIONS as errmsg:
+                delay = min(delay * 2, self.max_delay)
+                if time.monotonic() - start + delay > self.deadline:
+                    break
+                logger.warning(f"检查动态{dyn_id}发送状态出错：{errmsg!r}，{delay}秒后第{attempt + 1}次查询...")
+        self.stats["unknown"] += 1
+        logger.error(f"mail[{mail.no}]：{self.deadline}秒内未能确认动态{dyn_id}的状态，放弃状态检查")
+        await self._report(group_id, f"编号{mail.no}：发送完毕（状态未知）")
+
+    @staticmethod
+    async def _report(group_id: int, message: str):
+        try:
+            await nonebot.get_bot().send_group_msg(group_id=group_id, message=message)
+        except Exception:
+            logger.exception(f"发送动态状态通知失败：{message}")
+
+    def summary(self) -> str:
+        return (f"动态状态跟踪：已确认{self.stats['published']}条，状态未知{self.stats['unknown']}条，"
+                f"正在跟踪{self.watching}条")
+
+    def shutdown(self):
+        for task in list(self._tasks.values()):
+            task.cancel()
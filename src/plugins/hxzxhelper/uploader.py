@@ -0,0 +1,146 @@
+import asyncio
+import hashlib
+from io import BytesIO
+from pathlib import Path
+from typing import List, Sequence, Tuple
+
+from PIL import Image
+from aiohttp import ClientError
+from bilibili_api import Credential
+from bilibili_api.exceptions import NetworkException
+from bilibili_api.utils.picture import Picture
+from nonebot.log import logger
+from nonebot.utils import run_sync
+
+from src.plugins._hxzxlib.render import reencode_image
+
+from .model import Mail
+from .tracing import tracer
+
+# b站动态图片的限制：格式为jpg/png/gif，单张不超过20MB
+BILI_FORMATS = {"JPEG": "jpg", "PNG": "png", "GIF": "gif"}
+BILI_MAX_BYTES = 20 * 1024 * 1024
+RETRY_BASE_DELAY = 1  # 秒，第n次重试前等待 RETRY_BASE_DELAY * 2 ** (n - 1)
+_RETRY_EXCEPTIONS = (ClientError, asyncio.TimeoutError, NetworkException)
+
+
+def images_key(image_refs: Sequence[str]) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    for digest in image_refs:
+        h.update(digest.encode())
+    return h.hexdigest()
+
+
+def fit_bili_limits(data: bytes) -> Tuple[bytes, str]:
+    """
+    在本地检查b站的格式和大小限制，不满足时按"upload"预设重新编码，避免上传后才被服务器拒绝
+
+    :param data: 原始图片数据
+    :return: (上传用的图片数据, 格式后缀)
+    """
+    fmt = Image.open(BytesIO(data)).format
+    if fmt in BILI_FORMATS and len(data) <= BILI_MAX_BYTES:
+        return data, BILI_FORMATS[fmt]
+    encoded = reencode_image(data, "upload")
+    logger.info(f"图片不满足b站限制（{fmt}，{len(data)} bytes），已重新编码为{len(encoded.data)} bytes")
+    return encoded.data, "jpg"
+
+
+def load_for_bili(path: Path) -> Tuple[bytes, str]:
+    """
+    读取媒体缓存中的图片并检查b站的限制，在线程池中执行
+    """
+    return fit_bili_limits(path.read_bytes())
+
+
+class PictureUploader(object):
+    """
+    并发上传动态图片，同时进行的上传数不超过concurrency，返回结果与输入的图片顺序一致
+
+    单张图片因网络错误上传失败时按指数退避重试，重试次数用完后抛出最后一次的异常
+    """
+
+    def __init__(self, credential: Credential, concurrency: int = 3, retries: int = 3):
+        self.credential = credential
+        self.concurrency = concurrency
+        self.retries = retries
+        self._semaphore = None  # 在事件循环中首次使用时创建
+
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        return self._semaphore
+
+    async def upload(self, path: Path, item_id: str = "", source: str = "mail") -> Picture:
+        content, fmt = await run_sync(load_for_bili)(path)
+        attempt = 0
+        while True:
+            try:
+                async with self.semaphore:
+                    with tracer.span("bili_upload", item_id, source, bytes=len(content), attempt=attempt):
+                        return await Picture.from_content(content, fmt).upload_file(self.credential)
+            except _RETRY_EXCEPTIONS as errmsg:
+                attempt += 1
+                if attempt > self.retries:
+                    raise
+                delay = RETRY_BASE_DELAY * 2 ** (attempt - 1)
+                logger.warning(f"图片上传失败：{errmsg!r}，{delay}秒后进行第{attempt}次重试")
+                await asyncio.sleep(delay)
+
+    async def upload_all(self, paths: Sequence[Path], item_id: str = "", source: str = "mail") -> List[Picture]:
+        """
+        并发上传全部图片；任意一张失败（或本任务被取消）时取消其余仍在上传的图片，等它们结束后再抛出异常
+        """
+        tasks = [asyncio.ensure_future(self.upload(path, item_id, source)) for path in paths]
+        try:
+            return list(await asyncio.gather(*tasks))
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+
+    def preupload(self, mail: Mail) -> asyncio.Task:
+        """
+        在后台预先上传mail的图片，上传任务缓存在mail.pictures上；图片未变化时直接返回已有的任务
+
+        图片确定后（进入等待发送状态时）调用，到发送时间时只需要调用一次send_dynamic
+        """
+        key = images_key(mail.image_refs)
+        if mail.pictures is None or mail.pictures_key != key:
+            self.discard(mail)
+            mail.pictures_key = key
+            mail.pictures = asyncio.ensure_future(self.upload_all(mail.image_paths(), mail.trace_id, mail.type or "mail"))
+            mail.pictures.add_done_callback(lambda task: self._log_result(mail, task))
+            logger.info(f"mail[{mail.no}]：开始预上传{len(mail.image_refs)}张图片")
+        return mail.pictures
+
+    @staticmethod
+    def _log_result(mail: Mail, task: asyncio.Task):
+        if task.cancelled():
+            return
+        if task.exception() is not None:
+            logger.warning(f"mail[{mail.no}]：图片预上传失败，发送时会重新上传：{task.exception()!r}")
+        else:
+            logger.info(f"mail[{mail.no}]：图片预上传完成")
+
+    @staticmethod
+    def discard(mail: Mail):
+        """
+        丢弃mail上缓存的预上传结果，未完成的上传会被取消（取消发送或图片变化时调用）
+        """
+        if mail.pictures is not None and not mail.pictures.done():
+            mail.pictures.cancel()
+        mail.pictures = None
+        mail.pictures_key = ""
+
+    async def pictures(self, mail: Mail) -> List[Picture]:
+        """
+        获取mail的图片上传结果：优先使用预上传的结果，没有预上传、图片已变化或预上传失败时重新上传
+        """
+        task = self.preupload(mail)
+        if task.done() and (task.cancelled() or task.exception() is not None):
+            self.discard(mail)
+            task = self.preupload(mail)
+        return await asyncio.shield(task)
@@ -2,7 +2,7 @@ import asyncio
 import imghdr
 import random
 from io import BytesIO
-from typing import Dict, List
+from typing import Dict, List, Tuple
 
 import nonebot
 import zhconv
@@ -14,10 +14,9 @@ from nonebot.adapters.cqhttp.event import GroupMessageEvent
 from nonebot.adapters.cqhttp.message import Message, MessageSegment
 from nonebot.log import logger
 from nonebot.typing import T_State
-from nonebot.utils import run_sync
 
-from .config import Config
-from .data_source import SQLServer
+from .config import Config, SQLConfig
+from .data_source import AsyncSQLServer, SQLServer
 from .model import Question, QuestionType, QuestionGroup
 
 global_config = nonebot.get_driver().config
@@ -25,13 +24,29 @@ plugin_config = Config(**global_config.dict())
 QNATIMEOUT = plugin_config.qna_timeout
 SUPERGROUPS = plugin_config.qna_supergroups
 SKIP_POSSIBILITY = plugin_config.qna_skip_possibility
+MAX_RANDOM_ATTEMPTS = 100  # 随机抽题的最多次数，题库中的题目都被报错或跳过时不再继续抽题
 
 groups_in_qna: List[int] = []
 qnadict: Dict[int, Question] = {}  # {int(group_id): question}
+qnabase: Dict[int, Tuple[int, int]] = {}  # {int(group_id): 出题时的(countright, counttotal)}，用于计算作答记录的增量
 lastqnaid: int = 0
 
-sql = SQLServer()
+sql = AsyncSQLServer(SQLServer(), SQLConfig(**global_config.dict()).sql_poolsize)
 scheduler = nonebot.require("nonebot_plugin_apscheduler").scheduler
+driver = nonebot.get_driver()
+
+
+@driver.on_shutdown
+async def shutdown():
+    sql.close()
+
+
+@scheduler.scheduled_job("interval", id="refresh_questions", seconds=plugin_config.qna_cacherefresh)
+async def refreshquestions():
+    try:
+        await sql.refresh_cache()
+    except (IndexError, MySQLError) as errmsg:
+        logger.error(f"同步题库缓存失败：{errmsg}")
 
 
 async def checkifgroupinqna(bot: Bot, event: Event, state: T_State):
@@ -77,7 +92,7 @@ async def qnastart(bot: Bot, event: Event, state: T_State):
             question = None
 
             try:
-                userdata = sql.get_user_info(requester)
+                userdata = await sql.get_user_info(requester)
                 if userdata[3]:
                     for typ in userdata[3].split("|"):
                         skiptype.append(int(typ))
@@ -89,36 +104,39 @@ async def qnastart(bot: Bot, event: Event, state: T_State):
                     if args.isdecimal():
                         requid = int(args)
                         logger.info(f"指定题号模式，题号: {requid}")
-                        question = sql.query(requid)
+                        question = sql.cached_question(requid)
                     else:
                         raise IndexError
-                except MySQLError as errmsg:
-                    await qna_start.finish(str(errmsg))
                 except IndexError:
                     logger.error("题目不存在或序号形式不合法")
                     await qna_start.finish("题目不存在或序号形式不合法")
                     return -1
             else:
-                while True:
+                for _ in range(MAX_RANDOM_ATTEMPTS):  # 只读取题库缓存，重新抽题不需要访问数据库
+                    randid = sql.get_latest_question_id()
+                    if randid == -1 or random.randint(1, 100) >= 80:
+                        try:
+                            randid = sql.random_question_id()
+                        except IndexError as errmsg:
+                            await qna_start.finish(str(errmsg))
+                    logger.info(f"随机题号模式，题号: {randid}")
                     try:
-                        randid = sql.get_latest_question_id()
-                        if randid == -1 or random.randint(1, 100) >= 80:
-                            randid = random.randint(1, sql.totl)
-                        logger.info(f"随机题号模式，题号: {randid}")
-                        question = sql.query(randid)
-                        if question.if_err:
-                            continue
-                        if question.typ in skiptype and random.randint(1, 100) <= SKIP_POSSIBILITY:
-                            continue
-                        break
-                    except MySQLError as errmsg:
-                        await qna_start.finish(str(errmsg))
+                        question = sql.cached_question(randid)
                     except IndexError:
                         continue
+                    if question.if_err:
+                        continue
+                    if question.typ in skiptype and random.randint(1, 100) <= SKIP_POSSIBILITY:
+                        continue
+                    break
+                else:
+                    logger.error(f"随机抽题{MAX_RANDOM_ATTEMPTS}次都没有抽到可以出的题目")
+                    await qna_start.finish("没有抽到可以出的题目，题库中的题目可能都已被报错或跳过")
 
-            logger.info(f"数据库返回题目信息: {question}")
+            logger.info(f"题目信息: {question}")
             groups_in_qna.append(group_id)
             qnadict.update({group_id: question})
+            qnabase[group_id] = (question.countright, question.counttotal)
             scheduler.add_job(qnatimout, args=[group_id, event], trigger="interval", seconds=QNATIMEOUT,
                               id=f"{group_id}")
 
@@ -143,7 +161,7 @@ async def qnatimout(group_id: int, event: GroupMessageEvent):
     logger.info(f"群({event.group_id})的问答已超时")
     question_temp = qnadict[event.group_id]
     await asyncio.gather(
-        qnadataupdate(question_temp),
+        qnadataupdate(question_temp, qnabase.pop(group_id)),
         qnaclear(group_id),
     )
     bot = nonebot.get_bot(str(event.self_id))
@@ -194,9 +212,14 @@ async def qnacomplete(bot: Bot, event: Event):
             await asyncio.gather(
                 bot.send(event, "回答正确！", at_sender=True),
                 qnaclear(group_id),
-                qnadataupdate(question_temp),
+                qnadataupdate(question_temp, qnabase.pop(group_id)),
             )
-            if question_temp.analysis is not None or question_temp.analfiles is not None:
+            if sql.has_analysis(question_temp.id):  # 题库缓存中不含解析，需要时再从数据库读取
+                try:
+                    question_temp = await sql.query(question_temp.id)
+                except (IndexError, MySQLError) as errmsg:
+                    logger.error(f"获取题目序号{question_temp.id}的解析失败：{errmsg}")
+                    return
                 await bot.send(event, question_temp.message_analysis())
 
 
@@ -207,7 +230,7 @@ async def qnacancel(bot: Bot, event: GroupMessageEvent):
         # await matchers[group_id].finish()     # 注意到所有的matcher.finish()方法会通过raise exception提前结束函数
         question_temp = qnadict[group_id]
         await asyncio.gather(
-            qnadataupdate(question_temp),
+            qnadataupdate(question_temp, qnabase.pop(group_id)),
             qnaclear(group_id),
         )
         logger.info(f"群({group_id}) 中的问答被手动取消")
@@ -224,7 +247,7 @@ async def qnaerror(bot: Bot, event: GroupMessageEvent):
         question_temp.if_err = 1
         question_temp.counttotal += 1
         await asyncio.gather(
-            qnadataupdate(question_temp),
+            qnadataupdate(question_temp, qnabase.pop(group_id)),
             qnaclear(group_id),
         )
         logger.warning(f"群({event.group_id}) 中 QQ({event.get_user_id()}) "
@@ -241,10 +264,10 @@ async def qnaclear(group_id: int):
     logger.info(f"群({group_id}) 中的问答过程数据已清除")
 
 
-@run_sync
-def qnadataupdate(question: Question):
+async def qnadataupdate(question: Question, base: Tuple[int, int]):
     try:
-        sql.edit(question.id, dict(question))
+        await sql.update_question_counter(question.id, question.countright - base[0],
+                                          question.counttotal - base[1], bool(question.if_err))
         logger.info(f"更新题目序号{question.id}的问答记录")
     except MySQLError as errmsg:
         logger.error(errmsg)
@@ -252,20 +275,15 @@ def qnadataupdate(question: Question):
         logger.error("更新题目问答记录时发现题目不存在")
 
 
-@run_sync
-def qnauserupdate(qq: int, state: bool):
-    sql.update_user_counter(qq, state)
+async def qnauserupdate(qq: int, state: bool):
+    await sql.update_user_counter(qq, state)
 
 
 @user_info.handle()
 async def userinfo(bot: Bot, event: Event):
-    @run_sync
-    def _getuserinfo(qq: str):
-        return sql.get_user_info(qq)
-
     qq = event.get_user_id()
     try:
-        ret = await _getuserinfo(qq)
+        ret = await sql.get_user_info(qq)
     except MySQLError as errmsg:
         await user_info.finish(str(errmsg))
     except IndexError:
@@ -303,7 +321,7 @@ async def userskip_main(bot: Bot, event: GroupMessageEvent, state: T_State):
     if '0' in state["skiptype"]:
         state["skiptype"] = ""
     try:
-        sql.update_user_skiptype(state["qq"], "|".join(state["skiptype"]))
+        await sql.update_user_skiptype(state["qq"], "|".join(state["skiptype"]))
         await user_skip.finish("偏好设置成功", at_sender=True)
     except MySQLError as errmsg:
         await user_skip.finish(str(errmsg))
@@ -350,7 +368,7 @@ async def questioninfo(bot: Bot, event: GroupMessageEvent):
         try:
             if args.isdecimal():
                 requid = int(args)
-                question = sql.query(requid)
+                question = await sql.query(requid)
                 await question_info.finish(question.message_all())
             else:
                 raise IndexError
@@ -448,7 +466,7 @@ async def questionadd_ans(bot: Bot, event: GroupMessageEvent, state: T_State):
                            author=state["author"],
                            sakagroup=state["sakagroup"])
     try:
-        quesid = sql.new(newquestion)
+        quesid = await sql.new(newquestion)
     except MySQLError:
         await question_add.finish("数据库出错")
     else:
@@ -490,13 +508,13 @@ async def questionadd_anal(bot: Bot, event: GroupMessageEvent, state: T_State):
     try:
         if args:
             quesid = await extract_id(args)
-            sql.query(quesid)
+            await sql.query(quesid)
             await _anal_parser(args, state)
             analdict = {
                 "analysis": state["analysis"],
                 "analfiles": state["analfiles"],
             }
-            sql.edit(quesid, analdict)
+            await sql.edit(quesid, analdict)
             logger.info(f"出题人({event.get_user_id()}) 添加/修改了题目序号{quesid}的解析")
             await question_addanal.finish(f"{quesid}题：解析修改成功")
         else:
@@ -515,12 +533,12 @@ async def questioneditans(bot: Bot, event: GroupMessageEvent, state: T_State):
     try:
         if args:
             quesid = await extract_id(args)
-            sql.query(quesid)
+            await sql.query(quesid)
             await _ans_parser(bot, event, state, content=args)
             answerdict = {
                 "answers": state["answers"],
             }
-            sql.edit(quesid, answerdict)
+            await sql.edit(quesid, answerdict)
             logger.info(f"出题人({event.get_user_id()}) 修改了题目序号{quesid}的答案")
             await question_editans.finish(f"{quesid}题：答案修改成功")
         else:
@@ -539,14 +557,14 @@ async def questionedit(bot: Bot, event: GroupMessageEvent, state: T_State):
     try:
         if args:
             quesid = await extract_id(args)
-            sql.query(quesid)
+            await sql.query(quesid)
             state["content"] = await _ques_parser(args, state)
             quesdict = {
                 "typ": state["typ"],
                 "files": state["files"],
                 "content": state["content"],
             }
-            sql.edit(quesid, quesdict)
+            await sql.edit(quesid, quesdict)
             logger.info(f"出题人({event.get_user_id()}) 修改了题目序号{quesid}的题面")
             await question_edit.finish(f"{quesid}题：题面修改成功")
         else:
@@ -565,7 +583,7 @@ async def questiondel(bot: Bot, event: GroupMessageEvent, state: T_State):
     try:
         if args:
             quesid = await extract_id(args)
-            if not (sql.remove(quesid)):
+            if not (await sql.remove(quesid)):
                 raise MySQLError("数据库错误")
             logger.warning(f"出题人({event.get_user_id()}) 删除了序号{quesid}的题目")
             await question_del.finish(f"{quesid}题：题目已经归档并移出题库")
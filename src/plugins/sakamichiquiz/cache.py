@@ -0,0 +1,87 @@
+import datetime
+import threading
+from typing import Dict, Iterable, List, Optional
+
+from .model import Question
+
+# 缓存中保存的列，不含较长的解析文字，只记录是否有解析
+_COLUMNS = "id, typ, content, files, answers, (analysis IS NOT NULL OR analfiles IS NOT NULL), " \
+           "author, countright, counttotal, sakagroup, if_err, create_time"
+CACHED_COLUMNS = _COLUMNS + ", updated_at"
+# 题库表还没有updated_at列时使用（见migrations/sakamichiquiz_0001_updated_at.sql），每次同步都重新加载整个题库
+LEGACY_CACHED_COLUMNS = _COLUMNS + ", NULL"
+
+
+class CachedQuestion(object):
+    """
+    题库缓存中的一道题，字段与CACHED_COLUMNS一一对应
+    """
+
+    __slots__ = ("id", "typ", "content", "files", "answers", "has_analysis", "author", "countright", "counttotal",
+                 "sakagroup", "if_err", "create_time", "updated_at")
+
+    def __init__(self, row: tuple):
+        for name, value in zip(self.__slots__, row):
+            setattr(self, name, value)
+        self.has_analysis = bool(self.has_analysis)
+
+    def question(self) -> Question:
+        """
+        生成出题用的Question，不含解析（需要时通过SQLServer.query获取）
+        """
+        return Question(id=self.id, typ=self.typ, content=self.content, files=self.files, answers=self.answers,
+                        author=self.author, countright=self.countright, counttotal=self.counttotal,
+                        sakagroup=self.sakagroup, if_err=self.if_err, create_time=self.create_time)
+
+
+class QuestionCache(object):
+    """
+    常驻内存的题库，{题目序号: CachedQuestion}
+
+    由SQLServer在写入数据库后同步更新（write-through），并定期按updated_at增量同步其他bot实例的修改。
+    事件循环和数据库线程池会同时访问，修改时加锁。
+    """
+
+    def __init__(self):
+        self._questions: Dict[int, CachedQuestion] = {}
+        self._lock = threading.Lock()
+        self.watermark: Optional[datetime.datetime] = None  # 已同步到的最大updated_at
+
+    def __len__(self):
+        return len(self._questions)
+
+    def __contains__(self, recordid: int) -> bool:
+        return recordid in self._questions
+
+    def get(self, recordid: int) -> Optional[CachedQuestion]:
+        return self._questions.get(recordid)
+
+    def ids(self) -> List[int]:
+        return list(self._questions)
+
+    def unanswered(self) -> List[int]:
+        return [q.id for q in list(self._questions.values()) if q.counttotal == 0]
+
+    def load(self, rows: Iterable[tuple]):
+        questions = {}
+        watermark = None
+        for row in rows:
+            q = CachedQuestion(row)
+            questions[q.id] = q
+            if q.updated_at is not None and (watermark is None or q.updated_at > watermark):
+                watermark = q.updated_at
+        with self._lock:
+            self._questions = questions
+            self.watermark = watermark
+
+    def upsert(self, rows: Iterable[tuple]):
+        with self._lock:
+            for row in rows:
+                q = CachedQuestion(row)
+                self._questions[q.id] = q
+                if q.updated_at is not None and (self.watermark is None or q.updated_at > self.watermark):
+                    self.watermark = q.updated_at
+
+    def remove(self, recordid: int):
+        with self._lock:
+            self._questions.pop(recordid, None)
@@ -12,6 +12,8 @@ class Config(BaseSettings):
     qna_supergroups: Tuple[int, ...] = ()
     # 成功跳过偏向跳过题目的概率
     qna_skip_possibility: int = 75
+    # 检查题库是否被其他bot实例修改的间隔，单位为秒
+    qna_cacherefresh: int = 60
     qna_imagecatagory: DirectoryPath = ""
     qna_musiccatagory: DirectoryPath = ""
 
@@ -25,6 +27,9 @@ class SQLConfig(BaseSettings):
     sql_database: str = ""
     sql_user: str = ""
     sql_password: SecretStr = ""
+    # 连接池大小，以及池满时等待空闲连接的秒数
+    sql_poolsize: int = 5
+    sql_pooltimeout: int = 10
 
     def sqldict(self):
         d = {
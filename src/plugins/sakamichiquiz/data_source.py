@@ -1,27 +1,76 @@
+import asyncio
+import datetime
 import random
+from concurrent.futures import ThreadPoolExecutor
 from typing import Union, Tuple, List, Optional
 
 import nonebot
 from mysql.connector import Error as MySQLError
-from mysql.connector import MySQLConnection, OperationalError
+from mysql.connector import InterfaceError, OperationalError
 from nonebot.log import logger
 
+from .cache import CACHED_COLUMNS, LEGACY_CACHED_COLUMNS, QuestionCache
 from .config import SQLConfig
 from .model import Question
+from .pool import ConnectionPool
 
 MAX_SQL_RETRY = 5
+QUESTION_COLUMNS = "id, typ, content, files, answers, analysis, analfiles, author, " \
+                   "countright, counttotal, sakagroup, if_err, create_time"
+CACHE_REFRESH_OVERLAP = 5  # 增量同步时多取回的秒数，覆盖取回时刚好尚未提交的修改
+
+
+def _check_blocking_call():
+    """
+    数据库操作会阻塞所在线程，不允许在事件循环线程中执行，应通过AsyncSQLServer调用
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return
+    raise RuntimeError("在事件循环线程中执行了阻塞的数据库操作，请改用AsyncSQLServer")
 
 
 class SQLServer(object):
     def __init__(self):
         self.lastid = 0
         self.totl = 0
-        self.conn: MySQLConnection
+        global_config = nonebot.get_driver().config
+        sql_config = SQLConfig(**global_config.dict())
+        self.pool = ConnectionPool(sql_config.sqldict(), size=sql_config.sql_poolsize,
+                                   timeout=sql_config.sql_pooltimeout, retries=MAX_SQL_RETRY)
+
+        self.cache = QuestionCache()
+        self.cached_columns = CACHED_COLUMNS
 
-        self._sql_connect()
         # self.close()    # DEBUG ONLY
+        self._check_updated_at()
+        self.load_cache()
         self.total()
 
+    def _run(self, operation, idempotent: bool = False):
+        """
+        借出一个连接执行operation(conn)
+
+        失效的空闲连接在借出时（语句发出前）已由连接池检查并替换；语句发出后连接才断开时，
+        无法确定服务器是否已经执行了该语句，只有idempotent（只读查询）的操作会换一个新连接重试一次，
+        INSERT/UPDATE不重试，避免重复插入题目或重复累加计数
+
+        MySQLError will be raised when SQL server error occurs.
+        RuntimeError will be raised when called on the event loop thread.
+        """
+        _check_blocking_call()
+        retry = 1 if idempotent else 0
+        while True:
+            try:
+                with self.pool.connection() as conn:
+                    return operation(conn)
+            except (OperationalError, InterfaceError) as errmsg:
+                if not retry:
+                    logger.error(errmsg)
+                    raise MySQLError("数据库错误")
+                retry = retry - 1
+
     def _execute(self, command: str, args: tuple):
         """
         Execute SQL command without retVal, such as INSERT, UPDATE,etc
@@ -31,22 +80,19 @@ class SQLServer(object):
         :param command: The command string specified with WHERE command.
         :return: cursor.lastrowid when available.
         """
-        while True:
-            try:
-                with self.conn.cursor() as cursor:
-                    logger.debug("执行SQL命令（无返回值）：%s，参数：%s" % (command, args))
-                    cursor.execute(command, args)
-                    self.conn.commit()
-                    if cursor.lastrowid:
-                        self.lastid = cursor.lastrowid
-                        logger.debug('末行行号：%s' % self.lastid)
-                        return self.lastid
-                return True
-            except OperationalError:
-                if self._sql_connect():
-                    continue
-                else:
-                    raise MySQLError("数据库错误")
+        def operation(conn):
+            with conn.cursor() as cursor:
+                logger.debug("执行SQL命令（无返回值）：%s，参数：%s" % (command, args))
+                cursor.execute(command, args)
+                conn.commit()
+                return cursor.lastrowid
+
+        lastrowid = self._run(operation)
+        if lastrowid:
+            self.lastid = lastrowid
+            logger.debug('末行行号：%s' % self.lastid)
+            return self.lastid
+        return True
 
     def _select(self, command: str, args: Optional[Union[Tuple, List]] = None) -> Tuple:
         """
@@ -59,20 +105,24 @@ class SQLServer(object):
         :param args: Arguments used to replace placeholders in command.
         :return: Data Tuple / False when error occurs.
         """
-        while True:
-            try:
-                with self.conn.cursor() as cursor:
-                    logger.debug("执行SQL命令（有返回值）：%s，参数：%s" % (command, args))
-                    cursor.execute(command, args)
-                    ret = cursor.fetchone()
-                if not ret:
-                    raise IndexError("数据库返回的数据为空")
-                return ret
-            except OperationalError:
-                if self._sql_connect():
-                    continue
-                else:
-                    raise MySQLError("数据库错误")
+        ret = self._select_all(command, args)  # 读完全部结果，连接归还后才能被复用
+        if not ret:
+            raise IndexError("数据库返回的数据为空")
+        return ret[0]
+
+    def _select_all(self, command: str, args: Optional[Union[Tuple, List]] = None) -> List[Tuple]:
+        """
+        Run SELECT command and get all rows.
+
+        MySQLError will be raised when SQL server error occurs.
+        """
+        def operation(conn):
+            with conn.cursor() as cursor:
+                logger.debug("执行SQL命令（有返回值）：%s，参数：%s" % (command, args))
+                cursor.execute(command, args)
+                return cursor.fetchall()
+
+        return self._run(operation, idempotent=True)
 
     def _cursor_fetchbyid(self, recordid: int):
         """
@@ -86,7 +136,7 @@ class SQLServer(object):
         """
         if not (isinstance(recordid, int)):
             raise IndexError
-        select = "SELECT * FROM questions " \
+        select = f"SELECT {QUESTION_COLUMNS} FROM questions " \
                  "WHERE id = %s"
         logger.debug("获取SQL数据（有返回值）：%s，参数：%s" % (select, recordid))
         ret = self._select(select, (recordid,))
@@ -111,29 +161,6 @@ class SQLServer(object):
         }
         return Question.parse_obj(dic)
 
-    def _sql_connect(self) -> bool:
-        """ Connect to MySQL database """
-        global_config = nonebot.get_driver().config
-        db_config = SQLConfig(**global_config.dict()).sqldict()
-        conn = None
-        retry = MAX_SQL_RETRY
-        while retry:
-            try:
-                logger.info('正在连接MySQL题库数据库...')
-                conn = MySQLConnection(**db_config)
-
-                if conn.is_connected():
-                    logger.info('成功建立与数据库的连接')
-                    self.conn = conn
-                    return True
-                else:
-                    logger.error(f'数据库连接失败，第{MAX_SQL_RETRY - retry}次重试...')
-                    retry = retry - 1
-            except MySQLError as error:
-                logger.error(error)
-            return False
-        return False
-
     def new(self, question: Question):
         insert = "INSERT INTO questions" \
                  "(typ, content, answers, files, analysis, analfiles, author, sakagroup, if_err)" \
@@ -141,6 +168,7 @@ class SQLServer(object):
         args = (int(question.typ), question.content, question.answers, question.files, question.analysis,
                 question.analfiles, question.author, int(question.sakagroup), question.if_err)
         lastid = self._execute(insert, args)
+        self._cache_rows("WHERE id = %s", (lastid,))
         return lastid
 
     def remove(self, recordid: int):
@@ -159,6 +187,7 @@ class SQLServer(object):
 
         delete = "DELETE FROM questions WHERE id = %s"
         flag2 = self._execute(delete, (recordid,))
+        self.cache.remove(recordid)
         if flag1 and flag2:
             return True
         else:
@@ -174,7 +203,7 @@ class SQLServer(object):
         :param record: Dict of keys&values need to be updated
         :return:
         """
-        old = self._cursor_fetchbyid(recordid)  # check record if exists in table.
+        self._select("SELECT id FROM questions WHERE id = %s", (recordid,))  # check record if exists in table.
         update = "UPDATE questions SET "
         keystr = ""
         args = []
@@ -191,6 +220,7 @@ class SQLServer(object):
         update = update + keystr + " WHERE id = %s"
 
         ret = self._execute(update, tuple(args))
+        self._cache_rows("WHERE id = %s", (recordid,))
         return ret
 
     def query(self, recordid: int) -> Question:
@@ -198,10 +228,69 @@ class SQLServer(object):
         question = self._parse2question(record)
         return question
 
+    def _check_updated_at(self):
+        """
+        题库缓存按updated_at增量同步修改；旧的题库表中没有该列时，每次同步都重新加载整个题库
+        """
+        if not self._select_all("SHOW COLUMNS FROM questions LIKE 'updated_at'"):
+            logger.error("题库表中没有updated_at列，题库缓存每次同步都将重新加载整个题库，"
+                         "请执行migrations/sakamichiquiz_0001_updated_at.sql添加该列")
+            self.cached_columns = LEGACY_CACHED_COLUMNS
+
+    def _cache_rows(self, where: str, args: tuple = ()):
+        self.cache.upsert(self._select_all(f"SELECT {self.cached_columns} FROM questions {where}", args))
+
+    def load_cache(self):
+        """
+        把整个题库（不含解析文字）读入缓存
+        """
+        self.cache.load(self._select_all(f"SELECT {self.cached_columns} FROM questions"))
+        logger.info(f"题库缓存已加载，共{len(self.cache)}题")
+
+    def refresh_cache(self):
+        """
+        同步其他bot实例（或直接修改数据库）造成的变化：取回updated_at晚于上次同步的题目，
+        再比较题目序号，移除已被删除的题目；缓存中缺少的题目（updated_at早于上次同步）较少见，此时重新加载整个题库
+        """
+        if self.cache.watermark is None:
+            return self.load_cache()
+        since = self.cache.watermark - datetime.timedelta(seconds=CACHE_REFRESH_OVERLAP)
+        self._cache_rows("WHERE updated_at >= %s", (since,))
+        ids = {row[0] for row in self._select_all("SELECT id FROM questions")}
+        cached = set(self.cache.ids())
+        for recordid in cached - ids:
+            self.cache.remove(recordid)
+            logger.info(f"题目序号{recordid}已被删除，已移出题库缓存")
+        if ids - cached:
+            logger.info(f"题库缓存缺少{len(ids - cached)}道题目，重新加载题库缓存")
+            self.load_cache()
+
+    def cached_question(self, recordid: int) -> Question:
+        """
+        从缓存中获取出题用的题目（不含解析），不访问数据库
+
+        IndexError will be raised when question does not exist.
+        """
+        cached = self.cache.get(recordid)
+        if cached is None:
+            raise IndexError("题目不存在")
+        return cached.question()
+
+    def has_analysis(self, recordid: int) -> bool:
+        cached = self.cache.get(recordid)
+        return cached is not None and cached.has_analysis
+
+    def random_question_id(self) -> int:
+        """
+        IndexError will be raised when question bank is empty.
+        """
+        ids = self.cache.ids()
+        if not ids:
+            raise IndexError("题库中没有题目")
+        return random.choice(ids)
+
     def close(self):
-        if self.conn is not None and self.conn.is_connected():
-            self.conn.close()
-            logger.info('与数据库的连接已断开')
+        self.pool.close()
 
     def total(self):
         """
@@ -218,6 +307,23 @@ class SQLServer(object):
         except IndexError as errmsg:
             logger.error(errmsg)
 
+    def update_question_counter(self, recordid: int, right: int, total: int, if_err: bool):
+        """
+        在数据库中累加题目的作答记录，多个bot实例同时更新同一道题时不会互相覆盖
+
+        IndexError will be raised when record does not exist.
+
+        :param right: 答对次数的增量
+        :param total: 作答次数的增量
+        :param if_err: 题目是否被报错，已被标记的题目不会取消标记
+        """
+        self._select("SELECT id FROM questions WHERE id = %s", (recordid,))  # check record if exists in table.
+        update = "UPDATE questions SET countright = countright + %s, counttotal = counttotal + %s, " \
+                 "if_err = GREATEST(if_err, %s) WHERE id = %s"
+        ret = self._execute(update, (right, total, int(if_err), recordid))
+        self._cache_rows("WHERE id = %s", (recordid,))
+        return ret
+
     def update_user_counter(self, qq: int, state: bool):
         select = f"SELECT * FROM users WHERE qq={qq}"
         try:
@@ -262,20 +368,77 @@ class SQLServer(object):
         return ret + ret2
 
     def get_latest_question_id(self):
-        select = "SELECT id from questions where counttotal=0"
-        while True:
-            try:
-                with self.conn.cursor() as cursor:
-                    cursor.execute(select)
-                    ret = cursor.fetchall()
-                if not ret:
-                    logger.info("没有尚未作答的题目了")
-                    return -1
-                rd = random.randint(0, len(ret) - 1)
-                logger.info(f"抽取未被答过的新题，题目序号：{ret[rd][0]}")
-                return ret[rd][0]
-            except OperationalError:
-                if self._sql_connect():
-                    continue
-                else:
-                    raise MySQLError("数据库错误")
+        ret = self.cache.unanswered()
+        if not ret:
+            logger.info("没有尚未作答的题目了")
+            return -1
+        rd = random.choice(ret)
+        logger.info(f"抽取未被答过的新题，题目序号：{rd}")
+        return rd
+
+
+class AsyncSQLServer(object):
+    """
+    SQLServer的异步接口：每个操作在专用线程池中执行，不阻塞事件循环
+
+    线程数与连接池大小相同，多个群的问答可以同时访问数据库。
+    """
+
+    def __init__(self, sql: SQLServer, workers: int = 5):
+        self.sql = sql
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="sakamichiquiz-sql")
+
+    @property
+    def totl(self) -> int:
+        return self.sql.totl
+
+    async def _call(self, func, *args):
+        return await asyncio.get_event_loop().run_in_executor(self._executor, func, *args)
+
+    async def new(self, question: Question):
+        return await self._call(self.sql.new, question)
+
+    async def remove(self, recordid: int):
+        return await self._call(self.sql.remove, recordid)
+
+    async def edit(self, recordid: int, record: dict):
+        return await self._call(self.sql.edit, recordid, record)
+
+    async def query(self, recordid: int) -> Question:
+        return await self._call(self.sql.query, recordid)
+
+    async def total(self):
+        return await self._call(self.sql.total)
+
+    async def update_question_counter(self, recordid: int, right: int, total: int, if_err: bool):
+        return await self._call(self.sql.update_question_counter, recordid, right, total, if_err)
+
+    async def update_user_counter(self, qq: int, state: bool):
+        return await self._call(self.sql.update_user_counter, qq, state)
+
+    async def update_user_skiptype(self, qq: str, liststr: str):
+        return await self._call(self.sql.update_user_skiptype, qq, liststr)
+
+    async def get_user_info(self, qq: str) -> tuple:
+        return await self._call(self.sql.get_user_info, qq)
+
+    async def refresh_cache(self):
+        return await self._call(self.sql.refresh_cache)
+
+    # 以下只读取题库缓存，不访问数据库，可以直接在事件循环中调用
+
+    def cached_question(self, recordid: int) -> Question:
+        return self.sql.cached_question(recordid)
+
+    def has_analysis(self, recordid: int) -> bool:
+        return self.sql.has_analysis(recordid)
+
+    def random_question_id(self) -> int:
+        return self.sql.random_question_id()
+
+    def get_latest_question_id(self):
+        return self.sql.get_latest_question_id()
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+        self.sql.close()
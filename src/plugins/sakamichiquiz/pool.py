@@ -0,0 +1,98 @@
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator
+
+from mysql.connector import Error as MySQLError
+from mysql.connector import MySQLConnection
+from nonebot.log import logger
+
+
+class ConnectionPool(object):
+    """
+    线程安全的MySQL连接池
+
+    每次操作从池中借出一个连接，用完归还；事件循环和run_sync的工作线程可以同时使用不同的连接。
+    同时借出的连接不超过size个，池满时等待timeout秒后抛出MySQLError。
+    借出空闲超过ping_interval秒的连接前先检查连接是否可用，不可用时重新连接；
+    建立连接失败时按指数退避重试retries次。
+    """
+
+    def __init__(self, db_config: dict, size: int = 5, timeout: float = 10, retries: int = 5,
+                 backoff: float = 0.5, ping_interval: float = 30):
+        self.db_config = db_config
+        self.size = size
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.ping_interval = ping_interval
+        self._idle = queue.LifoQueue()  # (连接, 归还时间)
+        self._slots = threading.BoundedSemaphore(size)
+
+    def _connect(self) -> MySQLConnection:
+        attempt = 0
+        while True:
+            try:
+                logger.info("正在连接MySQL题库数据库...")
+                conn = MySQLConnection(**self.db_config)
+                if conn.is_connected():
+                    logger.info("成功建立与数据库的连接")
+                    return conn
+                errmsg = "连接未建立"
+            except MySQLError as error:
+                errmsg = error
+            attempt += 1
+            if attempt > self.retries:
+                logger.error(f"数据库连接失败：{errmsg}")
+                raise MySQLError("数据库连接失败")
+            delay = self.backoff * 2 ** (attempt - 1)
+            logger.error(f"数据库连接失败：{errmsg}，{delay}秒后进行第{attempt}次重试...")
+            time.sleep(delay)
+
+    def _checkout(self) -> MySQLConnection:
+        while True:
+            try:
+                conn, returned_at = self._idle.get_nowait()
+            except queue.Empty:
+                return self._connect()
+            if time.monotonic() - returned_at < self.ping_interval or conn.is_connected():
+                return conn
+            logger.info("空闲的数据库连接已失效，已丢弃")
+            self._discard(conn)
+
+    @staticmethod
+    def _discard(conn: MySQLConnection):
+        try:
+            conn.close()
+        except MySQLError:
+            pass
+
+    @contextmanager
+    def connection(self) -> Iterator[MySQLConnection]:
+        """
+        借出一个连接。with块中抛出异常时丢弃该连接，否则结束未提交的事务后归还
+        """
+        if not self._slots.acquire(timeout=self.timeout):
+            raise MySQLError("数据库繁忙，请稍后再试")
+        try:
+            conn = self._checkout()
+            try:
+                yield conn
+                if conn.in_transaction:  # 只执行过SELECT的连接也要结束事务，否则下次借出时仍读到旧的快照
+                    conn.rollback()
+            except BaseException:
+                self._discard(conn)  # 连接可能已断开或停在未读完的结果上，不再复用
+                raise
+            self._idle.put((conn, time.monotonic()))
+        finally:
+            self._slots.release()
+
+    def close(self):
+        while True:
+            try:
+                conn, _ = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(conn)
+        logger.info("与数据库的连接已断开")
@@ -0,0 +1,50 @@
+"""
+hxzxhelper的时间解析与按时间匹配
+
+按文件加载timeindex.py，不经过插件包的__init__，因此不需要初始化nonebot。
+"""
+import datetime
+import importlib.util
+from pathlib import Path
+
+import pytest
+
+TIMEINDEX_PATH = Path(__file__).resolve().parent.parent / "src" / "plugins" / "hxzxhelper" / "timeindex.py"
+
+
+@pytest.fixture(scope="module")
+def timeindex():
+    spec = importlib.util.spec_from_file_location("hxzxhelper_timeindex", TIMEINDEX_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def stamp(*args) -> str:
+    return str(int(datetime.datetime(*args).timestamp()))
+
+
+@pytest.mark.parametrize("line, expected", [
+    ("时间：2021年8月5日（木） 12:30", (2021, 8, 5, 12, 30)),
+    ("时间 2021年08月05日 12：30：05", (2021, 8, 5, 12, 30, 5)),
+    ("【推特更新】时间：2021年 8月 5日 土曜日 9:05", (2021, 8, 5, 9, 5)),
+    ("时间：12:30 2021年8月5日", (2021, 8, 5, 12, 30)),  # 时刻写在日期前面
+])
+def test_parse_time(timeindex, line, expected):
+    assert timeindex.parse_time(line) == stamp(*expected)
+
+
+@pytest.mark.parametrize("line", ["时间：2021年8月5日", "时间：12:30", "时间：8月5日 12:30"])
+def test_parse_time_incomplete(timeindex, line):
+    with pytest.raises(ValueError):
+        timeindex.parse_time(line)
+
+
+def test_match_nearest_within_tolerance(timeindex):
+    index = timeindex.TimeIndex([1000, 2000, 5600])
+    assert index.match(1030, 60) == 1000
+    assert index.match(1500, 60) is None
+    assert index.match(2000 + 3600, 60, (0, -3600)) == 5600  # 不加偏移量时已经匹配到
+    assert index.match(9000, 60, (0, -3600)) is None
+    assert index.match(1500 + 3600, 60, (0, -3600)) is None
+    assert index.match(1030 + 3600, 60, (0, -3600)) == 1000
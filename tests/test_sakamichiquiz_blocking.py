@@ -0,0 +1,125 @@
+"""
+SQLServer的阻塞调用检查：在事件循环线程中直接调用时抛出RuntimeError，通过AsyncSQLServer调用时正常执行
+
+连接池换成不访问数据库的假连接池；按包路径加载插件模块，不执行插件包的__init__（不注册事件响应器）。
+"""
+import asyncio
+import importlib
+import sys
+import types
+from contextlib import contextmanager
+from pathlib import Path
+
+import nonebot
+import pytest
+from mysql.connector import OperationalError
+
+PLUGIN_PATH = Path(__file__).resolve().parent.parent / "src" / "plugins" / "sakamichiquiz"
+
+
+@pytest.fixture(scope="module")
+def data_source():
+    nonebot.init()
+    package = types.ModuleType("sakamichiquiz")
+    package.__path__ = [str(PLUGIN_PATH)]
+    sys.modules["sakamichiquiz"] = package
+    return importlib.import_module("sakamichiquiz.data_source")
+
+
+class FakeCursor(object):
+    def __init__(self, rows):
+        self.rows = rows
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, command, args=None):
+        pass
+
+    def fetchall(self):
+        return self.rows
+
+
+class FakeConnection(object):
+    def __init__(self, rows):
+        self.rows = rows
+
+    def cursor(self):
+        return FakeCursor(self.rows)
+
+    def commit(self):
+        pass
+
+
+class DroppedCursor(FakeCursor):
+    def execute(self, command, args=None):
+        raise OperationalError("Lost connection to MySQL server during query")
+
+
+class DroppedConnection(FakeConnection):
+    def cursor(self):
+        return DroppedCursor(self.rows)
+
+
+class FakePool(object):
+    def __init__(self, rows, connection_class=FakeConnection):
+        self.rows = rows
+        self.connection_class = connection_class
+        self.checkouts = 0
+
+    @contextmanager
+    def connection(self):
+        self.checkouts += 1
+        yield self.connection_class(self.rows)
+
+    def close(self):
+        pass
+
+
+def make_server(data_source, rows, connection_class=FakeConnection):
+    sql = data_source.SQLServer.__new__(data_source.SQLServer)  # 跳过__init__，不连接数据库
+    sql.lastid = 0
+    sql.totl = 0
+    sql.pool = FakePool(rows, connection_class)
+    return sql
+
+
+def test_sync_call_in_event_loop_raises(data_source):
+    sql = make_server(data_source, [(1,)])
+
+    async def main():
+        with pytest.raises(RuntimeError):
+            sql.total()
+
+    asyncio.run(main())
+    assert sql.pool.checkouts == 0  # 抛出异常前没有借出连接
+
+
+def test_async_call_runs_in_executor(data_source):
+    sql = make_server(data_source, [(3,)])
+    server = data_source.AsyncSQLServer(sql, workers=1)
+
+    async def main():
+        await server.total()
+
+    try:
+        asyncio.run(main())
+    finally:
+        server.close()
+    assert (sql.totl, sql.lastid) == (3, 3)
+    assert sql.pool.checkouts == 2
+
+
+def test_dropped_connection_retries_reads_only(data_source):
+    sql = make_server(data_source, [], DroppedConnection)
+    with pytest.raises(data_source.MySQLError):
+        sql._select_all("SELECT 1")
+    assert sql.pool.checkouts == 2  # 只读查询换新连接重试一次
+
+    sql = make_server(data_source, [], DroppedConnection)
+    with pytest.raises(data_source.MySQLError):
+        sql._execute("UPDATE questions SET counttotal = counttotal + 1 WHERE id = %s", (1,))
+    assert sql.pool.checkouts == 1  # 写操作不重发